@@ -5,6 +5,8 @@
 #include <Mouse.h>
 #include <Keyboard.h>
 #include <math.h>
+#include "pressure_logic.h"
+#include "joystick_logic.h"
 
 // --- Pin Definitions ---
 const int PRESSURE_PIN = A0;
@@ -17,12 +19,8 @@ const int JOY_Y_PIN = A2;
 byte currentMode = MODE_MOUSE;
 
 // --- State Flags ---
-bool isLeftPressed_mouse = false;
-bool isRightPressed_mouse = false;
-bool isHardSipKeyHeld_kbd = false;
-bool isSoftSipKeyHeld_kbd = false;
-bool isSoftPuffKeyHeld_kbd = false;
-bool isHardPuffKeyHeld_kbd = false;
+PressureMouse pressureMouse;       // Buttons held and scroll timing (pressure_logic.h)
+PressureKeyboard pressureKeyboard; // Pressure keys held
 int last_pressed_joy_key_index = -1;
 
 // --- Parameters (Set by the Python GUI) ---
@@ -41,6 +39,7 @@ int puffSensitivity = 100;
 
 // --- CUSTOMIZABLE KEYBOARD VARS ---
 int num_joy_sections = 8;
+JoystickSectors joystickSectors; // Boundary table for num_joy_sections and the JMT limit (joystick_logic.h)
 // *** NEW: Store two keys per sector ***
 byte joy_keybinds[16][2]; // [sector_index][key_index: 0 or 1]
 byte key_hpt = 'f';
@@ -51,9 +50,9 @@ byte key_sst = 'q';
 // --- Timing, Sampling & Calibration ---
 unsigned long sampleTimer = 0;
 const int SAMPLE_PERIOD_MS = 5;
-const int SAMPLE_LENGTH = 10;
-int pressureSamples[SAMPLE_LENGTH];
-int sampleCounter = 0;
+const int PRESSURE_REPORT_TICKS = 10; // P: telemetry once per 10 samples (50 ms)
+PressureFilter pressureFilter;       // Sliding average over the last SET_PFW samples
+int pressureReportCounter = 0;
 unsigned long inputUpdateTimer = 0;
 const int INPUT_UPDATE_PERIOD_MS = 15;
 bool calibrationModeActive = false;
@@ -61,6 +60,55 @@ unsigned long lastCalibSendTime = 0;
 int joyXCenter, joyYCenter;
 int pressureCenter;
 
+// --- Serial Commands ---
+const int COMMAND_LINE_SIZE = 256; // Longest SET_PROFILE line and its terminator
+char commandLine[COMMAND_LINE_SIZE];
+int commandLength = 0;
+bool commandOverflow = false;      // The line outgrew the buffer; it is dropped at its newline
+
+// --- Telemetry Protocol ---
+// Text lines ("P:", "JOY:", "CALIB_P:") are the default. A host that finds "BIN1" in the
+// GET_CAPS reply can switch to fixed-width little-endian frames with SET_PROTOCOL:BIN:
+//   [0xA5][type][seq][int16 value...][checksum = low byte of sum(type..last value byte)]
+// ACK/ERR/INFO messages stay text in both modes.
+#define FRAME_SYNC 0xA5
+#define FRAME_P 0x01
+#define FRAME_JOY 0x02
+#define FRAME_CALIB_P 0x03
+bool binaryTelemetry = false;
+byte telemetrySeq = 0;
+
+// --- Telemetry Streams ---
+// A host that finds "STREAM1" in the GET_CAPS reply can thin out or stop P: and JOY:
+// (CALIB_P: is only sent while it asked for calibration anyway):
+//   STREAM:<P|JOY|ALL>,ON | OFF | EVERY,<n> (every n-th report) | CHANGE,<delta>
+// CHANGE sends a report only when a value moved by more than delta since the last one
+// sent, and at least once per STREAM_KEEPALIVE_MS. Both streams start ON, so hosts that
+// never send STREAM see the same telemetry as before. With what a host does not read
+// switched off, unread telemetry cannot fill the USB buffer and hold up Mouse/Keyboard reports.
+#define STREAM_KEEPALIVE_MS 1000
+struct TelemetryStream {
+  byte every;              // Send every n-th report; 0 is off
+  bool onChange;
+  int delta;
+  byte count;              // Reports since the last one considered
+  bool primed;             // Something was sent since the last STREAM command
+  int lastA, lastB;
+  unsigned long lastSent;
+};
+#define STREAM_P 0
+#define STREAM_JOY 1
+TelemetryStream streams[2] = {{1, false, 0, 0, false, 0, 0, 0}, {1, false, 0, 0, false, 0, 0, 0}};
+
+// --- Bulk Profile ---
+// A host that finds "PROFILE1" in the GET_CAPS reply can send a whole profile as one line:
+//   SET_PROFILE:HST,NMIN,NMAX,SPT,HPT,JDZ,JMT,CSP,SAD,SIP_SENS,PUFF_SENS,KEY_HPT,KEY_SPT,KEY_HST,KEY_SST,
+//               NUM_SECTORS,<key1>,<key2> (per sector)*<Fletcher-16 of the text between ':' and '*', 4 hex digits>
+// Every field is validated before anything changes; the reply is ACK:SET_PROFILE:<checksum>.
+// GET_ALL ("ALL1" in GET_CAPS) reads the live settings back in the same format: ALL:<fields>*<checksum>.
+#define PROFILE_SCALAR_FIELDS 16
+#define PROFILE_MAX_FIELDS (PROFILE_SCALAR_FIELDS + 2 * 16)
+
 void setup() {
   Serial.begin(115200);
 
@@ -86,6 +134,9 @@ void setup() {
     joy_keybinds[i][1] = default_keys[i][1];
   }
   
+  pressureFilterInit(&pressureFilter, PRESSURE_WINDOW_DEFAULT);
+  joystickSectorsInit(&joystickSectors, num_joy_sections);
+  joystickSectorsSetThreshold(&joystickSectors, joystickMovementThreshold);
   releaseAllInputs();
   Serial.print("INFO:Calibrated Pressure Center: ");
   Serial.println(pressureCenter);
@@ -104,111 +155,89 @@ void loop() {
       } else {
         scaled_pressure = (long)raw_pressure * puffSensitivity / 100;
       }
-      Serial.print("CALIB_P:");
-      Serial.println(scaled_pressure);
+      sendPressureTelemetry(FRAME_CALIB_P, "CALIB_P:", scaled_pressure);
       lastCalibSendTime = millis();
     }
     return;
   }
 
+  // Every sample gives a new filtered pressure, so a puff is acted on within one tick
   if (millis() - sampleTimer >= SAMPLE_PERIOD_MS) {
-    samplePressure();
+    int pressure = samplePressure();
+    if (++pressureReportCounter >= PRESSURE_REPORT_TICKS) {
+      if (streamDue(STREAM_P, pressure, 0)) sendPressureTelemetry(FRAME_P, "P:", pressure);
+      pressureReportCounter = 0;
+    }
+    if (currentMode == MODE_MOUSE) processPressureMouse(pressure);
+    else if (currentMode == MODE_KEYBOARD) processPressureKeyboard(pressure);
     sampleTimer = millis();
   }
-  
-  if (currentMode == MODE_MOUSE) {
-    if (sampleCounter >= SAMPLE_LENGTH) {
-      int avgPressure = calculateAveragePressure();
-      Serial.print("P:"); Serial.println(avgPressure);
-      processPressureMouse(avgPressure);
-      sampleCounter = 0; 
-    }
-    if (millis() - inputUpdateTimer >= INPUT_UPDATE_PERIOD_MS) {
-      updateMouseJoystick();
-      inputUpdateTimer = millis();
-    }
-  } else if (currentMode == MODE_KEYBOARD) {
-    if (sampleCounter >= SAMPLE_LENGTH) {
-      int avgPressure = calculateAveragePressure();
-      Serial.print("P:"); Serial.println(avgPressure);
-      processPressureKeyboard(avgPressure);
-      sampleCounter = 0;
-    }
-    if (millis() - inputUpdateTimer >= INPUT_UPDATE_PERIOD_MS) {
-      updateKeyboardJoystick();
-      inputUpdateTimer = millis();
-    }
+
+  if (millis() - inputUpdateTimer >= INPUT_UPDATE_PERIOD_MS) {
+    if (currentMode == MODE_MOUSE) updateMouseJoystick();
+    else if (currentMode == MODE_KEYBOARD) updateKeyboardJoystick();
+    inputUpdateTimer = millis();
   }
 }
 
 // =================================================================
 // SENSOR & INPUT PROCESSING
 // =================================================================
-void samplePressure() {
-  if (sampleCounter < SAMPLE_LENGTH) {
-    int raw_centered_pressure = analogRead(PRESSURE_PIN) - pressureCenter;
-    
-    int scaled_pressure;
-    if (raw_centered_pressure < 0) {
-      scaled_pressure = (long)raw_centered_pressure * sipSensitivity / 100;
-    } else {
-      scaled_pressure = (long)raw_centered_pressure * puffSensitivity / 100;
-    }
-    
-    pressureSamples[sampleCounter] = scaled_pressure;
-    sampleCounter++;
+// Reads and scales one sample and returns the filtered pressure
+int samplePressure() {
+  int raw_centered_pressure = analogRead(PRESSURE_PIN) - pressureCenter;
+
+  int scaled_pressure;
+  if (raw_centered_pressure < 0) {
+    scaled_pressure = (long)raw_centered_pressure * sipSensitivity / 100;
+  } else {
+    scaled_pressure = (long)raw_centered_pressure * puffSensitivity / 100;
   }
+
+  return pressureFilterAdd(&pressureFilter, scaled_pressure);
 }
 
-int calculateAveragePressure() {
-  long sum = 0;
-  for (int i = 0; i < SAMPLE_LENGTH; i++) sum += pressureSamples[i];
-  return sum / SAMPLE_LENGTH;
+PressureThresholds currentThresholds() {
+  PressureThresholds t;
+  t.hardSip = hardSipThreshold; t.neutralMin = neutralMin;
+  t.softPuff = softPuffThreshold; t.hardPuff = hardPuffThreshold;
+  return t;
 }
 
 void processPressureMouse(int pressure) {
-  if (pressure >= hardPuffThreshold) { if (!isLeftPressed_mouse) { Mouse.press(MOUSE_LEFT); isLeftPressed_mouse = true; } } 
-  else { if (isLeftPressed_mouse) { Mouse.release(MOUSE_LEFT); isLeftPressed_mouse = false; } }
-  
-  if (pressure <= hardSipThreshold) { if (!isRightPressed_mouse) { Mouse.press(MOUSE_RIGHT); isRightPressed_mouse = true; } }
-  else { if (isRightPressed_mouse) { Mouse.release(MOUSE_RIGHT); isRightPressed_mouse = false; } }
-
-  if (pressure >= softPuffThreshold && pressure < hardPuffThreshold) { Mouse.move(0, 0, 1); } 
-  else if (pressure <= neutralMin && pressure > hardSipThreshold) { Mouse.move(0, 0, -1); }
+  PressureThresholds t = currentThresholds();
+  byte actions = pressureMouseStep(&pressureMouse, &t, pressure);
+  if (actions & PRESSURE_PRESS_LEFT) Mouse.press(MOUSE_LEFT);
+  if (actions & PRESSURE_RELEASE_LEFT) Mouse.release(MOUSE_LEFT);
+  if (actions & PRESSURE_PRESS_RIGHT) Mouse.press(MOUSE_RIGHT);
+  if (actions & PRESSURE_RELEASE_RIGHT) Mouse.release(MOUSE_RIGHT);
+  if (actions & PRESSURE_SCROLL_UP) Mouse.move(0, 0, 1);
+  if (actions & PRESSURE_SCROLL_DOWN) Mouse.move(0, 0, -1);
 }
 
 void processPressureKeyboard(int pressure) {
-  if (pressure >= hardPuffThreshold) { if (!isHardPuffKeyHeld_kbd) { Keyboard.press(key_hpt); isHardPuffKeyHeld_kbd = true; } } 
-  else { if (isHardPuffKeyHeld_kbd) { Keyboard.release(key_hpt); isHardPuffKeyHeld_kbd = false; } }
-  
-  if (pressure >= softPuffThreshold && pressure < hardPuffThreshold) { if (!isSoftPuffKeyHeld_kbd) { Keyboard.press(key_spt); isSoftPuffKeyHeld_kbd = true; } }
-  else { if (isSoftPuffKeyHeld_kbd) { Keyboard.release(key_spt); isSoftPuffKeyHeld_kbd = false; } }
-
-  if (pressure <= hardSipThreshold) { if (!isHardSipKeyHeld_kbd) { Keyboard.press(key_hst); isHardSipKeyHeld_kbd = true; } }
-  else { if (isHardSipKeyHeld_kbd) { Keyboard.release(key_hst); isHardSipKeyHeld_kbd = false; } }
-  
-  if (pressure <= neutralMin && pressure > hardSipThreshold) { if (!isSoftSipKeyHeld_kbd) { Keyboard.press(key_sst); isSoftSipKeyHeld_kbd = true; } }
-  else { if (isSoftSipKeyHeld_kbd) { Keyboard.release(key_sst); isSoftSipKeyHeld_kbd = false; } }
+  PressureThresholds t = currentThresholds();
+  byte changed = pressureKeyboardStep(&pressureKeyboard, &t, pressure);
+  if (!changed) return;
+  byte keys[4] = {key_hpt, key_spt, key_hst, key_sst}; // PRESSURE_KEY_* bit order
+  for (byte i = 0; i < 4; i++) {
+    byte bit = 1 << i;
+    if (!(changed & bit)) continue;
+    if (pressureKeyboard.held & bit) Keyboard.press(keys[i]);
+    else Keyboard.release(keys[i]);
+  }
 }
 
 void updateKeyboardJoystick() {
   int joyX = analogRead(JOY_X_PIN) - joyXCenter;
   int joyY = analogRead(JOY_Y_PIN) - joyYCenter;
-  Serial.print("JOY:"); Serial.print(joyX); Serial.print(","); Serial.println(joyY);
+  sendJoystickTelemetry(joyX, joyY);
 
-  float magnitude = sqrt(pow(joyX, 2) + pow(joyY, 2));
-  int current_section_index = -1;
-  
-  if ((magnitude / 512.0) * 100.0 > joystickMovementThreshold) {
-      float slice_angle = 360.0 / num_joy_sections;
-      float angle = atan2((float)-joyY, (float)joyX) * 180.0 / PI; 
-      
-      angle += slice_angle / 2.0;
-      if (angle < 0) { angle += 360.0; }
-      if (angle >= 360.0) { angle -= 360.0; }
-      
-      current_section_index = floor(angle / slice_angle);
-  }
+  // Integer lookup instead of sqrt() and atan2() in software float; the table is only
+  // rebuilt when SET_NUM_SECTORS (or SET_PROFILE) changes the sector count
+  if (joystickSectors.sections != num_joy_sections) joystickSectorsInit(&joystickSectors, num_joy_sections);
+  if (joystickSectors.threshold != joystickMovementThreshold) joystickSectorsSetThreshold(&joystickSectors, joystickMovementThreshold);
+  int current_section_index = joystickSector(&joystickSectors, joyX, joyY);
 
   if (current_section_index != last_pressed_joy_key_index) {
     // Release the previously held keys
@@ -228,7 +257,7 @@ void updateKeyboardJoystick() {
 void updateMouseJoystick() {
   int joyX = analogRead(JOY_X_PIN) - joyXCenter;
   int joyY = analogRead(JOY_Y_PIN) - joyYCenter;
-  Serial.print("JOY:"); Serial.print(joyX); Serial.print(","); Serial.println(joyY);
+  sendJoystickTelemetry(joyX, joyY);
   
   float xPercent = (float)joyX / 512.0 * 100.0;
   float yPercent = (float)joyY / 512.0 * 100.0;
@@ -246,13 +275,60 @@ void updateMouseJoystick() {
   }
 }
 
+// =================================================================
+// TELEMETRY OUTPUT
+// =================================================================
+void sendFrame(byte* frame, int len) {
+  frame[0] = FRAME_SYNC;
+  frame[2] = telemetrySeq++;
+  byte checksum = 0;
+  for (int i = 1; i < len - 1; i++) checksum += frame[i];
+  frame[len - 1] = checksum;
+  Serial.write(frame, len);
+}
+
+// Whether this report goes out, by the STREAM setting for it
+bool streamDue(byte stream, int a, int b) {
+  TelemetryStream* s = &streams[stream];
+  if (s->every == 0 || ++s->count < s->every) return false;
+  s->count = 0;
+  unsigned long now = millis();
+  if (s->onChange && s->primed && abs(a - s->lastA) <= s->delta && abs(b - s->lastB) <= s->delta
+      && now - s->lastSent < STREAM_KEEPALIVE_MS) return false;
+  s->primed = true; s->lastA = a; s->lastB = b; s->lastSent = now;
+  return true;
+}
+
+void sendPressureTelemetry(byte frameType, const char* textPrefix, int value) {
+  if (binaryTelemetry) {
+    byte frame[6];
+    frame[1] = frameType;
+    frame[3] = value & 0xFF; frame[4] = (value >> 8) & 0xFF;
+    sendFrame(frame, sizeof(frame));
+  } else {
+    Serial.print(textPrefix); Serial.println(value);
+  }
+}
+
+void sendJoystickTelemetry(int joyX, int joyY) {
+  if (!streamDue(STREAM_JOY, joyX, joyY)) return;
+  if (binaryTelemetry) {
+    byte frame[8];
+    frame[1] = FRAME_JOY;
+    frame[3] = joyX & 0xFF; frame[4] = (joyX >> 8) & 0xFF;
+    frame[5] = joyY & 0xFF; frame[6] = (joyY >> 8) & 0xFF;
+    sendFrame(frame, sizeof(frame));
+  } else {
+    Serial.print("JOY:"); Serial.print(joyX); Serial.print(","); Serial.println(joyY);
+  }
+}
+
 // =================================================================
 // SERIAL COMMANDS & STATE MANAGEMENT
 // =================================================================
 void releaseAllInputs() {
   Mouse.release(MOUSE_LEFT); Mouse.release(MOUSE_RIGHT); Keyboard.releaseAll();
-  isLeftPressed_mouse = false; isRightPressed_mouse = false;
-  isHardSipKeyHeld_kbd = false; isSoftSipKeyHeld_kbd = false; isSoftPuffKeyHeld_kbd = false; isHardPuffKeyHeld_kbd = false;
+  pressureMouseReset(&pressureMouse); pressureKeyboardReset(&pressureKeyboard);
   
   if (last_pressed_joy_key_index != -1) {
     if(joy_keybinds[last_pressed_joy_key_index][0] != ' ') Keyboard.release(joy_keybinds[last_pressed_joy_key_index][0]);
@@ -261,52 +337,245 @@ void releaseAllInputs() {
   }
 }
 
+char* trimCommand(char* line) {
+  while (isspace(*line)) line++;
+  char* end = line + strlen(line);
+  while (end > line && isspace(end[-1])) *--end = '\0';
+  return line;
+}
+
+// Collects whatever bytes have arrived into commandLine and runs a command once its newline
+// is in. Only bytes already received are read and at most one command runs per pass, so
+// loop() never waits on the serial port; nothing is allocated.
 void handleSerialCommands() {
-  if (Serial.available() > 0) {
-    String command = Serial.readStringUntil('\n'); command.trim();
-    
-    if (command.equalsIgnoreCase("SET_MODE_MOUSE")) { releaseAllInputs(); currentMode = MODE_MOUSE; Serial.println("ACK:Mode set to MOUSE"); return; }
-    if (command.equalsIgnoreCase("SET_MODE_KEYBOARD")) { releaseAllInputs(); currentMode = MODE_KEYBOARD; Serial.println("ACK:Mode set to KEYBOARD"); return; }
-    if (command.equalsIgnoreCase("START_CALIBRATION")) { releaseAllInputs(); calibrationModeActive = true; Serial.println("ACK:Calibration started"); return; }
-    if (command.equalsIgnoreCase("STOP_CALIBRATION")) { calibrationModeActive = false; Serial.println("ACK:Calibration stopped"); return; }
-
-    int colonIndex = command.indexOf(':'); if (colonIndex == -1) return;
-    String cmd_key = command.substring(0, colonIndex);
-    String cmd_val_str = command.substring(colonIndex + 1);
-    
-    // *** NEW: Command format for key combos is SET_JOY_KEY:index,key1_ascii,key2_ascii ***
-    if (cmd_key.equalsIgnoreCase("SET_JOY_KEY")) {
-      int first_comma = cmd_val_str.indexOf(',');
-      int second_comma = cmd_val_str.indexOf(',', first_comma + 1);
-      
-      if (first_comma != -1 && second_comma != -1) {
-        int index = cmd_val_str.substring(0, first_comma).toInt();
-        int ascii_val1 = cmd_val_str.substring(first_comma + 1, second_comma).toInt();
-        int ascii_val2 = cmd_val_str.substring(second_comma + 1).toInt();
-        
-        if (index >= 0 && index < 16) {
-          joy_keybinds[index][0] = (byte)ascii_val1;
-          joy_keybinds[index][1] = (byte)ascii_val2;
-        }
-      }
-    } else { // Handle all other commands
-        int val = cmd_val_str.toInt();
-        if (cmd_key.equalsIgnoreCase("SET_HST")) { hardSipThreshold = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_NMIN")) { neutralMin = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_NMAX")) { neutralMax = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_SPT")) { softPuffThreshold = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_HPT")) { hardPuffThreshold = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_JDZ")) { joystickDeadzone = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_JMT")) { joystickMovementThreshold = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_CSP")) { cursorSpeed = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_SAD")) { softActionDelay = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_SIP_SENS")) { sipSensitivity = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_PUFF_SENS")) { puffSensitivity = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_KEY_HPT")) { key_hpt = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_KEY_SPT")) { key_spt = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_KEY_HST")) { key_hst = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_KEY_SST")) { key_sst = val; }
-        else if (cmd_key.equalsIgnoreCase("SET_NUM_SECTORS")) { num_joy_sections = val; }
+  int pending = Serial.available();
+  while (pending-- > 0) {
+    char c = Serial.read();
+    if (c != '\n') {
+      if (commandLength < COMMAND_LINE_SIZE - 1) commandLine[commandLength++] = c;
+      else commandOverflow = true;
+      continue;
+    }
+    commandLine[commandLength] = '\0';
+    bool overflow = commandOverflow;
+    commandLength = 0; commandOverflow = false;
+    if (overflow) Serial.println("ERR:Line too long");
+    else runCommand(trimCommand(commandLine));
+    return;
+  }
+}
+
+bool commandNameIs(const char* name, const char* text, int length) {
+  return strncasecmp(name, text, length) == 0 && name[length] == '\0';
+}
+
+void ackCommand(const char* command) { Serial.print("ACK:"); Serial.println(command); } // Echo so the host can match replies to commands
+void rejectCommand(const char* reason, const char* command) { Serial.print(reason); Serial.println(command); }
+
+void cmdModeMouse(const char*, const char*) { releaseAllInputs(); currentMode = MODE_MOUSE; Serial.println("ACK:Mode set to MOUSE"); }
+void cmdModeKeyboard(const char*, const char*) { releaseAllInputs(); currentMode = MODE_KEYBOARD; Serial.println("ACK:Mode set to KEYBOARD"); }
+void cmdStartCalibration(const char*, const char*) { releaseAllInputs(); calibrationModeActive = true; Serial.println("ACK:Calibration started"); }
+void cmdStopCalibration(const char*, const char*) { calibrationModeActive = false; pressureFilterInit(&pressureFilter, pressureFilter.window); Serial.println("ACK:Calibration stopped"); }
+void cmdGetCaps(const char*, const char*) { Serial.println("CAPS:BIN1,PROFILE1,ALL1,PFW1,STREAM1"); }
+void cmdGetAll(const char*, const char*) { sendAllSettings(); }
+void cmdSetProfile(const char*, const char* value) { handleProfileCommand(value); }
+
+// *** NEW: Command format for key combos is SET_JOY_KEY:index,key1_ascii,key2_ascii ***
+void cmdSetJoyKey(const char* command, const char* value) {
+  const char* first_comma = strchr(value, ',');
+  const char* second_comma = first_comma ? strchr(first_comma + 1, ',') : NULL;
+  if (second_comma) {
+    int index = atol(value);
+    if (index >= 0 && index < 16) {
+      joy_keybinds[index][0] = (byte)atol(first_comma + 1);
+      joy_keybinds[index][1] = (byte)atol(second_comma + 1);
+      ackCommand(command);
+      return;
+    }
+  }
+  rejectCommand("ERR:Bad value ", command);
+}
+
+void cmdSetProtocol(const char* command, const char* value) {
+  if (strcasecmp(value, "BIN") == 0) { Serial.println("ACK:Protocol BIN"); binaryTelemetry = true; }
+  else if (strcasecmp(value, "TEXT") == 0) { binaryTelemetry = false; Serial.println("ACK:Protocol TEXT"); }
+  else rejectCommand("ERR:Bad value ", command);
+}
+
+void cmdSetPressureWindow(const char* command, const char* value) { // Pressure filter window, in samples ("PFW1" in GET_CAPS)
+  int window = atol(value);
+  if (window < 1 || window > PRESSURE_WINDOW_MAX) { rejectCommand("ERR:Bad value ", command); return; }
+  pressureFilterInit(&pressureFilter, window);
+  ackCommand(command);
+}
+
+// STREAM:<P|JOY|ALL>,<ON|OFF|EVERY,n|CHANGE,delta> (see "Telemetry Streams")
+void cmdStream(const char* command, const char* value) {
+  const char* mode = strchr(value, ',');
+  if (!mode) { rejectCommand("ERR:Bad value ", command); return; }
+  int targetLength = mode - value;
+  bool pressure = commandNameIs("P", value, targetLength) || commandNameIs("ALL", value, targetLength);
+  bool joystick = commandNameIs("JOY", value, targetLength) || commandNameIs("ALL", value, targetLength);
+  mode++;
+  const char* arg = strchr(mode, ',');
+  int modeLength = arg ? arg - mode : strlen(mode);
+  long n = arg ? atol(arg + 1) : 0;
+  TelemetryStream stream = {0, false, 0, 0, false, 0, 0, 0};
+  if (!arg && commandNameIs("ON", mode, modeLength)) stream.every = 1;
+  else if (!arg && commandNameIs("OFF", mode, modeLength)) stream.every = 0;
+  else if (arg && commandNameIs("EVERY", mode, modeLength) && n >= 1 && n <= 255) stream.every = n;
+  else if (arg && commandNameIs("CHANGE", mode, modeLength) && n >= 0 && n <= 1023) { stream.every = 1; stream.onChange = true; stream.delta = n; }
+  else pressure = joystick = false;
+  if (!pressure && !joystick) { rejectCommand("ERR:Bad value ", command); return; }
+  if (pressure) streams[STREAM_P] = stream;
+  if (joystick) streams[STREAM_JOY] = stream;
+  ackCommand(command);
+}
+
+// NAME (hasValue false) or NAME:value lines, matched without regard to case
+typedef void (*CommandHandler)(const char* command, const char* value);
+struct Command { const char* name; CommandHandler handler; bool hasValue; };
+const Command COMMANDS[] = {
+  {"SET_MODE_MOUSE", cmdModeMouse, false}, {"SET_MODE_KEYBOARD", cmdModeKeyboard, false},
+  {"START_CALIBRATION", cmdStartCalibration, false}, {"STOP_CALIBRATION", cmdStopCalibration, false},
+  {"GET_CAPS", cmdGetCaps, false}, {"GET_ALL", cmdGetAll, false},
+  {"SET_JOY_KEY", cmdSetJoyKey, true}, {"SET_PROFILE", cmdSetProfile, true},
+  {"SET_PROTOCOL", cmdSetProtocol, true}, {"SET_PFW", cmdSetPressureWindow, true},
+  {"STREAM", cmdStream, true},
+};
+
+// SET_<name>:<number> settings, stored as sent
+struct IntSetting { const char* name; int* value; };
+const IntSetting INT_SETTINGS[] = {
+  {"SET_HST", &hardSipThreshold}, {"SET_NMIN", &neutralMin}, {"SET_NMAX", &neutralMax},
+  {"SET_SPT", &softPuffThreshold}, {"SET_HPT", &hardPuffThreshold},
+  {"SET_JDZ", &joystickDeadzone}, {"SET_JMT", &joystickMovementThreshold}, {"SET_CSP", &cursorSpeed}, {"SET_SAD", &softActionDelay},
+  {"SET_SIP_SENS", &sipSensitivity}, {"SET_PUFF_SENS", &puffSensitivity}, {"SET_NUM_SECTORS", &num_joy_sections},
+};
+struct KeySetting { const char* name; byte* value; };
+const KeySetting KEY_SETTINGS[] = {
+  {"SET_KEY_HPT", &key_hpt}, {"SET_KEY_SPT", &key_spt}, {"SET_KEY_HST", &key_hst}, {"SET_KEY_SST", &key_sst},
+};
+
+void runCommand(const char* command) {
+  if (command[0] == '\0') return;
+  const char* colon = strchr(command, ':');
+  int nameLength = colon ? colon - command : strlen(command);
+  for (byte i = 0; i < sizeof(COMMANDS) / sizeof(COMMANDS[0]); i++) {
+    if (COMMANDS[i].hasValue == (colon != NULL) && commandNameIs(COMMANDS[i].name, command, nameLength)) {
+      COMMANDS[i].handler(command, colon ? colon + 1 : NULL);
+      return;
+    }
+  }
+  if (colon) {
+    long val = atol(colon + 1);
+    for (byte i = 0; i < sizeof(INT_SETTINGS) / sizeof(INT_SETTINGS[0]); i++) {
+      if (commandNameIs(INT_SETTINGS[i].name, command, nameLength)) { *INT_SETTINGS[i].value = val; ackCommand(command); return; }
     }
+    for (byte i = 0; i < sizeof(KEY_SETTINGS) / sizeof(KEY_SETTINGS[0]); i++) {
+      if (commandNameIs(KEY_SETTINGS[i].name, command, nameLength)) { *KEY_SETTINGS[i].value = val; ackCommand(command); return; }
+    }
+  }
+  rejectCommand("ERR:Unknown command ", command);
+}
+
+// =================================================================
+// BULK PROFILE
+// =================================================================
+void fletcherUpdate(uint16_t* sum1, uint16_t* sum2, const char* data, int len) {
+  for (int i = 0; i < len; i++) { *sum1 = (*sum1 + (byte)data[i]) % 255; *sum2 = (*sum2 + *sum1) % 255; }
+}
+
+uint16_t fletcher16(const char* data, int len) {
+  uint16_t sum1 = 0, sum2 = 0;
+  fletcherUpdate(&sum1, &sum2, data, len);
+  return (sum2 << 8) | sum1;
+}
+
+void printHex16(uint16_t value) {
+  const char digits[] = "0123456789ABCDEF";
+  for (int shift = 12; shift >= 0; shift -= 4) Serial.print(digits[(value >> shift) & 0x0F]);
+}
+
+void replyProfile(const char* prefix, uint16_t checksum) {
+  Serial.print(prefix); Serial.print("SET_PROFILE:"); printHex16(checksum); Serial.println();
+}
+
+// Runs from handleSerialCommands() at the top of loop(), so a profile is swapped in whole
+// between two sampling ticks and the state machines never see half of it.
+void handleProfileCommand(const char* payload) {
+  const char* star = strrchr(payload, '*');
+  if (star == NULL) { replyProfile("ERR:Bad checksum ", 0); return; }
+  uint16_t checksum = fletcher16(payload, star - payload);
+  char* end;
+  uint16_t sent_checksum = (uint16_t)strtol(star + 1, &end, 16);
+  if (end == star + 1 || sent_checksum != checksum) { replyProfile("ERR:Bad checksum ", sent_checksum); return; }
+
+  long fields[PROFILE_MAX_FIELDS];
+  int count = 0;
+  const char* p = payload;
+  while (true) {
+    if (count == PROFILE_MAX_FIELDS) { replyProfile("ERR:Bad value ", checksum); return; }
+    fields[count++] = strtol(p, &end, 10);
+    if (end == p) { replyProfile("ERR:Bad value ", checksum); return; }
+    if (end == star) break;
+    if (*end != ',') { replyProfile("ERR:Bad value ", checksum); return; }
+    p = end + 1;
+  }
+  long sectors = count >= PROFILE_SCALAR_FIELDS ? fields[PROFILE_SCALAR_FIELDS - 1] : 0;
+  if (sectors < 1 || sectors > 16 || count != PROFILE_SCALAR_FIELDS + 2 * sectors) { replyProfile("ERR:Bad value ", checksum); return; }
+  for (int i = PROFILE_SCALAR_FIELDS - 5; i < count; i++) {
+    if (i == PROFILE_SCALAR_FIELDS - 1) continue; // NUM_SECTORS, checked above
+    if (fields[i] < 0 || fields[i] > 255) { replyProfile("ERR:Bad value ", checksum); return; }
+  }
+
+  applyProfileFields(fields);
+  replyProfile("ACK:", checksum);
+}
+
+void applyProfileFields(const long* fields) {
+  int sectors = fields[PROFILE_SCALAR_FIELDS - 1];
+  releaseAllInputs(); // Keys may be rebound under a held key
+  hardSipThreshold = fields[0]; neutralMin = fields[1]; neutralMax = fields[2];
+  softPuffThreshold = fields[3]; hardPuffThreshold = fields[4];
+  joystickDeadzone = fields[5]; joystickMovementThreshold = fields[6]; cursorSpeed = fields[7]; softActionDelay = fields[8];
+  sipSensitivity = fields[9]; puffSensitivity = fields[10];
+  key_hpt = fields[11]; key_spt = fields[12]; key_hst = fields[13]; key_sst = fields[14];
+  num_joy_sections = sectors;
+  for (int i = 0; i < sectors; i++) {
+    joy_keybinds[i][0] = (byte)fields[PROFILE_SCALAR_FIELDS + 2 * i];
+    joy_keybinds[i][1] = (byte)fields[PROFILE_SCALAR_FIELDS + 2 * i + 1];
+  }
+}
+
+int collectProfileFields(long* fields) {
+  fields[0] = hardSipThreshold; fields[1] = neutralMin; fields[2] = neutralMax;
+  fields[3] = softPuffThreshold; fields[4] = hardPuffThreshold;
+  fields[5] = joystickDeadzone; fields[6] = joystickMovementThreshold; fields[7] = cursorSpeed; fields[8] = softActionDelay;
+  fields[9] = sipSensitivity; fields[10] = puffSensitivity;
+  fields[11] = key_hpt; fields[12] = key_spt; fields[13] = key_hst; fields[14] = key_sst;
+  int sectors = constrain(num_joy_sections, 1, 16);
+  fields[15] = sectors;
+  for (int i = 0; i < sectors; i++) {
+    fields[PROFILE_SCALAR_FIELDS + 2 * i] = joy_keybinds[i][0];
+    fields[PROFILE_SCALAR_FIELDS + 2 * i + 1] = joy_keybinds[i][1];
+  }
+  return PROFILE_SCALAR_FIELDS + 2 * sectors;
+}
+
+// Printed field by field with a running checksum, so no line buffer is needed
+void sendAllSettings() {
+  long fields[PROFILE_MAX_FIELDS];
+  int count = collectProfileFields(fields);
+  uint16_t sum1 = 0, sum2 = 0;
+  char number[13];
+  Serial.print("ALL:");
+  for (int i = 0; i < count; i++) {
+    number[0] = ',';
+    ltoa(fields[i], number + 1, 10);
+    char* text = i == 0 ? number + 1 : number;
+    fletcherUpdate(&sum1, &sum2, text, strlen(text));
+    Serial.print(text);
   }
+  Serial.print('*'); printHex16((sum2 << 8) | sum1); Serial.println();
 }
\ No newline at end of file
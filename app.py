@@ -5,7 +5,6 @@ import tkinter as tk
 from tkinter import messagebox, filedialog, font as tkFont
 import serial
 import serial.tools.list_ports
-import threading
 import time
 import pyautogui
 import json
@@ -13,6 +12,15 @@ import os
 import random
 import math
 from collections import deque
+import numpy as np
+from serial_link import (PRESSURE_FILTER_CAP, PROFILE_CAP, READBACK_CAP, STREAM_CAP, VIRTUAL_PORT_LINK, DeviceConnector, DeviceMirror, PortWatcher, TelemetryBuffer,
+                         TelemetryBus, command_state_key, decode_profile_payload, encode_profile_command,
+                         profile_from_state, state_commands, state_from_profile)
+from calibration_analysis import analyze_captures, optimize_thresholds
+from firmware_sim import INPUT_UPDATE_PERIOD_MS, JoystickSectors, cursor_summary, joystick_from_records
+from recorder import TOPIC_KINDS, SessionRecorder, open_recording, recording_files
+from replay import SessionReplay
+from transport import SerialTransport, TkAsyncBridge
 
 pyautogui.FAILSAFE = False
 PROFILES_DIR = "input_profiles"
@@ -27,6 +35,8 @@ DEFAULT_SETTINGS = {
     "CSP": 10, "OSK_ENABLED": 0,
     # NEW: Sensitivity Scaling
     "SIP_SENS": 100, "PUFF_SENS": 100,
+    # Pressure filter window in 5 ms samples (firmware with PRESSURE_FILTER_CAP only)
+    "PFW": 10,
 }
 
 # Default keybinds for keyboard mode sectors (now supports two keys via space)
@@ -34,6 +44,64 @@ DEFAULT_SECTOR_KEYS = ['d', 'd s', 's', 'a s', 'a', 'a w', 'w', 'w d']
 DEFAULT_PRESSURE_KEYS = {'HPT': 'f', 'SPT': 'r', 'HST': 'e', 'SST': 'q'}
 
 
+class PressureHistory:
+    """Fixed-capacity ring buffer for the calibration graph. Every sample is stored twice,
+    `capacity` apart, so the newest samples are always one contiguous NumPy view."""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self._data = np.zeros(2 * self.capacity, dtype=np.int32)
+        self._head = 0; self._count = 0
+
+    def __len__(self): return self._count
+
+    def append(self, value):
+        i = self._head
+        self._data[i] = self._data[i + self.capacity] = value
+        self._head = (i + 1) % self.capacity
+        if self._count < self.capacity: self._count += 1
+
+    def values(self):
+        end = self._head + self.capacity
+        return self._data[end - self._count:end] # Oldest to newest, no copy
+
+    def last(self):
+        return int(self._data[self._head + self.capacity - 1])
+
+    def clear(self):
+        self._head = 0; self._count = 0
+
+    def resize(self, capacity):
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity: return
+        keep = self.values()[-capacity:].copy()
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=np.int32)
+        n = len(keep)
+        self._data[:n] = keep; self._data[capacity:capacity + n] = keep
+        self._head = n % capacity; self._count = n
+
+
+class FrameStats:
+    """Per-visualizer paint times, plus how many redraw requests were folded into each frame."""
+
+    def __init__(self, window=240):
+        self.recent = deque(maxlen=window)
+        self.frames = 0; self.requests = 0; self.total_s = 0.0; self.max_s = 0.0
+
+    def add(self, seconds):
+        self.recent.append(seconds)
+        self.frames += 1; self.total_s += seconds
+        if seconds > self.max_s: self.max_s = seconds
+
+    def summary(self):
+        recent = sorted(self.recent)
+        return {"frames": self.frames, "requests": self.requests,
+                "mean_ms": self.total_s / self.frames * 1000 if self.frames else 0.0,
+                "p95_ms": recent[int(0.95 * (len(recent) - 1))] * 1000 if recent else 0.0,
+                "max_ms": self.max_s * 1000}
+
+
 class IntegratedHybridApp:
     # Special keys mapping for Keyboard mode
     SPECIAL_KEYS = {
@@ -66,11 +134,49 @@ class IntegratedHybridApp:
         self.font_log = ctk.CTkFont(family="Courier New", size=10)
         self.font_labelframe_title = ctk.CTkFont(family=base_font_family, size=12, weight="bold")
         self.font_canvas_threshold_text = tkFont.Font(family="Arial", size=9)
+        self.font_joystick_key = ctk.CTkFont(family="Segoe UI", size=12, weight="bold")
         
         self.current_mode_str = "Mouse" # Python-level state tracker for mode
         self.current_mode = tk.StringVar(value=self.current_mode_str)
 
-        self.ser = None; self.is_connected = False; self.stop_read_thread = threading.Event()
+        self.ser = None; self.is_connected = False
+        self.io = TkAsyncBridge(self.root) # asyncio loop for serial I/O, next to the Tk mainloop
+        self.transport = None # SerialTransport owning the port while connected
+        # disconnected -> opening -> waiting (for the ready banner) -> syncing -> ready; failed drops back to disconnected
+        # A lost link goes to reconnecting, and back to opening when the same USB device shows up again
+        # Ending a session goes through closing while the transport lets its queued writes out and shuts the port
+        self.connection_state = "disconnected"; self._connector = None; self._connect_started = 0.0; self._sync_label = None
+        self._transport_closing = None # Future of the last SerialTransport.close(), so the app can wait for it on exit
+        self.CONNECT_READY_TIMEOUT_S = 4.0; self.SYNC_TIMEOUT_MS = 2000
+        self.connect_latency_s = None # Click to ready, for the last connection
+        self.AUTO_RECONNECT = True; self.RECONNECT_BACKOFF_S = 0.5; self.RECONNECT_BACKOFF_MAX_S = 8.0
+        self._device_identity = None; self._port_watcher = None; self._reconnect = None
+        self.reconnect_history = [] # One dict per recovered outage: device, outage_s, reconnect_s, attempts
+        self.telemetry_buffer = TelemetryBuffer() # Connection events and other non-telemetry records for the Tk thread
+        self.telemetry_bus = TelemetryBus() # P/JOY/CALIB_P/MSG, each consumer subscribed with its own delivery policy
+        self.PRESSURE_LABEL_HZ = 5 # Pressure readouts; the calibration graph and sample collector get every sample
+        self.LIVE_THRESHOLDS_HZ = 2; self.THRESHOLD_MARGIN = 10 # Threshold solver reruns while recording; margin in pressure units
+        self.PRESSURE_STREAM_DELTA = 2 # With STREAM_CAP and nothing recording, P: only comes when it moves by more than this
+        self._stream_settings = {} # Last STREAM setting sent per telemetry kind this session
+        self.RECORD_SESSIONS = False # Default of the Record checkbox: every P/JOY/CALIB_P sample of a connection goes to recordings/ (see recorder.py)
+        self.RECORDINGS_KEEP_MB = 512 # Oldest recordings are deleted beyond this
+        self.session_recorder = SessionRecorder(max_total_bytes=self.RECORDINGS_KEEP_MB * 1024 * 1024); self._recorder_subscriptions = []
+        self.record_sessions_tkvar = tk.BooleanVar(value=self.RECORD_SESSIONS); self.recording_status_tkvar = tk.StringVar(value="")
+        self._replay = None # SessionReplay feeding a recording through the live input path, while disconnected
+        self.TELEMETRY_PUMP_INTERVAL_MS = 15
+        self.USE_BINARY_TELEMETRY = True # Only used if the firmware advertises it at connect time
+        self.telemetry_protocol = "text"
+        self.device_caps = [] # From the GET_CAPS reply at connect time
+        self.device_mirror = DeviceMirror() # What the Arduino holds; pushes only send entries that differ from it
+        self.LIVE_SLIDER_SYNC = True; self.LIVE_PUSH_DEBOUNCE_MS = 150; self._live_push_job = None
+        self.PROFILE_MIN_CHANGES = 4 # Fewer changed entries go as individual SET_ lines, more as one SET_PROFILE
+        self.latency_probe = None # Set by benchmarks.py latency to timestamp samples as they are handled and drawn
+
+        # Visualizers are only marked dirty by data/slider/resize events; _render_frame repaints each at most once per frame
+        self.RENDER_FPS_CAP = 60
+        self.VISUALIZER_TABS = {"joystick": "Stick Control", "pressure": "Calibrate Sensor"}
+        self._dirty_visualizers = set(); self._render_job = None; self._last_render_time = 0.0; self._window_minimized = False
+        self.render_stats = {name: FrameStats() for name in self.VISUALIZER_TABS}
         
         self.params_tkvars = {}
         self.param_labels = {} 
@@ -86,6 +192,7 @@ class IntegratedHybridApp:
         self.keyboard_pressure_key_widgets = {}
         
         self.osk_toggle_enabled_tkvar = tk.BooleanVar(value=False)
+        self.cursor_preview_tkvar = tk.StringVar(value=""); self._cursor_preview_job = None; self._cursor_preview_trace = (None, 0, None) # (path, records decoded, JOY trace) of the last session, for the JDZ/CSP preview
 
         for key, value in DEFAULT_SETTINGS.items():
             if key == "OSK_ENABLED":
@@ -118,9 +225,8 @@ class IntegratedHybridApp:
         self.mouse_trail_ids = []
 
         self.calibrating_action_name=tk.StringVar(value=""); self.calibration_samples=[]
-        self.calibration_current_value_tkvar=tk.StringVar(value="Raw Pressure: ---")
+        self.calibration_current_value_tkvar=tk.StringVar(value="Raw Pressure: ---"); self.calibration_live_thresholds_tkvar=tk.StringVar(value="")
         self.is_calibrating_arduino_mode=False; self.collected_calibration_data={}; self._calibration_collect_job=None
-        self.pressure_history = []
         self.pressure_canvas_min_width = 450 
         self.pressure_canvas_min_height = 450 
 
@@ -132,9 +238,18 @@ class IntegratedHybridApp:
 
         self.max_history_points = self.pressure_canvas_min_width - self.pressure_label_area_width 
         if self.max_history_points <=0: self.max_history_points = 1 
+        self.pressure_history = PressureHistory(self.max_history_points)
+        self._pressure_static_key = None; self._pressure_line_id = None; self._pressure_line_hidden = True; self._pressure_x_coords = None
+        for key in ["HPT", "SPT", "NMAX", "NMIN", "HST"]:
+            self.params_tkvars[key].trace_add("write", self._invalidate_pressure_static_layer)
         
         self.joystick_x_centered_tkvar = tk.IntVar(value=0); self.joystick_y_centered_tkvar = tk.IntVar(value=0)
         self.joystick_canvas_min_width = 200; self.joystick_canvas_min_height = 200
+        self._joystick_static_key = None; self._joystick_geometry = None; self._joystick_indicator_id = None
+        self._joystick_sector_label_ids = []; self._joystick_highlighted_sector = -1; self._joystick_sector_text_color = "black"
+        self._joystick_sectors = JoystickSectors()  # The board's sector lookup (joystick_logic.h), so the highlight matches the key sent
+        for tk_var in [self.params_tkvars["JMT"], self.params_tkvars["JDZ"], self.num_sectors_tkvar] + self.sector_key_tkvars:
+            tk_var.trace_add("write", self._invalidate_joystick_static_layer)
         
         if not os.path.exists(PROFILES_DIR):
             try: os.makedirs(PROFILES_DIR)
@@ -145,8 +260,11 @@ class IntegratedHybridApp:
         self.update_gui_for_mode()
         self.set_status("Disconnected. Select port and connect.")
         self.root.bind("<Configure>", self._on_window_resize)
+        self.root.bind("<Map>", self._on_root_map_change, add="+"); self.root.bind("<Unmap>", self._on_root_map_change, add="+")
         
+        self._subscribe_telemetry()
         self._app_update_loop()
+        self._telemetry_pump()
 
 
     def _calculate_pressure_label_area_width(self):
@@ -160,22 +278,43 @@ class IntegratedHybridApp:
         self.pressure_label_area_width = max(70, int(calculated_width))
 
     def _on_window_resize(self, event=None):
-        if hasattr(self, 'tab_view') and self.tab_view.winfo_exists():
-            current_tab = self.tab_view.get()
-            if current_tab == "Calibrate Sensor" and self.is_calibrating_arduino_mode:
-                if hasattr(self, 'pressure_visualizer_canvas') and self.pressure_visualizer_canvas.winfo_exists():
-                    w = self.pressure_visualizer_canvas.winfo_width()
-                    if w > 1 : 
-                        label_area_width = self.pressure_label_area_width 
-                        graph_area_width = w - label_area_width
-                        if graph_area_width <=0 : graph_area_width = 1 
-                        if abs(self.max_history_points - graph_area_width) > 5: 
-                           self.max_history_points = graph_area_width
-                           if self.max_history_points <=0: self.max_history_points = 1
-                    self._update_pressure_visualizer() 
-            elif current_tab == "Stick Control":
-                if hasattr(self, 'joystick_canvas') and self.joystick_canvas.winfo_exists():
-                    self._update_joystick_visualizer()
+        self._request_redraw("joystick")
+        if self.is_calibrating_arduino_mode: self._request_redraw("pressure")
+
+    def _on_root_map_change(self, event):
+        if event.widget is not self.root: return
+        self._window_minimized = (event.type == tk.EventType.Unmap)
+        if not self._window_minimized: self._schedule_render_frame()
+        self._update_telemetry_streams()
+
+    def _visualizer_visible(self, name):
+        return (not self._window_minimized and hasattr(self, 'tab_view') and self.tab_view.winfo_exists()
+                and self.tab_view.get() == self.VISUALIZER_TABS[name])
+
+    def _request_redraw(self, name):
+        self._dirty_visualizers.add(name); self.render_stats[name].requests += 1
+        self._schedule_render_frame()
+
+    def _schedule_render_frame(self):
+        # Nothing is scheduled while the window is minimised or every dirty visualizer sits on a hidden tab
+        if self._render_job is not None or not any(self._visualizer_visible(name) for name in self._dirty_visualizers): return
+        next_frame_at = self._last_render_time + 1.0 / self.RENDER_FPS_CAP
+        delay_ms = max(0, int((next_frame_at - time.perf_counter()) * 1000 + 0.5))
+        self._render_job = self.root.after(delay_ms, self._render_frame)
+
+    def _render_frame(self):
+        self._render_job = None
+        self._last_render_time = time.perf_counter()
+        renderers = {"joystick": self._update_joystick_visualizer, "pressure": self._update_pressure_visualizer}
+        for name in [n for n in self._dirty_visualizers if self._visualizer_visible(n)]:
+            self._dirty_visualizers.discard(name)
+            start = time.perf_counter()
+            try: renderers[name]()
+            except tk.TclError: pass
+            self.render_stats[name].add(time.perf_counter() - start)
+
+    def get_render_stats(self):
+        return {name: stats.summary() for name, stats in self.render_stats.items()}
 
     def _get_themed_canvas_bg(self):
         appearance_mode = ctk.get_appearance_mode()
@@ -232,6 +371,9 @@ class IntegratedHybridApp:
         self.port_combo = ctk.CTkComboBox(conn_frame, width=180, state="readonly", font=self.font_normal); self.port_combo.pack(side=tk.LEFT, padx=5, pady=5)
         self.connect_button = ctk.CTkButton(conn_frame, text="Connect", command=self.toggle_connect, font=self.font_bold, width=100); self.connect_button.pack(side=tk.LEFT, padx=5, pady=5)
         self.refresh_button = ctk.CTkButton(conn_frame, text="Refresh Ports", command=self.populate_ports, font=self.font_bold, width=120); self.refresh_button.pack(side=tk.LEFT, padx=5, pady=5)
+        self.record_checkbox = ctk.CTkCheckBox(conn_frame, text="Record", variable=self.record_sessions_tkvar, onvalue=True, offvalue=False,
+                                               command=self.on_record_toggle, font=self.font_normal, width=80); self.record_checkbox.pack(side=tk.LEFT, padx=5, pady=5)
+        ctk.CTkLabel(conn_frame, textvariable=self.recording_status_tkvar, font=self.font_bold, text_color="#D03030").pack(side=tk.LEFT, padx=(0,5), pady=5)
         
         pressure_lf_outer, pressure_display_frame = self._create_labeled_frame(parent_frame, "Live Pressure (Avg)")
         pressure_lf_outer.pack(side=tk.LEFT, padx=10, pady=5, fill=tk.X, expand=True)
@@ -265,6 +407,7 @@ class IntegratedHybridApp:
 
         row_idx_col2=self.create_param_slider_widget(col2_frame, "Sip Sensitivity (%):", self.params_tkvars["SIP_SENS"], "SIP_SENS", 10, 200, row_idx_col2, desc_text_str="Lower to make sips less sensitive.")
         row_idx_col2=self.create_param_slider_widget(col2_frame, "Puff Sensitivity (%):", self.params_tkvars["PUFF_SENS"], "PUFF_SENS", 10, 200, row_idx_col2, desc_text_str="Lower to make puffs less sensitive.")
+        row_idx_col2=self.create_param_slider_widget(col2_frame, "Pressure Smoothing (PFW):", self.params_tkvars["PFW"], "PFW", 1, 32, row_idx_col2, desc_text_str="Samples averaged (5 ms each). Higher rejects more noise but reacts later.")
         
         ctk.CTkFrame(col2_frame, height=2, border_width=1).grid(row=row_idx_col2+1, column=0, columnspan=3, pady=10, sticky="ew")
         row_idx_col2 += 1
@@ -307,14 +450,52 @@ class IntegratedHybridApp:
 
     def _slider_update_wrapper(self, value, tk_var_ref, param_key_ref):
         tk_var_ref.set(int(value))
-        if param_key_ref in ["JDZ", "JMT", "HST", "NMIN", "NMAX", "SPT", "HPT", "SIP_SENS", "PUFF_SENS"]: 
-            if hasattr(self, 'tab_view') and self.tab_view.winfo_exists():
-                current_tab = self.tab_view.get()
-                if current_tab == "Stick Control" and param_key_ref in ["JDZ", "JMT"]:
-                    self._update_joystick_visualizer()
-                elif current_tab == "Calibrate Sensor":
-                    if self.is_calibrating_arduino_mode: 
-                         self._update_pressure_visualizer()
+        if param_key_ref in ["JDZ", "JMT"]:
+            self._request_redraw("joystick")
+        if param_key_ref in ["JDZ", "CSP"]: self._schedule_cursor_preview()
+        elif param_key_ref in ["HST", "NMIN", "NMAX", "SPT", "HPT", "SIP_SENS", "PUFF_SENS"] and self.is_calibrating_arduino_mode:
+            self._request_redraw("pressure")
+        self._schedule_live_push()
+
+    def _schedule_live_push(self):
+        if not self.LIVE_SLIDER_SYNC or not self.is_connected or self._live_push_job: return
+        self._live_push_job = self.root.after(self.LIVE_PUSH_DEBOUNCE_MS, self._live_push)
+
+    def _schedule_cursor_preview(self):
+        if self._cursor_preview_job: self.root.after_cancel(self._cursor_preview_job)
+        self._cursor_preview_job = self.root.after(self.LIVE_PUSH_DEBOUNCE_MS, self._update_cursor_preview)
+
+    def _last_session_joystick(self):
+        if self.session_recorder.recording: self.session_recorder.flush()
+        paths = recording_files(self.session_recorder.directory) # Named by start time, so the last is the newest
+        if not paths: return None
+        path, decoded, joy = self._cursor_preview_trace
+        _, records = open_recording(paths[-1]) # A memmap: only the records appended since the last preview are read
+        if path != paths[-1] or len(records) < decoded: path, decoded, joy = paths[-1], 0, np.zeros((0, 2), dtype=np.int64)
+        if len(records) > decoded:
+            joy = np.concatenate((joy, joystick_from_records(records[decoded:])))
+        self._cursor_preview_trace = (path, len(records), joy)
+        return joy
+
+    def _update_cursor_preview(self):
+        self._cursor_preview_job = None
+        try: joy = self._last_session_joystick()
+        except (OSError, ValueError) as e: self.cursor_preview_tkvar.set(f"Last session preview unavailable: {e}"); return
+        if joy is None or not len(joy): self.cursor_preview_tkvar.set("Tick Record, connect and use the stick to preview JDZ/CSP changes on your last session."); return
+        try: tuner = {key: int(self.params_tkvars[key].get()) for key in ("JDZ", "CSP")}
+        except (tk.TclError, ValueError): return
+        device = {key: self.device_mirror.values.get(key, tuner[key]) for key in ("JDZ", "CSP")}
+        summary = cursor_summary(joy, [tuner, device])
+        minutes = len(joy) * INPUT_UPDATE_PERIOD_MS / 60000.0 # One JOY sample per stick update
+        text = (f"Last session ({minutes:.1f} min) with these settings: {summary.distance[0]:,.0f} counts of travel, "
+                f"peak {summary.peak_speed[0]:,.0f}/s, moving {summary.moving_fraction[0]:.0%} of the time.")
+        if device != tuner:
+            text += f"\nWith the Arduino's JDZ {device['JDZ']} / CSP {device['CSP']}: {summary.distance[1]:,.0f} counts, peak {summary.peak_speed[1]:,.0f}/s."
+        self.cursor_preview_tkvar.set(text)
+
+    def _live_push(self):
+        self._live_push_job = None
+        if self.is_connected: self.push_settings("Live update", scope="params", show_errors=False)
 
     def create_profile_widgets_content(self, profile_frame):
         ctk.CTkLabel(profile_frame, text="Profile:", font=self.font_normal).grid(row=0, column=0, padx=5, pady=(5,3), sticky="w")
@@ -391,7 +572,7 @@ class IntegratedHybridApp:
                 self.tab_view.set("Tuner & Profiles")
         
         self.on_tab_change()
-        self._update_joystick_visualizer()
+        self._request_redraw("joystick")
         self.root.update_idletasks()
 
     def on_tab_change(self, selected_tab_name=None):
@@ -412,9 +593,10 @@ class IntegratedHybridApp:
              if hasattr(self,'calibration_instructions_label'):
                  initial_calib_text = "Click 'Start Sensor Stream'..." if not self.is_calibrating_arduino_mode else "Sensor stream active..."
                  self.calibration_instructions_label.configure(text=initial_calib_text)
-                 if self.is_calibrating_arduino_mode: self._update_pressure_visualizer()
+                 if self.is_calibrating_arduino_mode: self._request_redraw("pressure")
         elif selected_tab_name == 'Stick Control':
-            if hasattr(self, 'joystick_canvas') and self.joystick_canvas.winfo_exists(): self._update_joystick_visualizer()
+            self._request_redraw("joystick")
+        self._update_telemetry_streams()
 
     def create_trainer_widgets(self, parent_tab):
         trainer_controls_frame=ctk.CTkFrame(parent_tab, fg_color="transparent"); trainer_controls_frame.pack(pady=10,fill=tk.X, padx=5)
@@ -437,6 +619,7 @@ class IntegratedHybridApp:
         top_section_frame = ctk.CTkFrame(calib_main_frame, fg_color="transparent"); top_section_frame.grid(row=0, column=0, sticky="ew", pady=(0, 10))
         self.calibration_instructions_label=ctk.CTkLabel(top_section_frame,text="Click 'Start Sensor Stream' then select an action.",justify=tk.CENTER,font=self.font_bold); self.calibration_instructions_label.pack(pady=5, fill=tk.X, padx=5)
         live_pressure_label_calib=ctk.CTkLabel(top_section_frame,textvariable=self.calibration_current_value_tkvar,font=self.font_pressure); live_pressure_label_calib.pack(pady=10)
+        live_thresholds_label=ctk.CTkLabel(top_section_frame,textvariable=self.calibration_live_thresholds_tkvar,font=self.font_log); live_thresholds_label.pack(pady=(0,5))
         arduino_mode_frame=ctk.CTkFrame(top_section_frame, fg_color="transparent"); arduino_mode_frame.pack(pady=5)
         self.start_arduino_calib_button=ctk.CTkButton(arduino_mode_frame,text="Start Sensor Stream",command=self.start_arduino_calibration_mode,width=180, font=self.font_bold); self.start_arduino_calib_button.pack(side=tk.LEFT,padx=5)
         self.stop_arduino_calib_button=ctk.CTkButton(arduino_mode_frame,text="Stop Sensor Stream",command=self.stop_arduino_calibration_mode,state=tk.DISABLED,width=180, font=self.font_bold); self.stop_arduino_calib_button.pack(side=tk.LEFT,padx=5)
@@ -450,6 +633,8 @@ class IntegratedHybridApp:
         for i, action_name in enumerate(self.calibration_actions):
             btn = ctk.CTkButton(actions_content_frame, text=f"Record {action_name}", command=lambda name=action_name: self.start_collecting_samples(name), state=tk.DISABLED, font=self.font_bold)
             btn.grid(row=i // 3, column=i % 3, padx=5, pady=5, sticky="ew"); self.action_buttons[action_name] = btn
+        self.clear_captures_button = ctk.CTkButton(actions_content_frame, text="Clear Captures", command=self.clear_calibration_captures, state=tk.DISABLED, font=self.font_bold)
+        self.clear_captures_button.grid(row=1, column=2, padx=5, pady=5, sticky="ew")
         actions_content_frame.columnconfigure((0, 1, 2), weight=1)
         log_lf_outer, log_content_frame = self._create_labeled_frame(actions_and_log_frame, "Calibration Log & Results"); log_lf_outer.pack(fill=tk.X, pady=5, padx=5)
         self.calib_log_text = ctk.CTkTextbox(log_content_frame, height=100, wrap=tk.WORD, font=self.font_log, activate_scrollbars=True); self.calib_log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -490,6 +675,9 @@ class IntegratedHybridApp:
                                                        variable=self.osk_toggle_enabled_tkvar, onvalue=True, offvalue=False,
                                                        font=self.font_normal)
             self.osk_toggle_checkbox.grid(row=row_idx+2, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+            cursor_preview_label = ctk.CTkLabel(self.stick_params_content_frame, textvariable=self.cursor_preview_tkvar, font=self.font_small, text_color=("gray30", "gray70"), wraplength=260, justify=tk.LEFT, anchor="w")
+            cursor_preview_label.grid(row=row_idx+3, column=0, columnspan=3, padx=5, pady=(5,0), sticky="w")
+            self._schedule_cursor_preview()
     
         else: # Keyboard Mode
             current_row = 0
@@ -571,34 +759,25 @@ class IntegratedHybridApp:
             entry.grid(row=i, column=1, padx=5, pady=2, sticky="ew")
             
             self.keyboard_sector_widgets[i] = {'label': label, 'entry': entry}
-        self._update_joystick_visualizer()
+        self._request_redraw("joystick")
 
 
-    def _update_joystick_visualizer(self):
-        if not hasattr(self, 'joystick_canvas') or not self.joystick_canvas.winfo_exists(): return
-        canvas = self.joystick_canvas
-        canvas_bg = self._get_themed_canvas_bg()
-        canvas.configure(bg=canvas_bg)
-        
-        try:
-            w = canvas.winfo_width()
-            h = canvas.winfo_height()
-        except tk.TclError:
-            return
+    def _invalidate_joystick_static_layer(self, *args):
+        self._joystick_static_key = None
 
-        if w <= 1 or h <= 1:
-            self.root.after(50, self._update_joystick_visualizer)
-            return
+    def _joystick_active_sector(self, joy_x, joy_y, num_sectors):
+        return self._joystick_sectors.sector(joy_x, joy_y, num_sectors, self.params_tkvars["JMT"].get())
 
+    def _build_joystick_static_layer(self, canvas, w, h):
+        # Everything except the indicator; only rebuilt when size, theme, mode, JMT/JDZ or keybinds change
+        canvas.configure(bg=self._get_themed_canvas_bg())
         canvas.delete("all")
         cx, cy = w / 2, h / 2
-        max_stick_deflection = 512.0
-        
         canvas_radius = (min(w, h) / 2) - 25 
         if canvas_radius < 10: canvas_radius = 10
-        
-        joy_x = self.joystick_x_centered_tkvar.get()
-        joy_y = self.joystick_y_centered_tkvar.get()
+        self._joystick_geometry = (cx, cy, canvas_radius)
+        self._joystick_sector_label_ids = []
+        self._joystick_highlighted_sector = -1
 
         if self.current_mode_str == "Keyboard":
             jmt_percent = self.params_tkvars["JMT"].get() / 100.0
@@ -609,16 +788,7 @@ class IntegratedHybridApp:
 
             num_sectors = int(self.num_sectors_tkvar.get())
             slice_angle_deg = 360.0 / num_sectors
-            key_font = ctk.CTkFont(family="Segoe UI", size=12, weight="bold")
-            text_color = "white" if ctk.get_appearance_mode() == "Dark" else "black"
-            
-            active_sector = -1
-            magnitude_percent = (math.sqrt(joy_x**2 + joy_y**2) / max_stick_deflection) * 100.0
-            if magnitude_percent > self.params_tkvars["JMT"].get():
-                angle_deg = math.degrees(math.atan2(-joy_y, joy_x))
-                angle_deg += slice_angle_deg / 2.0
-                if angle_deg < 0: angle_deg += 360
-                active_sector = int(angle_deg / slice_angle_deg)
+            self._joystick_sector_text_color = "white" if ctk.get_appearance_mode() == "Dark" else "black"
 
             for i in range(num_sectors):
                 angle_rad = math.radians(i * slice_angle_deg - (slice_angle_deg / 2.0))
@@ -631,9 +801,8 @@ class IntegratedHybridApp:
                 text_x = cx + text_radius * math.cos(text_angle_rad)
                 text_y = cy + text_radius * math.sin(text_angle_rad)
                 key_char = self.sector_key_tkvars[i].get().upper().replace(" ", "+")[:5]
-                
-                fill_color = "cyan" if i == active_sector else text_color
-                canvas.create_text(text_x, text_y, text=key_char, font=key_font, fill=fill_color)
+                self._joystick_sector_label_ids.append(
+                    canvas.create_text(text_x, text_y, text=key_char, font=self.font_joystick_key, fill=self._joystick_sector_text_color))
 
         else: # Mouse Mode
             jmt_percent = self.params_tkvars["JMT"].get() / 100.0
@@ -648,6 +817,41 @@ class IntegratedHybridApp:
                                 outline="skyblue", dash=(3, 3), tags="jdz_circle")
             canvas.create_text(cx + deadzone_radius_pixels + 5, cy, text="JDZ", fill="skyblue", anchor="w", font=self.font_small)
 
+        self._joystick_indicator_id = canvas.create_oval(cx - 4, cy - 4, cx + 4, cy + 4, fill="red", outline="white", tags="indicator")
+
+    def _update_joystick_visualizer(self):
+        if not hasattr(self, 'joystick_canvas') or not self.joystick_canvas.winfo_exists(): return
+        canvas = self.joystick_canvas
+        
+        try:
+            w = canvas.winfo_width()
+            h = canvas.winfo_height()
+        except tk.TclError:
+            return
+
+        if w <= 1 or h <= 1:
+            self.root.after(50, self._request_redraw, "joystick")
+            return
+
+        static_key = (w, h, ctk.get_appearance_mode(), self.current_mode_str)
+        if static_key != self._joystick_static_key:
+            self._build_joystick_static_layer(canvas, w, h)
+            self._joystick_static_key = static_key
+
+        cx, cy, canvas_radius = self._joystick_geometry
+        max_stick_deflection = 512.0
+        joy_x = self.joystick_x_centered_tkvar.get()
+        joy_y = self.joystick_y_centered_tkvar.get()
+
+        if self._joystick_sector_label_ids:
+            active_sector = self._joystick_active_sector(joy_x, joy_y, len(self._joystick_sector_label_ids))
+            if active_sector != self._joystick_highlighted_sector:
+                if self._joystick_highlighted_sector != -1:
+                    canvas.itemconfigure(self._joystick_sector_label_ids[self._joystick_highlighted_sector], fill=self._joystick_sector_text_color)
+                if active_sector != -1:
+                    canvas.itemconfigure(self._joystick_sector_label_ids[active_sector], fill="cyan")
+                self._joystick_highlighted_sector = active_sector
+
         joy_x_clamped = max(-max_stick_deflection, min(max_stick_deflection, joy_x))
         joy_y_clamped = max(-max_stick_deflection, min(max_stick_deflection, joy_y))
         
@@ -655,65 +859,156 @@ class IntegratedHybridApp:
         indicator_y = cy - (joy_y_clamped / max_stick_deflection) * canvas_radius
 
         ind_r = 4
-        canvas.create_oval(indicator_x - ind_r, indicator_y - ind_r, indicator_x + ind_r, indicator_y + ind_r, 
-                            fill="red", outline="white", tags="indicator")
+        canvas.coords(self._joystick_indicator_id, indicator_x - ind_r, indicator_y - ind_r, indicator_x + ind_r, indicator_y + ind_r)
+        if self.latency_probe: self.latency_probe.drawn("JOY", (joy_x, joy_y))
 
     def populate_ports(self):
-        ports = [port.device for port in serial.tools.list_ports.comports()]; self.port_combo.configure(values=ports)
+        ports = [port.device for port in serial.tools.list_ports.comports()]
+        if os.path.exists(VIRTUAL_PORT_LINK): ports.append(VIRTUAL_PORT_LINK) # virtual_controller.py is running
+        self.port_combo.configure(values=ports)
         if ports: self.port_combo.set(ports[0])
         else: self.port_combo.set("")
 
     def toggle_connect(self):
+        if self._reconnect is not None and not self.is_connected:
+            self._stop_reconnect(); self.set_status("Reconnect cancelled."); return
+        if self.connection_state in ("opening", "waiting"):
+            self._connector.cancel(); self._connector = None
+            self.connection_state = "disconnected"; self.connect_button.configure(text="Connect")
+            self.set_status("Connection cancelled."); return
         if not self.is_connected:
             port = self.port_combo.get()
             if not port:
                 messagebox.showerror("Error", "No serial port selected.", parent=self.root); return
-            try:
-                self.ser = serial.Serial(port, 115200, timeout=0.1)
-                time.sleep(1.8)
-                self.is_connected = True
-                self.connect_button.configure(text="Disconnect")
-                self.apply_button.configure(state=tk.NORMAL)
-                if hasattr(self, 'apply_keyboard_keys_button'): self.apply_keyboard_keys_button.configure(state=tk.NORMAL)
-
-                self.mode_combo.configure(state="readonly")
-                
-                self.set_status(f"Connected to {port}")
-                self.stop_read_thread.clear()
-                self.read_thread = threading.Thread(target=self.read_from_arduino, daemon=True)
-                self.read_thread.start()
-                
-                current_gui_mode = self.current_mode.get()
-                if current_gui_mode == "Mouse": self.send_command("SET_MODE_MOUSE\n")
-                elif current_gui_mode == "Keyboard": self.send_command("SET_MODE_KEYBOARD\n")
-                
-                self.root.after(100, self.apply_all_settings) 
-
-            except serial.SerialException as e:
-                messagebox.showerror("Connection Error", str(e), parent=self.root)
-                self.ser = None; self.is_connected = False
-                self.mode_combo.configure(state="readonly")
+            self._open_connection(port)
         else:
-            if self.is_calibrating_arduino_mode: self.stop_arduino_calibration_mode(silent=True)
-            self.is_connected = False; self.stop_read_thread.set()
-            if hasattr(self, 'read_thread') and self.read_thread.is_alive(): self.read_thread.join(timeout=0.5)
-            if self.ser and self.ser.is_open: self.ser.close()
-            self.ser = None; self.connect_button.configure(text="Connect")
-            self.apply_button.configure(state=tk.DISABLED)
-            if hasattr(self, 'apply_keyboard_keys_button'): self.apply_keyboard_keys_button.configure(state=tk.DISABLED)
-            self.mode_combo.configure(state="readonly")
-            self.set_status("Disconnected"); self.current_pressure_tkvar.set("Pressure: N/A")
-            self.joystick_x_centered_tkvar.set(0); self.joystick_y_centered_tkvar.set(0)
-            if hasattr(self, 'joystick_canvas') and self.joystick_canvas.winfo_exists(): self._update_joystick_visualizer()
+            self._reconnect = None; self._end_session("Disconnected")
+
+    def _open_connection(self, port):
+        if self._replay: self.stop_replay()
+        self._connect_started = time.perf_counter(); self.connect_latency_s = None
+        self._connector = DeviceConnector(port, lambda connector, state, detail: self.telemetry_buffer.push("CONN", (connector, state, detail)),
+                                          allow_binary=self.USE_BINARY_TELEMETRY, ready_timeout=self.CONNECT_READY_TIMEOUT_S)
+        self.connection_state = "opening"; self.connect_button.configure(text="Cancel")
+        self._connector.start()
+
+    def _end_session(self, status_text, then=None):
+        """Stops using the port at once; the rest of the teardown, then `then()`, runs once
+        the transport has closed it, without holding up the Tk thread meanwhile."""
+        self.is_connected = False # First, so a failed write below cannot re-enter through handle_serial_error_disconnect
+        self._stop_recording()
+        if self.is_calibrating_arduino_mode: self.stop_arduino_calibration_mode(silent=True)
+        if self._live_push_job: self.root.after_cancel(self._live_push_job); self._live_push_job = None
+        self.device_mirror.forget()
+        self.apply_button.configure(state=tk.DISABLED)
+        if hasattr(self, 'apply_keyboard_keys_button'): self.apply_keyboard_keys_button.configure(state=tk.DISABLED)
+        if not self.transport: self._finish_end_session(status_text, then); return
+        farewell = ["SET_PROTOCOL:TEXT"] if self.telemetry_protocol == "binary" else [] # Leave the board readable by older hosts
+        if STREAM_CAP in self.device_caps: farewell.append("STREAM:ALL,ON") # ...which expect telemetry without asking
+        transport, self.transport = self.transport, None # Late replies and errors of this session are dropped from here on
+        self.connection_state = "closing"; self.connect_button.configure(state=tk.DISABLED)
+
+        def on_error(error):
+            print(f"Error closing serial transport: {error!r}"); self._finish_end_session(status_text, then)
+        self._transport_closing = self.io.submit(transport.close(farewell), # Queued writes (calibration STOP) go out first
+                                                 on_done=lambda _: self._finish_end_session(status_text, then), on_error=on_error)
+
+    def _finish_end_session(self, status_text, then=None):
+        self._transport_closing = None
+        self.telemetry_buffer.clear(); self.telemetry_bus.clear(); self.telemetry_protocol = "text"; self.device_caps = []
+        self.ser = None; self.connect_button.configure(text="Connect", state=tk.NORMAL)
+        self.mode_combo.configure(state="readonly")
+        self.connection_state = "disconnected"; self._sync_label = None
+        self.set_status(status_text); self.current_pressure_tkvar.set("Pressure: N/A")
+        self.joystick_x_centered_tkvar.set(0); self.joystick_y_centered_tkvar.set(0)
+        self._request_redraw("joystick")
+        if then: then()
+
+    def _watch_for_device(self, delay=0.0):
+        self.connection_state = "reconnecting"; self.connect_button.configure(text="Cancel")
+        self._port_watcher = PortWatcher(self._reconnect["identity"], lambda watcher, device: self.telemetry_buffer.push("CONN", (watcher, "found", device)), delay=delay)
+        self._port_watcher.start()
+
+    def _stop_reconnect(self):
+        if self._port_watcher: self._port_watcher.cancel(); self._port_watcher = None
+        if self._connector: self._connector.cancel(); self._connector = None
+        self._reconnect = None; self.connection_state = "disconnected"; self.connect_button.configure(text="Connect")
+
+    def _on_connection_state(self, connector, state, detail):
+        if state == "found":
+            if connector is not self._port_watcher: return
+            self._port_watcher = None; self._reconnect["found_at"] = time.perf_counter(); self._reconnect["attempts"] += 1
+            self.port_combo.set(detail)
+            self.set_status(f"Controller is back on {detail}, reconnecting (attempt {self._reconnect['attempts']})...")
+            self._open_connection(detail); return
+        if connector is not self._connector: # Cancelled attempt finishing late
+            if state == "syncing": detail.ser.close()
+            return
+        if state == "opening": self.set_status(f"Opening {detail}...")
+        elif state == "waiting": self.connection_state = "waiting"; self.set_status(f"Waiting for the controller on {detail}...")
+        elif state == "failed" and self._reconnect is not None:
+            self._connector = None
+            delay = min(self.RECONNECT_BACKOFF_MAX_S, self.RECONNECT_BACKOFF_S * 2 ** (self._reconnect["attempts"] - 1))
+            self.set_status(f"Reconnect attempt {self._reconnect['attempts']} failed ({detail}), retrying in {delay:.1f} s...")
+            self._watch_for_device(delay)
+        elif state == "failed":
+            self._connector = None; self.connection_state = "disconnected"; self.connect_button.configure(text="Connect")
+            self.set_status(f"Connection failed: {detail}")
+            messagebox.showerror("Connection Error", detail, parent=self.root)
+        elif state == "syncing":
+            self._connector = None
+            self._start_session(connector.port, detail)
+
+    def _start_session(self, port, result):
+        self.ser = result.ser; self.telemetry_protocol = result.protocol; self.device_caps = result.caps
+        self._device_identity = result.identity
+        for record in result.records: self._on_device_record(*record)
+        self.is_connected = True; self.connection_state = "syncing"
+        self.connect_button.configure(text="Disconnect")
+        self.apply_button.configure(state=tk.NORMAL)
+        if hasattr(self, 'apply_keyboard_keys_button'): self.apply_keyboard_keys_button.configure(state=tk.NORMAL)
+        self.mode_combo.configure(state="readonly")
+
+        self.device_mirror.forget()
+        self._start_recording()
+        self.transport = SerialTransport(self.ser, self.telemetry_protocol, on_record=self._on_device_record)
+        self.io.submit(self.transport.run(), on_error=self._session_callback(self._on_transport_error))
+
+        current_gui_mode = self.current_mode.get()
+        if current_gui_mode == "Mouse": self.send_command("SET_MODE_MOUSE\n")
+        elif current_gui_mode == "Keyboard": self.send_command("SET_MODE_KEYBOARD\n")
+        self._stream_settings = {}; self._update_telemetry_streams() # Whatever a previous host left set is overwritten
+        self.sync_device_state() # After a reconnect this restores the active profile, which a power-cycled board has lost
+
+    def _session_callback(self, fn):
+        transport = self.transport # Results arriving after this session has ended are dropped
+        return lambda *args: fn(*args) if transport is not None and transport is self.transport else None
+
+    def _on_transport_error(self, error):
+        if isinstance(error, serial.SerialException):
+            self.set_status(f"Serial Error: {error}"); self.handle_serial_error_disconnect()
+        else: print(f"Serial transport error: {error!r}")
+
+    def _sync_push(self, label="Syncing settings to Arduino"):
+        self._sync_label = label
+        if not self.push_settings(label, show_errors=self.current_mode.get() == "Keyboard"): self._on_connection_ready()
+
+    def _on_connection_ready(self):
+        if self.connection_state != "syncing": return
+        self.connection_state = "ready"; self._sync_label = None
+        self.connect_latency_s = time.perf_counter() - self._connect_started
+        if self._reconnect is not None:
+            now = time.perf_counter()
+            outage = {"device": self.ser.port, "outage_s": now - self._reconnect["lost_at"],
+                      "reconnect_s": now - self._reconnect["found_at"], "attempts": self._reconnect["attempts"]}
+            self.reconnect_history.append(outage); self._reconnect = None
+            self.set_status(f"Reconnected to {outage['device']} after a {outage['outage_s']:.1f} s outage "
+                            f"(reconnect {outage['reconnect_s'] * 1000:.0f} ms, {outage['attempts']} attempt(s)); settings restored.")
+            return
+        self.set_status(f"Connected to {self.ser.port} ({self.telemetry_protocol} telemetry), ready in {self.connect_latency_s * 1000:.0f} ms")
 
     def send_command(self, command):
-        if self.ser and self.ser.is_open:
-            try:
-                if not command.endswith('\n'): command += '\n'
-                self.ser.write(command.encode('utf-8'))
-            except serial.SerialException as e:
-                self.set_status(f"Send Error: {e}")
-                self.handle_serial_error_disconnect()
+        if self.transport: self.io.submit(self.transport.write(command), on_error=self._session_callback(self._on_transport_error))
     
     def _get_key_code(self, key_string):
         if key_string == ' ':
@@ -734,26 +1029,24 @@ class IntegratedHybridApp:
         if self.current_mode_str != "Keyboard":
              messagebox.showinfo("Info", "This feature is only for Keyboard Mode.", parent=self.root); return
 
-        self.set_status("Applying keyboard key settings...")
-        
+        self.push_settings("Applying keyboard key settings", scope="keyboard")
+
+    def _keyboard_settings_values(self, show_errors=True):
+        def invalid(message):
+            if show_errors: messagebox.showerror("Invalid Key", message, parent=self.root)
+            return None
+
+        key_values = {}
         for key_code, tk_var in self.pressure_key_tkvars.items():
             key_string = tk_var.get()
             ascii_val = self._get_key_code(key_string)
-            if ascii_val is None:
-                messagebox.showerror("Invalid Key", f"Pressure key '{key_string}' for {key_code} is not a valid key.", parent=self.root)
-                return
-            self.send_command(f"SET_KEY_{key_code}:{ascii_val}")
-            time.sleep(0.02)
+            if ascii_val is None: return invalid(f"Pressure key '{key_string}' for {key_code} is not a valid key.")
+            key_values[f"KEY_{key_code}"] = ascii_val
 
-        num_sectors = int(self.num_sectors_tkvar.get())
-        self.send_command(f"SET_NUM_SECTORS:{num_sectors}")
-        time.sleep(0.02)
-
-        for i in range(num_sectors):
+        joy_keys = []
+        for i in range(int(self.num_sectors_tkvar.get())):
             key_input_str = self.sector_key_tkvars[i].get()
-            if not key_input_str:
-                messagebox.showerror("Invalid Key", f"Sector {i+1} key cannot be empty.", parent=self.root)
-                return
+            if not key_input_str: return invalid(f"Sector {i+1} key cannot be empty.")
             
             key_parts = key_input_str.strip().lower().split(maxsplit=1)
             key1_str = key_parts[0]
@@ -762,86 +1055,226 @@ class IntegratedHybridApp:
             ascii_val1 = self._get_key_code(key1_str)
             ascii_val2 = self._get_key_code(key2_str)
 
-            if ascii_val1 is None:
-                messagebox.showerror("Invalid Key", f"Sector {i+1} key '{key1_str}' is invalid.", parent=self.root)
-                return
-            if ascii_val2 is None:
-                messagebox.showerror("Invalid Key", f"Sector {i+1} key '{key2_str}' is invalid.", parent=self.root)
-                return
+            if ascii_val1 is None: return invalid(f"Sector {i+1} key '{key1_str}' is invalid.")
+            if ascii_val2 is None: return invalid(f"Sector {i+1} key '{key2_str}' is invalid.")
+            joy_keys.append((ascii_val1, ascii_val2))
+        return key_values, joy_keys
+
+    def _desired_device_state(self, show_errors=True):
+        state = {key: int(tk_var.get()) for key, tk_var in self.params_tkvars.items()}
+        keyboard = self._keyboard_settings_values(show_errors)
+        if keyboard: state.update(state_from_profile({**state, **keyboard[0]}, keyboard[1]))
+        if PRESSURE_FILTER_CAP not in self.device_caps: state.pop("PFW", None) # Older firmware filters in fixed 10-sample blocks
+        return state
+
+    def push_settings(self, label, scope="all", show_errors=True):
+        # scope: "all", "params" (sliders) or "keyboard" (pressure and sector keys)
+        try: desired = self._desired_device_state(show_errors and scope != "params")
+        except (tk.TclError, ValueError): return False # Half-typed entry; the next change will push it
+        changes = self.device_mirror.changes(desired)
+        if scope != "all": changes = {k: v for k, v in changes.items() if (k in self.params_tkvars) == (scope == "params")}
+        if not changes:
+            if scope != "params": self.set_status(f"{label}: the Arduino already has these settings.")
+            return False
+        profile = profile_from_state(desired)
+        if scope == "all" and profile and PROFILE_CAP in self.device_caps and len(changes) >= self.PROFILE_MIN_CHANGES:
+            # One SET_PROFILE line, applied atomically and acknowledged with its checksum
+            commands = [encode_profile_command(*profile)]
+            covered = state_from_profile(*profile)
+            commands += state_commands({k: v for k, v in changes.items() if k not in covered}) # SET_PROFILE has no field for these
+            changes = desired
+        else:
+            commands = state_commands(changes)
+        self.device_mirror.update(changes) # Rolled back per key if the Arduino rejects a command
+        self._queue_commands(label, commands)
+        return True
+
+    def sync_device_state(self):
+        if not self.is_connected: return
+        if READBACK_CAP in self.device_caps:
+            self.set_status("Reading settings back from Arduino...") # Pushes the difference when ALL: arrives
+            self.io.submit(self.transport.query("GET_ALL", "ALL", timeout=self.SYNC_TIMEOUT_MS / 1000),
+                           on_done=self._session_callback(self._on_device_readback), on_error=self._session_callback(self._on_readback_error))
+        else:
+            self.device_mirror.forget(); self._sync_push()
 
-            self.send_command(f"SET_JOY_KEY:{i},{ascii_val1},{ascii_val2}")
-            time.sleep(0.02)
-        
-        self.set_status("Keyboard key settings applied.")
+    def _on_readback_error(self, error):
+        if isinstance(error, serial.SerialException): self._on_transport_error(error); return
+        self.device_mirror.forget(); self._sync_push("Syncing settings to Arduino (no GET_ALL reply, sending everything)")
 
+    def _on_device_readback(self, payload):
+        label = "Syncing settings to Arduino"
+        try: values, joy_keys = decode_profile_payload(payload)
+        except ValueError:
+            self.device_mirror.forget(); label += " (unreadable GET_ALL reply, sending everything)"
+        else:
+            mismatched = self.device_mirror.load_readback(values, joy_keys)
+            if mismatched: label += f" (device differed from the host copy: {', '.join(mismatched)})"
+        if self.is_connected: self._sync_push(label)
 
     def apply_all_settings(self):
         if not self.is_connected:
             messagebox.showwarning("Not Connected", "Connect to Arduino first.", parent=self.root); return
-        self.set_status(f"Applying all settings to Arduino (Mode: {self.current_mode.get()})...")
-        for key, tk_var in self.params_tkvars.items():
-            value_to_send = int(tk_var.get())
-            self.send_param_update(key, value_to_send)
-            time.sleep(0.02)
-        
-        if self.current_mode.get() == "Keyboard":
-            self.apply_keyboard_settings()
-
-        self.set_status("All settings applied to Arduino.")
-        if self.is_calibrating_arduino_mode and hasattr(self, 'pressure_visualizer_canvas'): self._update_pressure_visualizer()
-        if hasattr(self, 'joystick_canvas') and self.tab_view.winfo_exists() and self.tab_view.get() == "Stick Control": self._update_joystick_visualizer()
-
-    def send_param_update(self, param_key, value):
-        self.send_command(f"SET_{param_key}:{value}\n")
-
-    def read_from_arduino(self):
-        while not self.stop_read_thread.is_set():
-            if not self.ser or not self.ser.is_open:
-                break
-            try:
-                if self.ser.in_waiting > 0:
-                    line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        self.root.after(0, self._process_serial_line_on_main_thread, line)
-            except serial.SerialException:
-                self.root.after(0, self.handle_serial_error_disconnect)
-                break
-            except Exception as e:
-                if not self.stop_read_thread.is_set():
-                    print(f"Read thread error: {e}")
-            time.sleep(0.001)
-
-    def _process_serial_line_on_main_thread(self, line):
-        try:
-            if self.is_calibrating_arduino_mode and line.startswith("CALIB_P:"):
-                value = int(line.split(":")[1])
-                self.calibration_current_value_tkvar.set(f"Pressure: {value}")
-                self.pressure_history.append(value)
-                if len(self.pressure_history) > self.max_history_points:
-                    self.pressure_history.pop(0)
-                self._update_pressure_visualizer()
-                if self.calibrating_action_name.get():
-                    self.calibration_samples.append(value)
-
-            elif line.startswith("P:"):
-                if not self.is_calibrating_arduino_mode:
-                    self.current_pressure_tkvar.set(f"Pressure: {line.split(':')[1]}")
-
-            elif line.startswith("JOY:"):
-                parts = line.split(':')[1].split(',')
-                self.joystick_x_centered_tkvar.set(int(parts[0]))
-                self.joystick_y_centered_tkvar.set(int(parts[1]))
-                if hasattr(self, 'tab_view') and self.tab_view.winfo_exists() and self.tab_view.get() == "Stick Control":
-                    self._update_joystick_visualizer()
-
-            elif line.startswith("ACK:") or line.startswith("ERR:") or line.startswith("INFO:"):
-                self.set_status(f"Arduino: {line}")
-        
-        except (IndexError, ValueError, tk.TclError) as e:
-            pass
+        self.push_settings(f"Applying settings to Arduino (Mode: {self.current_mode.get()})", show_errors=self.current_mode.get() == "Keyboard")
+        if self.is_calibrating_arduino_mode: self._request_redraw("pressure")
+        self._request_redraw("joystick")
+
+    def _queue_commands(self, label, commands):
+        if not self.transport: return
+        on_event = self._session_callback(self._on_command_batch_event)
+        self.io.submit(self.transport.send_batch(commands, lambda done, total: self.io.post(on_event, ("progress", label, done, total))),
+                       on_done=lambda result: on_event(("done", label, len(commands)) + result),
+                       on_error=lambda error: on_event(("error", label, str(error))))
+        self.set_status(f"{label}...")
+
+    def _on_command_batch_event(self, event):
+        status, label = event[0], event[1]
+        if status == "progress":
+            self.set_status(f"{label}... ({event[2]}/{event[3]})")
+            return
+        if status == "error":
+            self.device_mirror.forget(); self.set_status(f"Send Error: {event[2]}"); self.handle_serial_error_disconnect()
+            return
+        total, rejected, unanswered = event[2], event[3], event[4]
+        for command, _ in rejected: self.device_mirror.forget(command_state_key(command))
+        if rejected:
+            self.set_status(f"{label}: {len(rejected)} of {total} commands rejected.")
+            messagebox.showwarning("Settings Not Applied", "The Arduino rejected:\n" + "\n".join(reply for _, reply in rejected), parent=self.root)
+        elif unanswered: self.set_status(f"{label}: done, {unanswered} of {total} commands not acknowledged.")
+        else: self.set_status(f"{label}: done ({total} commands).")
+        if label == self._sync_label: self._on_connection_ready()
+
+    def _subscribe_telemetry(self):
+        bus = self.telemetry_bus
+        bus.subscribe("calib_pressure", self._on_calib_sample)
+        bus.subscribe("calib_pressure", self._on_calib_pressure_label, policy="decimate", hz=self.PRESSURE_LABEL_HZ)
+        bus.subscribe("calib_pressure", self._on_live_thresholds, policy="decimate", hz=self.LIVE_THRESHOLDS_HZ)
+        bus.subscribe("pressure", self._on_pressure_label, policy="decimate", hz=self.PRESSURE_LABEL_HZ)
+        bus.subscribe("joystick", self._on_joystick_sample, policy="latest")
+        bus.subscribe("message", self._on_device_message)
+
+    def on_record_toggle(self):
+        if not self.is_connected: return # Takes effect at the next connection
+        if self.record_sessions_tkvar.get(): self._start_recording()
+        else: self._stop_recording()
+
+    def _start_recording(self):
+        if not self.record_sessions_tkvar.get() or self.session_recorder.recording: return
+        try: path = self.session_recorder.start()
+        except OSError as e: print(f"Session recording disabled: {e}"); return
+        self._recorder_subscriptions = [self.telemetry_bus.subscribe(topic, self._record_sample, maxlen=65536) for topic in TOPIC_KINDS]
+        self.recording_status_tkvar.set("\u25CF REC")
+        self.set_status(f"Recording this session to {os.path.dirname(path) or '.'}/ (oldest recordings beyond {self.RECORDINGS_KEEP_MB} MB are deleted).")
+        self._update_telemetry_streams()
+
+    def _record_sample(self, sample):
+        try: self.session_recorder.on_sample(sample)
+        except OSError as e: print(f"Session recording stopped: {e}"); self._stop_recording()
+
+    def _stop_recording(self):
+        subscriptions, self._recorder_subscriptions = self._recorder_subscriptions, []
+        if not subscriptions: return
+        self.telemetry_bus.dispatch() # Hand the recorder what is still queued
+        for subscription in subscriptions: self.telemetry_bus.unsubscribe(subscription)
+        self.recording_status_tkvar.set("")
+        try: self.session_recorder.stop()
+        except OSError as e: print(f"Error closing session recording: {e}")
+        self._update_telemetry_streams()
+
+    def _update_telemetry_streams(self):
+        # Firmware with STREAM_CAP sends only what something here uses (see "Telemetry Streams" in V3.ino): JOY while the
+        # stick visualizer is on screen, P on change for the header readout, both in full while a recording or probe takes every sample
+        if not self.is_connected or not self.transport or STREAM_CAP not in self.device_caps: return
+        everything = bool(self._recorder_subscriptions) or self.latency_probe is not None
+        wanted = {"JOY": "ON" if everything or self._visualizer_visible("joystick") else "OFF",
+                  "P": "ON" if everything else "OFF" if self._window_minimized else f"CHANGE,{self.PRESSURE_STREAM_DELTA}"}
+        commands = [f"STREAM:{kind},{setting}" for kind, setting in wanted.items() if self._stream_settings.get(kind) != setting]
+        if not commands: return
+        self._stream_settings.update(wanted)
+        self.io.submit(self.transport.send_batch(commands), on_error=self._session_callback(self._on_transport_error))
+
+    def start_replay(self, path, speed=1.0, protocol="text"):
+        # Replays a recorder.py file as if the device were sending it; speed None = as fast as the GUI keeps up
+        if self.is_connected or self._replay:
+            messagebox.showwarning("Replay", "Disconnect from the Arduino and stop any running replay first.", parent=self.root); return
+        try: _, records = open_recording(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Replay", f"Could not open {path}: {e}", parent=self.root); return
+        replay = self._replay = SessionReplay(records, self._on_device_record, protocol=protocol, speed=speed)
+        started = time.perf_counter()
+        self.set_status(f"Replaying {os.path.basename(path)} ({len(records)} samples, {f'{speed:g}x' if speed else 'as fast as possible'})...")
+        self.io.submit(replay.run(backlog=lambda: self.telemetry_bus.backlog() > 512),
+                       on_done=lambda n: self._on_replay_finished(replay, f"Replay finished: {n} samples in {time.perf_counter() - started:.1f} s."),
+                       on_error=lambda e: self._on_replay_finished(replay, f"Replay failed: {e}"))
+
+    def stop_replay(self):
+        if self._replay: self._replay.stop(); self._replay = None
+
+    def _on_replay_finished(self, replay, message):
+        if replay is self._replay: self._replay = None
+        self.set_status(message)
+
+    def _on_device_record(self, kind, value): # Called from the transport's loop thread
+        if not self.telemetry_bus.publish(kind, value): self.telemetry_buffer.push(kind, value)
+
+    def _telemetry_pump(self):
+        for kind, value in self.telemetry_buffer.drain():
+            self._process_telemetry_record(kind, value)
+        self.telemetry_bus.dispatch()
+        self.root.after(self.TELEMETRY_PUMP_INTERVAL_MS, self._telemetry_pump)
+
+    def _process_telemetry_record(self, kind, value):
+        if kind == "CONN": self._on_connection_state(*value)
+
+    def _on_calib_sample(self, sample):
+        if not self.is_calibrating_arduino_mode: return
+        if self.latency_probe: self.latency_probe.handled("CALIB_P", sample.value)
+        self.pressure_history.append(sample.value)
+        self._request_redraw("pressure")
+        if self.calibrating_action_name.get(): self.calibration_samples.append(sample.value)
+
+    def _on_calib_pressure_label(self, sample):
+        if self.is_calibrating_arduino_mode: self.calibration_current_value_tkvar.set(f"Pressure: {sample.value}")
+
+    def _on_live_thresholds(self, sample):
+        if not self.is_calibrating_arduino_mode or not self.calibrating_action_name.get(): return
+        captures = {action: list(c) for action, c in self.collected_calibration_data.items()}
+        if self.calibration_samples: captures.setdefault(self.calibrating_action_name.get(), []).append(np.asarray(self.calibration_samples, dtype=np.int32))
+        solution = optimize_thresholds(analyze_captures(captures), margin=self.THRESHOLD_MARGIN, current=self._current_thresholds())
+        text = " | ".join(f"{key} {solution.thresholds[key]}" for key in ("HST", "NMIN", "NMAX", "SPT", "HPT") if key in solution.thresholds)
+        if solution.expected_error is not None: text += f"  (expected misclassification {solution.expected_error:.1%})"
+        self.calibration_live_thresholds_tkvar.set("Live thresholds: " + text)
+
+    def _current_thresholds(self):
+        current = {}
+        for key in ("HST", "NMIN", "NMAX", "SPT", "HPT"):
+            try: current[key] = int(self.params_tkvars[key].get())
+            except (KeyError, tk.TclError, ValueError): current[key] = DEFAULT_SETTINGS[key]
+        return current
+
+    def _on_pressure_label(self, sample):
+        if not self.is_calibrating_arduino_mode: self.current_pressure_tkvar.set(f"Pressure: {sample.value}")
+
+    def _on_joystick_sample(self, sample):
+        if self.latency_probe: self.latency_probe.handled("JOY", sample.value)
+        self.joystick_x_centered_tkvar.set(sample.value[0])
+        self.joystick_y_centered_tkvar.set(sample.value[1])
+        self._request_redraw("joystick")
+
+    def _on_device_message(self, sample):
+        # Only the app writes to the port, so an ACK: that no request() was waiting for still answers one of its own
+        # commands (send_command, or a reply that came after its timeout): batches would flood the status bar with them
+        if sample.value.startswith("ACK:"): return
+        self.set_status(f"Arduino: {sample.value}")
 
     def handle_serial_error_disconnect(self):
-        if self.is_connected: self.toggle_connect()
+        if not self.is_connected: return
+        identity = self._device_identity
+        if not (self.AUTO_RECONNECT and identity):
+            self._end_session("Connection lost."); return
+        self._reconnect = {"identity": identity, "lost_at": time.perf_counter(), "found_at": None, "attempts": 0}
+        self._end_session(f"Controller lost on {identity.device}, waiting for it to come back...",
+                          then=lambda: self._reconnect is not None and self._watch_for_device())
 
     def get_current_settings_dict(self): 
         settings = {key:tk_var.get() for key,tk_var in self.params_tkvars.items()}
@@ -1150,31 +1583,35 @@ class IntegratedHybridApp:
             self.calib_log_text.see(tk.END)
             self.calib_log_text.configure(state=tk.DISABLED)
 
-    def _update_pressure_visualizer(self):
-        if not hasattr(self, 'pressure_visualizer_canvas') or not self.pressure_visualizer_canvas.winfo_exists() or not self.is_calibrating_arduino_mode: return
-        canvas = self.pressure_visualizer_canvas; canvas_bg = self._get_themed_canvas_bg(); canvas.configure(bg=canvas_bg)
-        w = canvas.winfo_width(); h = canvas.winfo_height()
-        if w <=1 or h <=1: self.root.after(50, self._update_pressure_visualizer); return
-        
+    def _invalidate_pressure_static_layer(self, *args):
+        self._pressure_static_key = None
+
+    def _set_max_history_points(self, graph_area_width):
+        self.max_history_points = graph_area_width
+        if self.max_history_points <=0: self.max_history_points = 1
+        self.pressure_history.resize(self.max_history_points)
+
+    def _pressure_graph_geometry(self, h):
+        y_padding = 15
+        graph_height = h - (2 * y_padding)
+        if graph_height <= 0: graph_height = 1
+        total_range = self.PRESSURE_VIS_MAX - self.PRESSURE_VIS_MIN
+        if total_range == 0: total_range = 1
+        return h - y_padding, graph_height / total_range # (y of PRESSURE_VIS_MIN, pixels per pressure unit)
+
+    def _build_pressure_static_layer(self, canvas, w, h):
+        # Background, threshold lines and labels; only rebuilt when size, theme or a threshold changes
+        canvas.configure(bg=self._get_themed_canvas_bg())
+        canvas.delete("all")
         label_area_width = self.pressure_label_area_width; graph_area_x_start = label_area_width 
         graph_area_width = w - label_area_width
         if graph_area_width <=0 : graph_area_width = 1 
-        if abs(self.max_history_points - graph_area_width) > 5 or self.max_history_points <= 1 :
-           self.max_history_points = graph_area_width
-           if self.max_history_points <=0: self.max_history_points = 1
-           
-        canvas.delete("all"); y_padding = 15
+        y_base, y_scale = self._pressure_graph_geometry(h)
         
         def pressure_to_y(pressure_val):
-            graph_height = h - (2 * y_padding)
-            if graph_height <= 0: graph_height = 1
-            total_range = self.PRESSURE_VIS_MAX - self.PRESSURE_VIS_MIN
-            if total_range == 0: total_range = 1
             clamped_val = max(self.PRESSURE_VIS_MIN, min(self.PRESSURE_VIS_MAX, pressure_val))
-            normalized_val = (clamped_val - self.PRESSURE_VIS_MIN) / total_range
-            return (h - y_padding) - (normalized_val * graph_height)
+            return y_base - (clamped_val - self.PRESSURE_VIS_MIN) * y_scale
 
-        text_color = "white" if ctk.get_appearance_mode() == "Dark" else "black"
         current_font = self.font_canvas_threshold_text
         gap_between_text_and_graph = 5
 
@@ -1191,28 +1628,50 @@ class IntegratedHybridApp:
             canvas.create_text(graph_area_x_start - gap_between_text_and_graph, y,
                                 text=name, fill=color, anchor="e", font=current_font)
 
-        if self.pressure_history:
-            points = []
-            current_max_history = max(1, int(self.max_history_points))
-            step_x = graph_area_width / current_max_history if current_max_history > 0 else 0
-            
-            drawable_history = self.pressure_history[-current_max_history:]
-            for i, pressure_val in enumerate(drawable_history):
-                points.extend([graph_area_x_start + (i * step_x), pressure_to_y(pressure_val)])
-            
-            if len(points) >= 4:
-                canvas.create_line(points, fill="cyan", width=2, tags="pressure_line")
+        current_max_history = max(1, int(self.max_history_points))
+        step_x = graph_area_width / current_max_history
+        self._pressure_x_coords = graph_area_x_start + np.arange(current_max_history) * step_x
+        self._pressure_line_id = canvas.create_line(0, 0, 0, 0, fill="cyan", width=2, tags="pressure_line", state="hidden")
+        self._pressure_line_hidden = True
+
+    def _update_pressure_visualizer(self):
+        if not hasattr(self, 'pressure_visualizer_canvas') or not self.pressure_visualizer_canvas.winfo_exists() or not self.is_calibrating_arduino_mode: return
+        canvas = self.pressure_visualizer_canvas
+        w = canvas.winfo_width(); h = canvas.winfo_height()
+        if w <=1 or h <=1: self.root.after(50, self._request_redraw, "pressure"); return
+        
+        graph_area_width = w - self.pressure_label_area_width
+        if graph_area_width <=0 : graph_area_width = 1 
+        if abs(self.max_history_points - graph_area_width) > 5 or self.max_history_points <= 1 :
+           self._set_max_history_points(graph_area_width)
+
+        static_key = (w, h, ctk.get_appearance_mode(), self.max_history_points)
+        if static_key != self._pressure_static_key:
+            self._build_pressure_static_layer(canvas, w, h)
+            self._pressure_static_key = static_key
+
+        n = len(self.pressure_history)
+        if n >= 2:
+            y_base, y_scale = self._pressure_graph_geometry(h)
+            values = np.clip(self.pressure_history.values(), self.PRESSURE_VIS_MIN, self.PRESSURE_VIS_MAX)
+            points = np.empty(2 * n)
+            points[0::2] = self._pressure_x_coords[:n]
+            points[1::2] = y_base - (values - self.PRESSURE_VIS_MIN) * y_scale
+            canvas.coords(self._pressure_line_id, points.tolist())
+            if self._pressure_line_hidden:
+                canvas.itemconfigure(self._pressure_line_id, state="normal"); self._pressure_line_hidden = False
+        if n and self.latency_probe: self.latency_probe.drawn("CALIB_P", self.pressure_history.last())
 
     def start_arduino_calibration_mode(self):
-        if not self.is_connected: messagebox.showwarning("Not Connected", "Connect to Arduino first.", parent=self.root); return
+        if not self.is_connected and not self._replay: messagebox.showwarning("Not Connected", "Connect to Arduino first.", parent=self.root); return
         self.send_command("START_CALIBRATION\n"); self.is_calibrating_arduino_mode = True
         self.start_arduino_calib_button.configure(state=tk.DISABLED); self.stop_arduino_calib_button.configure(state=tk.NORMAL)
         for btn_key in self.action_buttons: self.action_buttons[btn_key].configure(state=tk.NORMAL)
         self._add_to_calib_log("Arduino calibration stream started."); self.calibration_instructions_label.configure(text="Sensor stream active. Select an action.")
-        self.pressure_history = [] ; self._update_pressure_visualizer() 
+        self.pressure_history.clear(); self._invalidate_pressure_static_layer(); self._request_redraw("pressure")
 
     def stop_arduino_calibration_mode(self, silent=False):
-        if not self.is_connected and not silent : return 
+        if not self.is_connected and not self._replay and not silent : return 
         if self.is_calibrating_arduino_mode or silent: self.send_command("STOP_CALIBRATION\n")
         self.is_calibrating_arduino_mode = False
         if hasattr(self, 'start_arduino_calib_button'): 
@@ -1224,7 +1683,8 @@ class IntegratedHybridApp:
             if hasattr(self,'calibration_instructions_label'): self.calibration_instructions_label.configure(text="Click 'Start Sensor Stream'.")
         if hasattr(self, 'pressure_visualizer_canvas') and self.pressure_visualizer_canvas.winfo_exists():
              self.pressure_visualizer_canvas.delete("all") 
-        self.pressure_history = []
+        self._invalidate_pressure_static_layer()
+        self.pressure_history.clear()
 
     def start_collecting_samples(self, action_name):
         if not self.is_calibrating_arduino_mode: messagebox.showinfo("Info", "Start Arduino stream first.", parent=self.root); return
@@ -1240,8 +1700,9 @@ class IntegratedHybridApp:
         self._calibration_collect_job = None 
         action_name = self.calibrating_action_name.get()
         if action_name:
-            self.collected_calibration_data[action_name] = list(self.calibration_samples)
-            self._add_to_calib_log(f"Collected {len(self.calibration_samples)} samples for {action_name}.")
+            captures = self.collected_calibration_data.setdefault(action_name, []) # Every capture counts; Clear Captures starts over
+            captures.append(np.asarray(self.calibration_samples, dtype=np.int32))
+            self._add_to_calib_log(f"Collected {len(self.calibration_samples)} samples for {action_name} (capture {len(captures)}).")
             self.calibrating_action_name.set("")
         if self.is_calibrating_arduino_mode: 
             for btn_key in self.action_buttons: self.action_buttons[btn_key].configure(state=tk.NORMAL)
@@ -1249,52 +1710,49 @@ class IntegratedHybridApp:
             self.calibration_instructions_label.configure(text="Sensor stream active. Select an action or Stop Stream.")
         else: 
             if hasattr(self, 'calibration_instructions_label'): self.calibration_instructions_label.configure(text="Stream stopped. Start stream to record.")
-        if self.collected_calibration_data and hasattr(self, 'analyze_button'): self.analyze_button.configure(state=tk.NORMAL)
+        if self.collected_calibration_data and hasattr(self, 'analyze_button'):
+            self.analyze_button.configure(state=tk.NORMAL); self.clear_captures_button.configure(state=tk.NORMAL)
+
+    def clear_calibration_captures(self):
+        self.collected_calibration_data = {}; self.calibration_live_thresholds_tkvar.set("")
+        self._add_to_calib_log("Captures cleared.")
+        self.analyze_button.configure(state=tk.DISABLED); self.clear_captures_button.configure(state=tk.DISABLED)
 
     def analyze_calibration_data(self):
         if not self.collected_calibration_data: self._add_to_calib_log("No data collected."); return
         self._add_to_calib_log("\n--- Analysis Results ---")
-        stats = {}
-        for action, samples in self.collected_calibration_data.items():
-            if samples: 
-                samples.sort()
-                stable_samples = samples[int(len(samples)*0.1) : int(len(samples)*0.9)]
-                if not stable_samples: stable_samples = samples
-                avg = sum(stable_samples) // len(stable_samples)
-                m_min, m_max = min(samples), max(samples)
-            else: 
-                avg, m_min, m_max = 0,0,0
-            stats[action] = {"avg": avg, "min": m_min, "max": m_max, "count": len(samples)}
-            self._add_to_calib_log(f"'{action}': Avg={avg}, Min={m_min}, Max={m_max} (Count:{len(samples)})")
+        analysis = analyze_captures(self.collected_calibration_data)
+        for action, s in analysis.actions.items():
+            if s is None: self._add_to_calib_log(f"'{action}': no samples."); continue
+            self._add_to_calib_log(f"'{action}': Median={s.median}, MAD={s.mad}, P5-P95={s.percentiles[5]}..{s.percentiles[95]}, "
+                                   f"Min={s.min}, Max={s.max} (Count:{s.count}, {s.captures} capture(s))")
+            if s.outliers: self._add_to_calib_log(f"  {s.outliers} outlier sample(s) far from the median.")
+            for j in s.outlier_captures: self._add_to_calib_log(f"  Capture {j + 1} is unlike the others; consider Clear Captures and recording again.")
+        for overlap in analysis.overlaps:
+            if overlap.flagged:
+                self._add_to_calib_log(f"Warning: '{overlap.lower}' and '{overlap.upper}' overlap by {overlap.overlap:.0%}; the controller may confuse them.")
         
         try:
-            neutral_avg = stats.get("Neutral", {}).get("avg", 0)
-            hard_sip_avg = stats.get("Hard Sip", {}).get("avg", DEFAULT_SETTINGS["HST"])
-            soft_sip_avg = stats.get("Soft Sip", {}).get("avg", DEFAULT_SETTINGS["NMIN"])
-            soft_puff_avg = stats.get("Soft Puff", {}).get("avg", DEFAULT_SETTINGS["SPT"])
-            hard_puff_avg = stats.get("Hard Puff", {}).get("avg", DEFAULT_SETTINGS["HPT"])
-
-            new_nmin = neutral_avg - 15
-            new_nmax = neutral_avg + 15
-            
-            new_sst = min(soft_sip_avg, new_nmin - 5)
-            new_hst = min(hard_sip_avg, new_sst - 10)
-            new_spt = max(soft_puff_avg, new_nmax + 5)
-            new_hpt = max(hard_puff_avg, new_spt + 10)
-
-            suggestions = {"HST": new_hst, "NMIN": new_sst, "NMAX": new_nmax, "SPT": new_spt, "HPT": new_hpt}
+            solution = optimize_thresholds(analysis, margin=self.THRESHOLD_MARGIN, current=self._current_thresholds())
+            suggestions = {key: solution.thresholds[key] for key in ("HST", "NMIN", "NMAX", "SPT", "HPT") if key in solution.thresholds}
             
             self._add_to_calib_log("\n--- Suggested Values ---")
             self._add_to_calib_log(f"These are suggestions. Manually fine-tune in 'Tuner' tab.")
             for key, val in suggestions.items():
                  self._add_to_calib_log(f"{key}: {val}")
+            self._add_to_calib_log("Predicted confusion per threshold:")
+            for b in solution.boundaries:
+                if b.error is None: self._add_to_calib_log(f"  {b.name}: record '{b.lower}' and '{b.upper}' to tune (kept at {b.threshold})."); continue
+                self._add_to_calib_log(f"  {b.name} {b.threshold}: '{b.lower}' read as '{b.upper}' {b.lower_as_upper:.2%}, "
+                                       f"'{b.upper}' read as '{b.lower}' {b.upper_as_lower:.2%} (worst within \u00b1{self.THRESHOLD_MARGIN}: {b.worst_error:.2%})")
+            if solution.expected_error is not None: self._add_to_calib_log(f"Expected misclassification: {solution.expected_error:.2%}")
             
             if messagebox.askyesno("Apply Suggestions?", "Do you want to apply suggested values to the Tuner?\n(NMIN will be set to the Soft Sip Threshold)", parent=self.root):
                 for key, val in suggestions.items():
                     if key in self.params_tkvars:
                         self.params_tkvars[key].set(val)
                 self._add_to_calib_log("Values applied. Go to Tuner and 'Apply to Arduino'.")
-                self._update_pressure_visualizer()
+                self._request_redraw("pressure")
         except Exception as e:
             self._add_to_calib_log(f"Could not generate suggestions. Error: {e}")
 
@@ -1336,8 +1794,13 @@ class IntegratedHybridApp:
             self.root.after_cancel(self._calibration_collect_job); self._calibration_collect_job = None
         if self.is_calibrating_arduino_mode: self.stop_arduino_calibration_mode(silent=True)
         self.trainer_target_active = False
-        self.stop_read_thread.set()
+        if self._connector or self._port_watcher: self._stop_reconnect()
         if self.is_connected: self.toggle_connect() 
+        if self._replay: self.stop_replay()
+        if self._transport_closing: # Let the farewell commands out and the port close before the loop stops
+            try: self._transport_closing.result(timeout=0.5)
+            except Exception as e: print(f"Error closing serial transport: {e!r}")
+        self.io.close()
         self.root.destroy()
 
 if __name__ == "__main__":
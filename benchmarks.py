@@ -0,0 +1,529 @@
+# --- START OF FILE benchmarks.py ---
+#
+# Host-side performance benchmarks. Run without hardware, e.g.:
+#   python benchmarks.py reader --seconds 5
+#   python benchmarks.py reader --json > reader.json
+#   python benchmarks.py protocol
+#   python benchmarks.py latency --rates 66 200 1000 --json > latency.json   (needs a display)
+#   python benchmarks.py pressure-graph --widths 450 1000 2000 4000          (needs a display)
+#   python benchmarks.py replay recordings/session-*.mrec                    (needs a display)
+#   python benchmarks.py sectors                                             (native part needs a C++ compiler)
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+
+import serial
+
+from serial_link import TELEMETRY_DECODERS, encode_frame, parse_telemetry_line
+from virtual_controller import VirtualController
+
+
+# The reader loops `reader` compares: chunked blocking reads (what SerialTransport does
+# without a pollable file descriptor) and the original 1 ms in_waiting poll.
+class SerialLineReader:
+    """Event-driven reader: blocks in read() until bytes arrive (or the port timeout
+    expires), then takes everything that is waiting in one chunk."""
+
+    def __init__(self, ser, protocol="text"):
+        self.ser = ser
+        self.decoder = TELEMETRY_DECODERS[protocol]()
+        self.wakeups = 0
+
+    def read_records(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        self.wakeups += 1
+        if data and self.ser.in_waiting: data += self.ser.read(self.ser.in_waiting)  # Rest of the burst that woke us
+        return self.decoder.feed(data) if data else []
+
+
+class PollingLineReader:
+    """The original reader: poll in_waiting every millisecond and readline() per line.
+    Text protocol only."""
+
+    def __init__(self, ser, protocol="text", poll_interval=0.001):
+        if protocol != "text": raise ValueError("PollingLineReader only reads the text protocol")
+        self.ser = ser
+        self.poll_interval = poll_interval
+        self.wakeups = 0
+
+    def read_records(self):
+        self.wakeups += 1
+        if self.ser.in_waiting > 0:
+            line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+            record = parse_telemetry_line(line) if line else None
+            return [record] if record else []
+        time.sleep(self.poll_interval)
+        return []
+
+
+SERIAL_READERS = {"blocking": SerialLineReader, "polling": PollingLineReader}
+
+
+def _open_pty_pair():
+    master_fd, slave_fd = os.openpty()
+    return master_fd, slave_fd, os.ttyname(slave_fd)
+
+
+def _feed_firmware_stream(master_fd, stop_event, joy_period_s, p_period_s):
+    # Mimics V3.ino in mouse mode: JOY every joy_period_s, P every p_period_s.
+    next_joy = next_p = time.monotonic()
+    i = 0
+    while not stop_event.is_set():
+        now = time.monotonic()
+        if now >= next_joy:
+            os.write(master_fd, f"JOY:{i % 512},{-(i % 512)}\n".encode()); next_joy += joy_period_s; i += 1
+        if now >= next_p:
+            os.write(master_fd, f"P:{i % 200}\n".encode()); next_p += p_period_s
+        time.sleep(max(0.0, min(next_joy, next_p) - time.monotonic()))
+
+
+def bench_reader(mode, stream, seconds):
+    master_fd, slave_fd, slave_name = _open_pty_pair()
+    ser = serial.Serial(slave_name, 115200, timeout=0.1)
+    stop_feed, stop_read = threading.Event(), threading.Event()
+    result = {}
+
+    def reader_thread():
+        reader = SERIAL_READERS[mode](ser)
+        lines = 0
+        cpu_start, wall_start = time.thread_time(), time.perf_counter()
+        while not stop_read.is_set():
+            lines += len(reader.read_records())
+        result.update(cpu_s=time.thread_time() - cpu_start, wall_s=time.perf_counter() - wall_start,
+                      wakeups=reader.wakeups, lines=lines)
+
+    feeder = None
+    if stream == "busy":
+        feeder = threading.Thread(target=_feed_firmware_stream, args=(master_fd, stop_feed, 0.015, 0.050), daemon=True)
+        feeder.start()
+    t = threading.Thread(target=reader_thread, daemon=True); t.start()
+    time.sleep(seconds)
+    stop_feed.set(); stop_read.set(); t.join(); ser.close()
+    if feeder: feeder.join()
+    os.close(master_fd); os.close(slave_fd)
+
+    wall = result["wall_s"]
+    return {"reader": mode, "stream": stream, "seconds": round(wall, 3),
+            "cpu_percent": round(100.0 * result["cpu_s"] / wall, 3),
+            "wakeups_per_s": round(result["wakeups"] / wall, 1),
+            "lines_per_s": round(result["lines"] / wall, 1)}
+
+
+def run_reader(args):
+    results = [bench_reader(mode, stream, args.seconds) for stream in ("idle", "busy") for mode in ("polling", "blocking")]
+    if args.json:
+        print(json.dumps({"benchmark": "reader", "results": results}, indent=2)); return
+    print(f"{'reader':<10}{'stream':<8}{'cpu %':>8}{'wakeups/s':>12}{'lines/s':>10}")
+    for r in results:
+        print(f"{r['reader']:<10}{r['stream']:<8}{r['cpu_percent']:>8.2f}{r['wakeups_per_s']:>12.1f}{r['lines_per_s']:>10.1f}")
+
+
+def _firmware_like_records(n):
+    # Same mix as mouse mode: 10 JOY lines for every 3 P lines.
+    records = []
+    for i in range(n):
+        if i % 13 in (4, 8, 12): records.append(("P", (i * 7) % 400 - 200))
+        else: records.append(("JOY", ((i * 37) % 1024 - 512, (i * 91) % 1024 - 512)))
+    return records
+
+
+def _encode_text(kind, value):
+    if kind == "JOY": return f"JOY:{value[0]},{value[1]}\r\n".encode()
+    return f"{kind}:{value}\r\n".encode()
+
+
+def bench_protocol(protocol, records, chunk_size):
+    if protocol == "text": stream = b"".join(_encode_text(k, v) for k, v in records)
+    else: stream = b"".join(encode_frame(k, v, i) for i, (k, v) in enumerate(records))
+    chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+    decoder = TELEMETRY_DECODERS[protocol]()
+    start = time.perf_counter()
+    decoded = 0
+    for chunk in chunks: decoded += len(decoder.feed(chunk))
+    elapsed = time.perf_counter() - start
+    assert decoded == len(records), f"{protocol}: decoded {decoded} of {len(records)} records"
+    return {"protocol": protocol, "samples": len(records), "bytes_per_sample": round(len(stream) / len(records), 2),
+            "decode_us_per_sample": round(1e6 * elapsed / len(records), 3)}
+
+
+def run_protocol(args):
+    records = _firmware_like_records(args.samples)
+    results = [bench_protocol(p, records, args.chunk_size) for p in ("text", "binary")]
+    if args.json:
+        print(json.dumps({"benchmark": "protocol", "results": results}, indent=2)); return
+    print(f"{'protocol':<10}{'bytes/sample':>14}{'decode us/sample':>18}")
+    for r in results:
+        print(f"{r['protocol']:<10}{r['bytes_per_sample']:>14.2f}{r['decode_us_per_sample']:>18.3f}")
+
+
+def percentiles_ms(samples_s):
+    if not samples_s: return None
+    ordered = sorted(samples_s)
+    def rank(p): return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+    return {"p50": round(1e3 * rank(50), 3), "p95": round(1e3 * rank(95), 3), "p99": round(1e3 * rank(99), 3),
+            "max": round(1e3 * ordered[-1], 3), "count": len(ordered)}
+
+
+class LatencyProbe:
+    """Installed as app.latency_probe. Matches stamped samples from a VirtualController
+    (stamp_samples=True) against the moments the app handles and draws them."""
+
+    def __init__(self, device):
+        self.device = device
+        self.handled_s = []
+        self.drawn_s = []
+        self._awaiting_draw = {}
+
+    @staticmethod
+    def _key(kind, value):
+        return (kind, value[0] if kind == "JOY" else value)
+
+    def handled(self, kind, value):
+        key = self._key(kind, value)
+        sent = self.device.sent_at.get(key)
+        if sent is None: return
+        self.handled_s.append(time.perf_counter() - sent)
+        self._awaiting_draw[key] = sent
+
+    def drawn(self, kind, value):
+        sent = self._awaiting_draw.pop(self._key(kind, value), None)
+        if sent is not None: self.drawn_s.append(time.perf_counter() - sent)
+
+    def reset(self):
+        self.handled_s.clear(); self.drawn_s.clear(); self._awaiting_draw.clear(); self.device.sent_at.clear()
+
+
+def bench_latency_scenario(app, root, scenario, rate_hz, seconds, warmup_s=1.0):
+    from app import FrameStats
+    is_joystick = scenario == "joystick"
+    device = VirtualController(joy_hz=rate_hz if is_joystick else 1.0, p_hz=1.0, calib_hz=rate_hz,
+                               noise=0.0, seed=0, stamp_samples=True)
+    port = device.start()
+    probe = LatencyProbe(device)
+    try:
+        app.port_combo.configure(values=[port]); app.port_combo.set(port)
+        app.toggle_connect()
+        deadline = time.monotonic() + 10.0
+        while app.connection_state not in ("ready", "disconnected") and time.monotonic() < deadline: root.update()
+        if app.connection_state != "ready": raise RuntimeError(f"Could not connect to the virtual controller on {port}")
+        if is_joystick:
+            app.tab_view.set("Stick Control"); app.on_tab_change("Stick Control")
+        else:
+            app.tab_view.set("Calibrate Sensor"); app.on_tab_change("Calibrate Sensor"); app.start_arduino_calibration_mode()
+
+        def run_for(duration_s):
+            done = []
+            root.after(int(duration_s * 1000), lambda: done.append(True))
+            while not done: root.update()
+
+        run_for(warmup_s)
+        kind = "JOY" if is_joystick else "CALIB_P"
+        probe.reset(); app.latency_probe = probe
+        visualizer = "joystick" if is_joystick else "pressure"
+        app.render_stats[visualizer] = FrameStats()
+        sent_before = device.sent_counts.get(kind, 0)
+        run_for(seconds)
+        app.latency_probe = None
+        sent = device.sent_counts.get(kind, 0) - sent_before
+    finally:
+        if app.is_connected: app.toggle_connect()
+        device.close()
+    handled = len(probe.handled_s)
+    return {"scenario": scenario, "rate_hz": rate_hz, "seconds": seconds, "protocol": app.telemetry_protocol,
+            "sent": sent, "handled": handled, "drawn": len(probe.drawn_s),
+            "drop_rate": round(1.0 - handled / sent, 4) if sent else None,
+            "handled_latency_ms": percentiles_ms(probe.handled_s), "drawn_latency_ms": percentiles_ms(probe.drawn_s),
+            "render_fps_cap": app.RENDER_FPS_CAP, "render": app.render_stats[visualizer].summary()}
+
+
+def run_latency(args):
+    import customtkinter as ctk
+    from app import IntegratedHybridApp
+    root = ctk.CTk()
+    app = IntegratedHybridApp(root)
+    app.USE_BINARY_TELEMETRY = args.protocol == "binary"
+    root.update()
+    results = []
+    try:
+        for scenario in args.scenarios:
+            for rate in args.rates:
+                results.append(bench_latency_scenario(app, root, scenario, rate, args.seconds))
+    finally:
+        app.on_closing()
+    if args.json:
+        print(json.dumps({"benchmark": "latency", "results": results}, indent=2)); return
+    print(f"{'scenario':<10}{'rate Hz':>8}{'drop %':>8}  {'handled p50/p95/p99/max ms':<30}{'drawn p50/p95/p99/max ms':<30}{'frames':>8}{'paint p95 ms':>14}")
+    for r in results:
+        cols = []
+        for key in ("handled_latency_ms", "drawn_latency_ms"):
+            p = r[key]
+            cols.append(f"{p['p50']:.1f}/{p['p95']:.1f}/{p['p99']:.1f}/{p['max']:.1f}" if p else "-")
+        drop = f"{100 * r['drop_rate']:.1f}" if r['drop_rate'] is not None else "-"
+        print(f"{r['scenario']:<10}{r['rate_hz']:>8.0f}{drop:>8}  {cols[0]:<30}{cols[1]:<30}{r['render']['frames']:>8}{r['render']['p95_ms']:>14.2f}")
+
+
+class _LegacyPressureGraph:
+    # The calibration graph as it was before PressureHistory: list history with pop(0) and
+    # delete("all") plus a full rebuild for every CALIB_P sample.
+    def __init__(self, canvas, app):
+        self.canvas, self.app, self.history = canvas, app, []
+
+    def add_sample(self, value):
+        app, canvas = self.app, self.canvas
+        self.history.append(value)
+        w = canvas.winfo_width(); h = canvas.winfo_height()
+        max_points = max(1, w - app.pressure_label_area_width)
+        if len(self.history) > max_points: self.history.pop(0)
+        canvas.configure(bg=app._get_themed_canvas_bg())
+        canvas.delete("all"); y_padding = 15
+        def pressure_to_y(pressure_val):
+            graph_height = max(1, h - (2 * y_padding))
+            clamped_val = max(app.PRESSURE_VIS_MIN, min(app.PRESSURE_VIS_MAX, pressure_val))
+            return (h - y_padding) - ((clamped_val - app.PRESSURE_VIS_MIN) / (app.PRESSURE_VIS_MAX - app.PRESSURE_VIS_MIN) * graph_height)
+        x0 = app.pressure_label_area_width
+        for name, color in (("HPT", "red"), ("SPT", "orange"), ("NMAX", "gray60"), ("NMIN", "gray60"), ("HST", "deep sky blue")):
+            y = pressure_to_y(app.params_tkvars[name].get())
+            canvas.create_line(x0, y, w, y, fill=color, width=1, dash=(6, 3), tags="threshold_line")
+            canvas.create_text(x0 - 5, y, text=name, fill=color, anchor="e", font=app.font_canvas_threshold_text)
+        step_x = (w - x0) / max_points
+        points = []
+        for i, pressure_val in enumerate(self.history[-max_points:]):
+            points.extend([x0 + (i * step_x), pressure_to_y(pressure_val)])
+        if len(points) >= 4: canvas.create_line(points, fill="cyan", width=2, tags="pressure_line")
+
+
+def bench_pressure_graph(app, root, width, samples):
+    import tkinter as tk
+    window = tk.Toplevel(root); window.geometry(f"{width}x450")
+    canvas = tk.Canvas(window, width=width, height=450, highlightthickness=0); canvas.pack(fill=tk.BOTH, expand=True)
+    root.update()
+    values = [int(300 * math.sin(i / 20.0)) for i in range(samples)]
+    result = {"width_px": width, "samples": samples}
+
+    legacy = _LegacyPressureGraph(canvas, app)
+    start = time.perf_counter()
+    for v in values: legacy.add_sample(v); canvas.update_idletasks()
+    result["legacy_us_per_sample"] = round(1e6 * (time.perf_counter() - start) / samples, 1)
+
+    canvas.delete("all")
+    saved_canvas, saved_calibrating = app.pressure_visualizer_canvas, app.is_calibrating_arduino_mode
+    app.pressure_visualizer_canvas, app.is_calibrating_arduino_mode = canvas, True
+    app.pressure_history.clear(); app._invalidate_pressure_static_layer()
+    try:
+        start = time.perf_counter()
+        for v in values:  # Paint every sample, as the legacy path did, rather than leaving it to the frame-capped scheduler
+            app.telemetry_bus.publish("CALIB_P", v); app.telemetry_bus.dispatch(); app._update_pressure_visualizer(); canvas.update_idletasks()
+        result["retained_us_per_sample"] = round(1e6 * (time.perf_counter() - start) / samples, 1)
+    finally:
+        app.pressure_visualizer_canvas, app.is_calibrating_arduino_mode = saved_canvas, saved_calibrating
+        app.pressure_history.clear(); app._invalidate_pressure_static_layer()
+        window.destroy()
+    result["speedup"] = round(result["legacy_us_per_sample"] / result["retained_us_per_sample"], 2)
+    return result
+
+
+def run_pressure_graph(args):
+    import customtkinter as ctk
+    from app import IntegratedHybridApp
+    root = ctk.CTk()
+    app = IntegratedHybridApp(root)
+    root.update()
+    try:
+        results = [bench_pressure_graph(app, root, width, args.samples) for width in args.widths]
+    finally:
+        app.on_closing()
+    if args.json:
+        print(json.dumps({"benchmark": "pressure-graph", "results": results}, indent=2)); return
+    print(f"{'width px':>9}{'legacy us':>12}{'retained us':>13}{'speedup':>9}")
+    for r in results:
+        print(f"{r['width_px']:>9}{r['legacy_us_per_sample']:>12.1f}{r['retained_us_per_sample']:>13.1f}{r['speedup']:>9.2f}")
+
+
+def bench_replay(app, root, path, protocol):
+    from app import FrameStats
+    from recorder import RECORD_KINDS, open_recording
+    from replay import SessionReplay
+    _, records = open_recording(path)
+    replay = SessionReplay(records, app._on_device_record, protocol=protocol, speed=None)
+    calibration = bool((records["kind"] == RECORD_KINDS["CALIB_P"]).any())
+    visualizer, tab = ("pressure", "Calibrate Sensor") if calibration else ("joystick", "Stick Control")
+    app._replay = replay
+    app.tab_view.set(tab); app.on_tab_change(tab)
+    if calibration: app.start_arduino_calibration_mode()
+    root.update()
+    app.render_stats[visualizer] = FrameStats()
+    dropped_before = sum(s["dropped"] for s in app.telemetry_bus.stats()["subscribers"])
+    start = time.perf_counter()
+    try:
+        for _, data in replay.chunks():
+            replay.feed(data); app.telemetry_bus.dispatch(); root.update()
+        elapsed = time.perf_counter() - start
+    finally:
+        if calibration: app.stop_arduino_calibration_mode()
+        app._replay = None
+    recorded_s = float(records["t"][-1] - records["t"][0]) if len(records) > 1 else 0.0
+    return {"file": os.path.basename(path), "protocol": protocol, "records": len(records), "replayed": replay.replayed,
+            "recorded_s": round(recorded_s, 3), "replay_s": round(elapsed, 3),
+            "samples_per_s": round(replay.replayed / elapsed) if elapsed else None,
+            "speedup": round(recorded_s / elapsed, 1) if elapsed else None,
+            "dropped": sum(s["dropped"] for s in app.telemetry_bus.stats()["subscribers"]) - dropped_before,
+            "visualizer": visualizer, "render": app.render_stats[visualizer].summary()}
+
+
+def run_replay(args):
+    import customtkinter as ctk
+    from app import IntegratedHybridApp
+    root = ctk.CTk()
+    app = IntegratedHybridApp(root)
+    app.record_sessions_tkvar.set(False)
+    root.update()
+    try:
+        results = [bench_replay(app, root, path, args.protocol) for path in args.paths]
+    finally:
+        app.on_closing()
+    if args.json:
+        print(json.dumps({"benchmark": "replay", "results": results}, indent=2)); return
+    print(f"{'file':<36}{'records':>9}{'recorded s':>12}{'replay s':>10}{'samples/s':>11}{'dropped':>9}{'frames':>8}{'paint p95 ms':>14}")
+    for r in results:
+        print(f"{r['file']:<36}{r['records']:>9}{r['recorded_s']:>12.1f}{r['replay_s']:>10.2f}{r['samples_per_s'] or 0:>11}"
+              f"{r['dropped']:>9}{r['render']['frames']:>8}{r['render']['p95_ms']:>14.2f}")
+
+
+def _legacy_active_sector(joy_x, joy_y, num_sectors, jmt):
+    # The Stick Control highlight as it was before firmware_sim.JoystickSectors
+    slice_angle_deg = 360.0 / num_sectors
+    magnitude_percent = (math.sqrt(joy_x**2 + joy_y**2) / 512.0) * 100.0
+    if magnitude_percent <= jmt: return -1
+    angle_deg = math.degrees(math.atan2(-joy_y, joy_x))
+    angle_deg += slice_angle_deg / 2.0
+    if angle_deg < 0: angle_deg += 360
+    return int(angle_deg / slice_angle_deg)
+
+
+# The sector decision of updateKeyboardJoystick() before joystick_logic.h, in float as on
+# the board, against joystickSector(), over the same deflections. Prints ns per call.
+SECTOR_BENCH_SOURCE = r"""
+#include <math.h>
+#include <stdio.h>
+#include <chrono>
+#include "joystick_logic.h"
+
+static int floatSector(int joyX, int joyY, int sections, int jmt) {
+  float magnitude = sqrtf(powf(joyX, 2) + powf(joyY, 2));
+  if ((magnitude / 512.0f) * 100.0f > jmt) {
+    float slice_angle = 360.0f / sections;
+    float angle = atan2f((float)-joyY, (float)joyX) * 180.0f / (float)M_PI;
+    angle += slice_angle / 2.0f;
+    if (angle < 0) angle += 360.0f;
+    if (angle >= 360.0f) angle -= 360.0f;
+    return (int)floorf(angle / slice_angle);
+  }
+  return -1;
+}
+
+int main() {
+  int sections, jmt, n;
+  if (scanf("%d %d %d", &sections, &jmt, &n) != 3) return 2;
+  static int16_t xs[1 << 16], ys[1 << 16];
+  for (int i = 0; i < (1 << 16); i++) { xs[i] = (int16_t)((i * 7919) % 1024 - 512); ys[i] = (int16_t)((i * 104729) % 1024 - 512); }
+  JoystickSectors s; joystickSectorsInit(&s, (int16_t)sections); joystickSectorsSetThreshold(&s, (int16_t)jmt);
+  volatile long sink = 0;
+  long mismatched = 0;
+  for (int i = 0; i < (1 << 16); i++) mismatched += floatSector(xs[i], ys[i], sections, jmt) != joystickSector(&s, xs[i], ys[i]);
+  auto t0 = std::chrono::steady_clock::now();
+  for (int i = 0; i < n; i++) sink += floatSector(xs[i & 0xFFFF], ys[i & 0xFFFF], sections, jmt);
+  auto t1 = std::chrono::steady_clock::now();
+  for (int i = 0; i < n; i++) sink += joystickSector(&s, xs[i & 0xFFFF], ys[i & 0xFFFF]);
+  auto t2 = std::chrono::steady_clock::now();
+  printf("%.2f %.2f %ld\n", std::chrono::duration<double, std::nano>(t1 - t0).count() / n,
+         std::chrono::duration<double, std::nano>(t2 - t1).count() / n, mismatched);
+  return 0;
+}
+"""
+
+
+def bench_sectors(num_sectors, jmt, calls):
+    import tempfile
+    from firmware_sim import JoystickSectors, build_native_driver, native_compiler
+    import subprocess
+    deflections = [((i * 7919) % 1024 - 512, (i * 104729) % 1024 - 512) for i in range(calls)]
+    result = {"sectors": num_sectors, "jmt": jmt}
+    start = time.perf_counter()
+    for x, y in deflections: _legacy_active_sector(x, y, num_sectors, jmt)
+    result["python_float_us"] = round(1e6 * (time.perf_counter() - start) / calls, 3)
+    table = JoystickSectors()
+    start = time.perf_counter()
+    for x, y in deflections: table.sector(x, y, num_sectors, jmt)
+    result["python_table_us"] = round(1e6 * (time.perf_counter() - start) / calls, 3)
+    compiler = native_compiler()
+    if compiler:
+        with tempfile.TemporaryDirectory() as directory:
+            binary = build_native_driver(directory, compiler, SECTOR_BENCH_SOURCE, "sector_bench")
+            out = subprocess.run([binary], input=f"{num_sectors} {jmt} {calls * 100}\n", capture_output=True, text=True, check=True).stdout.split()
+        result["native_float_ns"], result["native_table_ns"], result["native_mismatched"] = float(out[0]), float(out[1]), int(out[2])
+    return result
+
+
+def run_sectors(args):
+    results = [bench_sectors(n, args.jmt, args.calls) for n in args.sectors]
+    if args.json:
+        print(json.dumps({"benchmark": "sectors", "results": results}, indent=2)); return
+    print(f"{'sectors':>8}{'py float us':>13}{'py table us':>13}{'C float ns':>12}{'C table ns':>12}{'C differ':>10}")
+    for r in results:
+        native = (f"{r['native_float_ns']:>12.1f}{r['native_table_ns']:>12.1f}{r['native_mismatched']:>10}" if "native_float_ns" in r
+                  else f"{'-':>12}{'-':>12}{'-':>10}")
+        print(f"{r['sectors']:>8}{r['python_float_us']:>13.3f}{r['python_table_us']:>13.3f}{native}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host-side benchmarks for the Mouth-Operated Mouse app.")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("reader", help="CPU use and wake-ups of the serial reader loops on an idle and a busy stream.")
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    p.set_defaults(func=run_reader)
+
+    p = sub.add_parser("protocol", help="USB bytes and host decode cost per sample, text vs binary telemetry.")
+    p.add_argument("--samples", type=int, default=200000)
+    p.add_argument("--chunk-size", type=int, default=64, help="Bytes handed to the decoder per read (USB full-speed packet is 64).")
+    p.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    p.set_defaults(func=run_protocol)
+
+    p = sub.add_parser("latency", help="Device-sample-to-canvas latency of the Stick Control and Calibrate Sensor visualizers.")
+    p.add_argument("--rates", type=float, nargs="+", default=[1000.0 / 15, 200.0, 1000.0], help="Input rates in Hz.")
+    p.add_argument("--scenarios", nargs="+", choices=["joystick", "pressure"], default=["joystick", "pressure"])
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--protocol", choices=["text", "binary"], default="text")
+    p.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    p.set_defaults(func=run_latency)
+
+    p = sub.add_parser("pressure-graph", help="Per-sample cost of the calibration pressure graph, old full redraw vs retained polyline.")
+    p.add_argument("--widths", type=int, nargs="+", default=[450, 1000, 2000, 4000])
+    p.add_argument("--samples", type=int, default=2000)
+    p.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    p.set_defaults(func=run_pressure_graph)
+
+    p = sub.add_parser("replay", help="Replay recordings flat out through the app's live input path and visualizers.")
+    p.add_argument("paths", nargs="+", help="Recordings written by the app (recordings/session-*.mrec)")
+    p.add_argument("--protocol", choices=["text", "binary"], default="text")
+    p.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    p.set_defaults(func=run_replay)
+
+    p = sub.add_parser("sectors", help="Keyboard-mode sector lookup per call, float code vs joystick_logic.h table, in Python and native C++.")
+    p.add_argument("--sectors", type=int, nargs="+", default=[4, 8, 16])
+    p.add_argument("--jmt", type=int, default=10)
+    p.add_argument("--calls", type=int, default=200000)
+    p.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    p.set_defaults(func=run_sectors)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
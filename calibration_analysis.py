@@ -0,0 +1,194 @@
+# --- START OF FILE calibration_analysis.py ---
+#
+# Robust statistics for labelled calibration captures (Calibrate Sensor tab). Pressure
+# readings are integers, so each action's distribution is kept as an integer histogram
+# built with one np.bincount over every sample of every capture: median, MAD, percentiles,
+# outlier counts and the overlap between neighbouring actions all come from cumulative
+# sums of that table, with no sorting. A million samples take about 30 ms.
+
+from collections import namedtuple
+
+import numpy as np
+
+# Calibration actions from the strongest sip to the strongest puff.
+ACTION_ORDER = ("Hard Sip", "Soft Sip", "Neutral", "Soft Puff", "Hard Puff")
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+MAD_TO_SIGMA = 1.4826  # MAD of a normal distribution times this is its standard deviation
+
+ActionStats = namedtuple("ActionStats", "action count captures median mad mean min max percentiles histogram "
+                                        "outliers outlier_captures")
+ActionOverlap = namedtuple("ActionOverlap", "lower upper overlap flagged")
+CalibrationAnalysis = namedtuple("CalibrationAnalysis", "actions overlaps edges value_min counts")
+
+
+def _as_captures(samples):
+    """One capture (a flat sequence of samples) or a list of them -> list of int arrays."""
+    if isinstance(samples, np.ndarray) and samples.ndim == 1: return [samples]
+    samples = list(samples)
+    if samples and np.ndim(samples[0]) == 0: return [np.asarray(samples)]
+    return [np.asarray(capture) for capture in samples]
+
+
+def _ranks(cumulative, totals, fractions):
+    """Nearest-rank quantiles: for each row of `cumulative` (k x bins) and each fraction,
+    the first bin whose cumulative count reaches ceil(fraction * total)."""
+    targets = np.maximum(1, np.ceil(totals[:, None] * np.asarray(fractions)[None, :]))
+    return (cumulative[:, None, :] < targets[:, :, None]).sum(axis=2)
+
+
+def analyze_captures(captures, bins=64, outlier_z=3.5, overlap_limit=0.05, order=ACTION_ORDER):
+    """captures: {action: one capture or a list of captures}; a capture is any sequence or
+    array of integer samples (lists, NumPy arrays, slices of a recorder memmap).
+
+    Per action: count, number of captures, median, MAD, mean, min, max, PERCENTILES, a
+    histogram over `bins` bins shared by all actions (`edges`), the number of samples whose
+    robust z-score |x - median| / (MAD_TO_SIGMA * MAD) exceeds `outlier_z`, and the indices of
+    captures whose own median is that far from the action's. Actions next to each other
+    in `order` are flagged when more than `overlap_limit` of their distributions coincide.
+    """
+    actions = [a for a in order if a in captures] + [a for a in captures if a not in order]
+    parts, action_idx, capture_idx, capture_owner = [], [], [], []
+    for i, action in enumerate(actions):
+        for capture in _as_captures(captures[action]):
+            capture = np.asarray(capture, dtype=np.int64).ravel()
+            parts.append(capture)
+            action_idx.append(np.full(len(capture), i, dtype=np.int64))
+            capture_idx.append(np.full(len(capture), len(capture_owner), dtype=np.int64))
+            capture_owner.append(i)
+    values = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+    if not len(values):
+        return CalibrationAnalysis({a: None for a in actions}, [], np.zeros(bins + 1), 0, np.zeros((len(actions), 0), dtype=np.int64))
+    action_idx = np.concatenate(action_idx); capture_idx = np.concatenate(capture_idx)
+    capture_owner = np.asarray(capture_owner)
+
+    value_min = int(values.min()); width = int(values.max()) - value_min + 1
+    offsets = values - value_min
+    k, n_captures = len(actions), len(capture_owner)
+    counts = np.bincount(action_idx * width + offsets, minlength=k * width).reshape(k, width)
+    totals = counts.sum(axis=1)
+    cumulative = counts.cumsum(axis=1)
+    ranks = _ranks(cumulative, totals, [p / 100 for p in PERCENTILES])
+    # An action whose captures are all empty ranks past the last bin; keep its median on the
+    # grid so the deviation histogram below stays in range (its stats come out as None)
+    medians = np.where(totals > 0, ranks[:, PERCENTILES.index(50)], 0)
+
+    # MAD: nearest-rank median of |x - median| from a histogram of the deviations
+    grid = np.arange(width)
+    deviations = np.abs(grid[None, :] - medians[:, None])
+    dev_counts = np.zeros((k, width), dtype=np.int64)
+    np.add.at(dev_counts, (np.repeat(np.arange(k), width), deviations.ravel()), counts.ravel())
+    mads = _ranks(dev_counts.cumsum(axis=1), totals, [0.5])[:, 0]
+    scale = np.maximum(mads, 1) * MAD_TO_SIGMA  # Flat captures (MAD 0) still get a 1-count tolerance
+    outliers = (counts * (deviations > outlier_z * scale[:, None])).sum(axis=1)
+    sums = (counts * grid[None, :]).sum(axis=1)
+
+    # Capture medians, to flag a capture that was recorded wrongly (breathed at the wrong time)
+    capture_counts = np.bincount(capture_idx * width + offsets, minlength=n_captures * width).reshape(n_captures, width)
+    capture_medians = _ranks(capture_counts.cumsum(axis=1), capture_counts.sum(axis=1), [0.5])[:, 0]
+    capture_flagged = (np.abs(capture_medians - medians[capture_owner]) > outlier_z * scale[capture_owner]) & (capture_counts.sum(axis=1) > 0)
+
+    edges = np.linspace(value_min, value_min + width, bins + 1)
+    bin_of_value = np.minimum(((grid + 0.5) * bins / width).astype(np.int64), bins - 1)
+    histograms = np.zeros((k, bins), dtype=np.int64)
+    np.add.at(histograms, (slice(None), bin_of_value), counts)
+
+    stats = {}
+    for i, action in enumerate(actions):
+        if not totals[i]:
+            stats[action] = None; continue
+        mine = np.flatnonzero(capture_owner == i)
+        nonzero = np.flatnonzero(counts[i])
+        stats[action] = ActionStats(
+            action, int(totals[i]), len(mine), int(medians[i]) + value_min, int(mads[i]), float(sums[i] / totals[i]) + value_min,
+            int(nonzero[0]) + value_min, int(nonzero[-1]) + value_min,
+            {p: int(r) + value_min for p, r in zip(PERCENTILES, ranks[i])}, histograms[i],
+            int(outliers[i]), [int(j) for j, bad in enumerate(capture_flagged[mine]) if bad])
+
+    overlaps = []
+    present = [i for i, a in enumerate(actions) if a in order and totals[i]]
+    for lower, upper in zip(present, present[1:]):
+        shared = np.minimum(counts[lower] / totals[lower], counts[upper] / totals[upper]).sum()
+        overlaps.append(ActionOverlap(actions[lower], actions[upper], float(shared), bool(shared > overlap_limit)))
+    return CalibrationAnalysis(stats, overlaps, edges, value_min, counts)
+
+
+# Thresholds between neighbouring actions, as V3.ino applies them to the averaged pressure:
+# HST and NMIN belong to the sip side (pressure <= threshold), SPT and HPT to the puff side
+# (pressure >= threshold). NMAX is not used for triggering; the app only draws it.
+BOUNDARIES = (("HST", "Hard Sip", "Soft Sip"), ("NMIN", "Soft Sip", "Neutral"),
+              ("SPT", "Neutral", "Soft Puff"), ("HPT", "Soft Puff", "Hard Puff"))
+SIP_SIDE_THRESHOLDS = ("HST", "NMIN")
+
+# lower_as_upper: share of the lower action's samples that land on the upper side, and the reverse.
+BoundaryReport = namedtuple("BoundaryReport", "name lower upper threshold lower_as_upper upper_as_lower error worst_error")
+ThresholdSolution = namedtuple("ThresholdSolution", "thresholds boundaries expected_error")
+
+
+def _smoothed_cdfs(analysis, pad):
+    """Per-action CDFs over the analysis grid widened by `pad` on each side. Each histogram is
+    smoothed with a Gaussian kernel (Silverman's bandwidth from the MAD) so that a few
+    hundred samples still give non-zero tail estimates instead of a hard edge."""
+    counts = analysis.counts
+    k, width = counts.shape
+    cdfs = np.zeros((k, width + 2 * pad))
+    for i, action in enumerate(analysis.actions):
+        stats = analysis.actions[action]
+        if stats is None: continue
+        sigma = max(1.0, stats.mad * MAD_TO_SIGMA)
+        bandwidth = max(1.0, 0.9 * sigma * stats.count ** -0.2)
+        half = int(np.ceil(4 * bandwidth))
+        kernel = np.exp(-0.5 * (np.arange(-half, half + 1) / bandwidth) ** 2)
+        row = np.zeros(width + 2 * pad + 2 * half)
+        row[pad + half:pad + half + width] = counts[i]
+        density = np.convolve(row, kernel / kernel.sum(), mode="valid")
+        cdfs[i] = np.clip(np.cumsum(density) / density.sum(), 0.0, 1.0)
+    return cdfs
+
+
+def optimize_thresholds(analysis, margin=10, current=None):
+    """Picks HST, NMIN, SPT and HPT from a CalibrationAnalysis so that each minimises the
+    expected misclassification between its two neighbouring actions (equal weight on either
+    kind of mistake) both where it is and in the worst case over it moving by up to `margin`.
+    Among equally good thresholds the one in the middle, furthest from both actions, wins.
+    Boundaries with an action missing keep their value from `current`. NMAX is put at the
+    top of the neutral band (its 99th percentile), below SPT.
+
+    Only array work on the analysis histograms, so it is cheap enough to rerun as samples arrive.
+    """
+    current = current or {}
+    pad = margin + 1
+    cdfs = _smoothed_cdfs(analysis, pad)
+    row_of = {action: i for i, action in enumerate(analysis.actions)}
+    # Grid point j stands for pressure value_min - pad + j; below(t) = CDF at t = share with pressure <= t
+    base = analysis.value_min - pad
+    thresholds, reports, errors = {}, [], []
+    for name, lower, upper in BOUNDARIES:
+        if analysis.actions.get(lower) is None or analysis.actions.get(upper) is None:
+            if name in current: thresholds[name] = int(current[name])
+            reports.append(BoundaryReport(name, lower, upper, thresholds.get(name), None, None, None, None)); continue
+        below_lower, below_upper = cdfs[row_of[lower]], cdfs[row_of[upper]]
+        error = (1.0 - below_lower) + below_upper  # t as the last value on the lower side
+        windows = np.lib.stride_tricks.sliding_window_view(np.pad(error, margin, mode="edge"), 2 * margin + 1)
+        worst = windows.max(axis=1)
+        score = error + worst  # The worst case alone goes flat when the actions are closer than the margin
+        best = np.flatnonzero(score <= score.min() + 1e-12)
+        j = int(best[len(best) // 2])
+        threshold = base + j if name in SIP_SIDE_THRESHOLDS else base + j + 1
+        thresholds[name] = threshold
+        reports.append(BoundaryReport(name, lower, upper, threshold, float(1.0 - below_lower[j]), float(below_upper[j]),
+                                      float(error[j]), float(worst[j])))
+        errors.append(float(error[j]))
+
+    order = [name for name in ("HST", "NMIN", "SPT", "HPT") if name in thresholds]
+    for previous, name in zip(order, order[1:]):  # Heavily overlapping actions can cross; keep the firmware's order
+        if thresholds[name] <= thresholds[previous]: thresholds[name] = thresholds[previous] + 1
+    neutral = analysis.actions.get("Neutral")
+    if neutral is not None:
+        nmax = neutral.percentiles[99]
+        if "SPT" in thresholds: nmax = min(nmax, thresholds["SPT"] - 1)
+        if "NMIN" in thresholds: nmax = max(nmax, thresholds["NMIN"] + 1)
+        thresholds["NMAX"] = nmax
+    elif "NMAX" in current: thresholds["NMAX"] = int(current["NMAX"])
+    present = sum(1 for a in ACTION_ORDER if analysis.actions.get(a) is not None)
+    expected = sum(errors) / present if present else None
+    return ThresholdSolution(thresholds, reports, expected)
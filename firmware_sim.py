@@ -0,0 +1,985 @@
+# --- START OF FILE firmware_sim.py ---
+#
+# Offline model of the V3.ino pressure path, with the board's integer arithmetic:
+# samplePressure() sensitivity scaling, the sliding-window average of pressure_logic.h
+# (SET_PFW samples) and its mouse and keyboard state machines, run on every 5 ms tick. It
+# turns centred raw ADC readings into the exact click, scroll and key events the board
+# would have sent, and counts those events for a whole grid of thresholds at once.
+# updateMouseJoystick() is modelled too: a JOY trace becomes the cursor path the board
+# would have produced, for many JDZ/CSP pairs at once; so is the keyboard-mode sector
+# lookup of joystick_logic.h, which the app uses for its Stick Control highlight.
+#   python firmware_sim.py check                                       parity with a line-by-line port, pressure_logic.h and joystick_logic.h
+#   python firmware_sim.py events recordings/session-....mrec --hpt 250
+#   python firmware_sim.py grid recordings/session-....mrec --spt 60 140 10 --hpt 150 350 25 > grid.csv
+#   python firmware_sim.py grid --script demo.json --minutes 60 --pfw 1 20 1 --hpt 150 350 25
+#   python firmware_sim.py cursor recordings/session-....mrec --jdz 10 20 30 --csp 5 10 20
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from itertools import product
+
+import numpy as np
+
+SAMPLE_PERIOD_MS = 5
+PRESSURE_REPORT_TICKS = 10  # P: telemetry carries every 10th filtered value
+INPUT_UPDATE_PERIOD_MS = 15
+PRESSURE_WINDOW_MAX = 32    # pressure_logic.h
+SCROLL_REPEAT_TICKS = 10
+
+PRESSURE_DEFAULTS = {
+    "HST": -200, "NMIN": -100, "SPT": 100, "HPT": 200, "SIP_SENS": 100, "PUFF_SENS": 100, "PFW": 10,
+    "KEY_HPT": ord('f'), "KEY_SPT": ord('r'), "KEY_HST": ord('e'), "KEY_SST": ord('q'),
+}
+THRESHOLDS = ("HST", "NMIN", "SPT", "HPT")
+SIGNAL_PARAMS = ("SIP_SENS", "PUFF_SENS", "PFW")  # These change the filtered pressure itself
+
+# One row per HID call. scroll: arg is the wheel step (+1 puff, -1 sip); key_*: arg is the key code.
+EVENTS = ("press_left", "release_left", "press_right", "release_right", "scroll", "key_press", "key_release")
+EVENT_CODES = {name: code for code, name in enumerate(EVENTS)}
+EVENT_DTYPE = np.dtype([("tick", "<i8"), ("t_ms", "<i8"), ("event", "u1"), ("arg", "<i2")])
+
+# Counts per parameter set from grid_counts(), in the order the firmware makes the calls.
+COUNT_FIELDS = {"mouse": ("left_presses", "right_presses", "scroll_up", "scroll_down"),
+                "keyboard": ("hpt_presses", "spt_presses", "hst_presses", "sst_presses")}
+
+
+def _c_int16(values):
+    """Stores into an AVR int (16 bits), wrapping like the board does."""
+    return ((values + 32768) & 0xFFFF) - 32768
+
+
+def _c_div(values, divisor):
+    """C integer division: truncates toward zero (NumPy's // floors)."""
+    quotient = np.abs(values) // np.abs(divisor)
+    return np.where((values < 0) != (np.asarray(divisor) < 0), -quotient, quotient)
+
+
+def _c_div_int(value, divisor):
+    quotient = abs(value) // abs(divisor)
+    return -quotient if (value < 0) != (divisor < 0) else quotient
+
+
+def tick_time_ms(ticks):
+    """When the sample of tick k is taken, counted from the first sample."""
+    return np.asarray(ticks) * SAMPLE_PERIOD_MS
+
+
+def _window(pfw):
+    return min(max(int(pfw), 1), PRESSURE_WINDOW_MAX)  # pressureFilterInit() clamps the same way
+
+
+def scale_pressure(raw, sip_sens=100, puff_sens=100):
+    raw = np.asarray(raw, dtype=np.int64)
+    return _c_int16(_c_div(raw * np.where(raw < 0, sip_sens, puff_sens), 100))
+
+
+def sliding_average(scaled, window=PRESSURE_DEFAULTS["PFW"]):
+    """pressureFilterAdd() on every sample from a freshly initialised filter: the mean of the
+    last `window` samples (of all of them during the first window - 1), truncated toward zero."""
+    window = _window(window)
+    scaled = np.asarray(scaled, dtype=np.int64)
+    sums = np.cumsum(scaled)
+    sums[window:] = sums[window:] - sums[:-window]
+    return _c_int16(_c_div(sums, np.minimum(np.arange(1, len(scaled) + 1), window)))
+
+
+def firmware_pressure(raw, params=None):
+    """The filtered pressure the state machines see, one value per raw reading."""
+    p = dict(PRESSURE_DEFAULTS, **(params or {}))
+    return sliding_average(scale_pressure(raw, p["SIP_SENS"], p["PUFF_SENS"]), p["PFW"])
+
+
+def reported_pressure(pressure):
+    """The filtered values loop() sends as P: telemetry."""
+    return np.asarray(pressure)[PRESSURE_REPORT_TICKS - 1::PRESSURE_REPORT_TICKS]
+
+
+def _held_levels(pressure, p, mode):
+    """[(held, arg)] in the order the firmware updates them; every button and key is held
+    exactly while its condition is true, so the events are the edges of these arrays."""
+    hst, nmin, spt, hpt = (p[name] for name in THRESHOLDS)
+    hard_puff, hard_sip = pressure >= hpt, pressure <= hst
+    soft_puff, soft_sip = (pressure >= spt) & (pressure < hpt), (pressure <= nmin) & (pressure > hst)
+    if mode == "mouse": return [(hard_puff, 0), (hard_sip, 0)], soft_puff, soft_sip & ~soft_puff
+    return [(hard_puff, p["KEY_HPT"]), (soft_puff, p["KEY_SPT"]), (hard_sip, p["KEY_HST"]), (soft_sip, p["KEY_SST"])], None, None
+
+
+def _scroll_ticks(inside, joined=None):
+    """Where pressureMouseStep() scrolls, for each row of `inside` (ticks in one scroll band):
+    on entering the band, then every SCROLL_REPEAT_TICKS ticks while it stays there.
+    joined[k] says tick k directly follows tick k - 1 (all of them when None)."""
+    n = inside.shape[-1]
+    entered = inside.copy()
+    stayed = inside[..., :-1] if joined is None else inside[..., :-1] & joined[1:]
+    entered[..., 1:] &= ~stayed
+    ticks = np.arange(n)
+    last_entry = np.maximum.accumulate(np.where(entered, ticks, 0), axis=-1)
+    return inside & ((ticks - last_entry) % SCROLL_REPEAT_TICKS == 0)
+
+
+def simulate_events(pressure, params=None, mode="mouse"):
+    """Events the firmware sends for a sequence of filtered pressures, one per tick (all
+    buttons and keys released at the start), as an EVENT_DTYPE array ordered like the
+    firmware's calls."""
+    p = dict(PRESSURE_DEFAULTS, **(params or {}))
+    pressure = np.asarray(pressure, dtype=np.int64)
+    levels, scroll_up, scroll_down = _held_levels(pressure, p, mode)
+    mouse_codes = [("press_left", "release_left"), ("press_right", "release_right")]
+    ticks, ranks, codes, args = [], [], [], []
+
+    def add(rank, where, code, arg):
+        idx = np.flatnonzero(where)
+        ticks.append(idx); ranks.append(np.full(len(idx), rank)); codes.append(np.full(len(idx), code)); args.append(np.broadcast_to(arg, idx.shape))
+
+    for rank, (held, arg) in enumerate(levels):
+        before = np.concatenate(([False], held[:-1]))
+        press, release = mouse_codes[rank] if mode == "mouse" else ("key_press", "key_release")
+        add(rank, held & ~before, EVENT_CODES[press], arg)
+        add(rank, before & ~held, EVENT_CODES[release], arg)
+    if mode == "mouse":
+        add(len(levels), _scroll_ticks(scroll_up), EVENT_CODES["scroll"], 1)
+        add(len(levels) + 1, _scroll_ticks(scroll_down), EVENT_CODES["scroll"], -1)
+    tick = np.concatenate(ticks); order = np.lexsort((np.concatenate(ranks), tick))
+    events = np.zeros(len(tick), dtype=EVENT_DTYPE)
+    events["tick"] = tick[order]; events["t_ms"] = tick_time_ms(events["tick"])
+    events["event"] = np.concatenate(codes)[order]; events["arg"] = np.concatenate(args)[order]
+    return events
+
+
+def simulate(raw, params=None, mode="mouse"):
+    """Events for centred raw ADC readings taken every SAMPLE_PERIOD_MS."""
+    return simulate_events(firmware_pressure(raw, params), params, mode)
+
+
+def event_counts(events, params=None, mode="mouse"):
+    """The COUNT_FIELDS of one simulated event list, for comparison with grid_counts().
+    Keyboard presses are told apart by key code, so the four keys must differ."""
+    code, arg = events["event"], events["arg"]
+    if mode == "mouse":
+        scroll = code == EVENT_CODES["scroll"]
+        values = ((code == EVENT_CODES["press_left"]).sum(), (code == EVENT_CODES["press_right"]).sum(),
+                  (scroll & (arg > 0)).sum(), (scroll & (arg < 0)).sum())
+    else:
+        p = dict(PRESSURE_DEFAULTS, **(params or {}))
+        pressed = code == EVENT_CODES["key_press"]
+        values = [(pressed & (arg == p[key])).sum() for key in ("KEY_HPT", "KEY_SPT", "KEY_HST", "KEY_SST")]
+    return dict(zip(COUNT_FIELDS[mode], (int(v) for v in values)))
+
+
+def step_latency_ms(level, params=None, mode="mouse"):
+    """Time from the first sample of a step from rest to `level` (scaled pressure) until the
+    firmware's first press, with the filter full of resting samples; None if it never presses."""
+    p = dict(PRESSURE_DEFAULTS, **(params or {}))
+    window = _window(p["PFW"])
+    scaled = np.concatenate((np.zeros(window, dtype=np.int64), np.full(2 * window, level, dtype=np.int64)))
+    events = simulate_events(sliding_average(scaled, window), p, mode)
+    pressed = np.isin(events["event"], [EVENT_CODES[name] for name in ("press_left", "press_right", "key_press")])
+    return int(tick_time_ms(events["tick"][pressed][0] - window)) if pressed.any() else None
+
+
+class FirmwarePressureModel:
+    """Line-by-line port of the firmware's pressure path, one tick() per 5 ms sample.
+    Slow, and written to read like V3.ino and pressure_logic.h: it is what the vectorized
+    functions are checked against."""
+
+    def __init__(self, params=None, mode="mouse"):
+        self.p = dict(PRESSURE_DEFAULTS, **(params or {}))
+        self.mode = mode
+        # pressureFilterInit()
+        self.window = _window(self.p["PFW"])
+        self.samples = [0] * PRESSURE_WINDOW_MAX
+        self.sum = self.next = self.count = 0
+        self.tick_count = 0
+        # pressureMouseReset(), pressureKeyboardReset()
+        self.left = self.right = False
+        self.scroll_direction = self.scroll_ticks = 0
+        self.held = 0
+        self.events = []
+
+    def _emit(self, name, arg=0):
+        self.events.append((self.tick_count, int(tick_time_ms(self.tick_count)), EVENT_CODES[name], arg))
+
+    def tick(self, raw_centered_pressure):
+        # samplePressure()
+        sens = self.p["SIP_SENS"] if raw_centered_pressure < 0 else self.p["PUFF_SENS"]
+        scaled = int(_c_int16(_c_div_int(raw_centered_pressure * sens, 100)))
+        # pressureFilterAdd()
+        if self.count == self.window: self.sum -= self.samples[self.next]
+        else: self.count += 1
+        self.samples[self.next] = scaled
+        self.sum += scaled
+        self.next += 1
+        if self.next == self.window: self.next = 0
+        pressure = int(_c_int16(_c_div_int(self.sum, self.count)))
+        # loop(): every tick is acted on
+        if self.mode == "mouse": self.process_mouse(pressure)
+        else: self.process_keyboard(pressure)
+        self.tick_count += 1
+
+    def process_mouse(self, pressure):
+        p = self.p
+        # pressureMouseStep()
+        hard_puff, hard_sip = pressure >= p["HPT"], pressure <= p["HST"]
+        if hard_puff != self.left:
+            self._emit("press_left" if hard_puff else "release_left"); self.left = hard_puff
+        if hard_sip != self.right:
+            self._emit("press_right" if hard_sip else "release_right"); self.right = hard_sip
+        direction = 0
+        if p["SPT"] <= pressure < p["HPT"]: direction = 1
+        elif p["HST"] < pressure <= p["NMIN"]: direction = -1
+        if direction != self.scroll_direction: self.scroll_direction = direction; self.scroll_ticks = 0
+        if direction != 0:
+            if self.scroll_ticks == 0: self._emit("scroll", direction)
+            self.scroll_ticks += 1
+            if self.scroll_ticks == SCROLL_REPEAT_TICKS: self.scroll_ticks = 0
+
+    def process_keyboard(self, pressure):
+        p = self.p
+        # pressureKeyboardStep()
+        held = 0
+        if pressure >= p["HPT"]: held |= 1
+        if p["SPT"] <= pressure < p["HPT"]: held |= 2
+        if pressure <= p["HST"]: held |= 4
+        if p["HST"] < pressure <= p["NMIN"]: held |= 8
+        changed = held ^ self.held
+        self.held = held
+        # processPressureKeyboard()
+        for i, key in enumerate((p["KEY_HPT"], p["KEY_SPT"], p["KEY_HST"], p["KEY_SST"])):
+            bit = 1 << i
+            if changed & bit: self._emit("key_press" if held & bit else "key_release", key)
+
+    def run(self, raw):
+        for value in raw: self.tick(int(value))
+        return np.array(self.events, dtype=EVENT_DTYPE) if self.events else np.zeros(0, dtype=EVENT_DTYPE)
+
+
+# --- Native build of pressure_logic.h ---
+#
+# The header has no Arduino dependencies, so the state machines the board runs can be
+# compiled for this machine and fed the same samples as the Python model.
+
+PRESSURE_LOGIC_HEADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pressure_logic.h")
+
+# Reads "mode window HST NMIN SPT HPT KEY_HPT KEY_SPT KEY_HST KEY_SST" and then scaled samples;
+# prints "tick event arg" per HID call, in the order processPressureMouse/Keyboard() make them.
+NATIVE_DRIVER = r"""
+#include <stdio.h>
+#include "pressure_logic.h"
+
+int main() {
+  int mode, window, hst, nmin, spt, hpt, keys[4];
+  if (scanf("%d %d %d %d %d %d %d %d %d %d", &mode, &window, &hst, &nmin, &spt, &hpt, &keys[0], &keys[1], &keys[2], &keys[3]) != 10) return 2;
+  PressureFilter filter; pressureFilterInit(&filter, (uint8_t)window);
+  PressureThresholds t;
+  t.hardSip = (int16_t)hst; t.neutralMin = (int16_t)nmin; t.softPuff = (int16_t)spt; t.hardPuff = (int16_t)hpt;
+  PressureMouse mouse; pressureMouseReset(&mouse);
+  PressureKeyboard keyboard; pressureKeyboardReset(&keyboard);
+  int sample;
+  for (long tick = 0; scanf("%d", &sample) == 1; tick++) {
+    int16_t pressure = pressureFilterAdd(&filter, (int16_t)sample);
+    if (mode == 0) {
+      uint8_t actions = pressureMouseStep(&mouse, &t, pressure);
+      if (actions & PRESSURE_PRESS_LEFT) printf("%ld 0 0\n", tick);
+      if (actions & PRESSURE_RELEASE_LEFT) printf("%ld 1 0\n", tick);
+      if (actions & PRESSURE_PRESS_RIGHT) printf("%ld 2 0\n", tick);
+      if (actions & PRESSURE_RELEASE_RIGHT) printf("%ld 3 0\n", tick);
+      if (actions & PRESSURE_SCROLL_UP) printf("%ld 4 1\n", tick);
+      if (actions & PRESSURE_SCROLL_DOWN) printf("%ld 4 -1\n", tick);
+    } else {
+      uint8_t changed = pressureKeyboardStep(&keyboard, &t, pressure);
+      for (int i = 0; i < 4; i++) {
+        uint8_t bit = 1 << i;
+        if (changed & bit) printf("%ld %d %d\n", tick, (keyboard.held & bit) ? 5 : 6, keys[i]);
+      }
+    }
+  }
+  return 0;
+}
+"""
+
+
+def native_compiler():
+    for name in (os.environ.get("CXX"), "c++", "g++", "clang++"):
+        if name and shutil.which(name): return shutil.which(name)
+    return None
+
+
+def build_native_driver(directory, compiler=None, driver=NATIVE_DRIVER, name="pressure_driver"):
+    """Compiles `driver` (NATIVE_DRIVER, against pressure_logic.h, by default) into `directory`;
+    returns the executable."""
+    compiler = compiler or native_compiler()
+    source, binary = os.path.join(directory, name + ".cpp"), os.path.join(directory, name)
+    with open(source, "w") as f: f.write(driver)
+    subprocess.run([compiler, "-std=c++11", "-O2", "-Wall", "-I", os.path.dirname(PRESSURE_LOGIC_HEADER), source, "-o", binary],
+                   check=True, capture_output=True, text=True)
+    return binary
+
+
+def native_events(binary, scaled, params=None, mode="mouse"):
+    """Events from the compiled pressure_logic.h for scaled samples (after samplePressure()'s scaling)."""
+    p = dict(PRESSURE_DEFAULTS, **(params or {}))
+    header = [0 if mode == "mouse" else 1, _window(p["PFW"])] + [p[name] for name in THRESHOLDS + ("KEY_HPT", "KEY_SPT", "KEY_HST", "KEY_SST")]
+    text = " ".join(str(int(v)) for v in header) + "\n" + "\n".join(str(int(v)) for v in scaled) + "\n"
+    out = subprocess.run([binary], input=text, capture_output=True, text=True, check=True).stdout.split()
+    rows = np.array(out, dtype=np.int64).reshape(-1, 3)
+    events = np.zeros(len(rows), dtype=EVENT_DTYPE)
+    events["tick"], events["event"], events["arg"] = rows[:, 0], rows[:, 1], rows[:, 2]
+    events["t_ms"] = tick_time_ms(events["tick"])
+    return events
+
+
+# --- Joystick mouse ---
+#
+# updateMouseJoystick() sends the JOY sample it acts on, so a recorded JOY trace is exactly
+# the sequence of deflections the board turned into Mouse.move() calls, one per
+# INPUT_UPDATE_PERIOD_MS. The board's float is IEEE single precision, hence float32 here.
+
+JOYSTICK_DEFAULTS = {"JDZ": 20, "CSP": 10}
+
+# dx, dy: Mouse.move() counts per update (+y is down the screen); x, y: the running cursor
+# offset; speed: counts per second. One row per parameter set when several are given.
+# Counts are HID units: the host's pointer acceleration still applies on top.
+CursorTrajectory = namedtuple("CursorTrajectory", "dx dy x y speed")
+CursorSummary = namedtuple("CursorSummary", "distance peak_speed mean_speed moving_fraction net_x net_y")
+
+
+def arduino_map(x, in_min, in_max, out_min, out_max):
+    """Arduino's map() in long arithmetic: the float argument is truncated and the division
+    truncates toward zero. An empty input range (JDZ 100 with the stick past 100%, which a
+    centred stick cannot reach) maps to out_min instead of dividing by zero."""
+    x = np.trunc(x).astype(np.int64)
+    span = np.asarray(in_max - in_min)
+    return np.where(span == 0, 0, _c_div((x - in_min) * (out_max - out_min), np.where(span == 0, 1, span))) + out_min
+
+
+def _c_int8(values):
+    """Mouse.move() takes signed chars."""
+    return ((values + 128) & 0xFF) - 128
+
+
+def _joy_percent(joy):
+    return np.asarray(joy, dtype=np.float32) / np.float32(512.0) * np.float32(100.0)
+
+
+def _axis_steps(percent, jdz, csp):
+    """One axis of updateMouseJoystick() before the sign flip of Y; jdz/csp broadcast against percent."""
+    positive = percent > 0
+    moved = arduino_map(percent, np.where(positive, jdz, -100), np.where(positive, 100, -jdz),
+                        np.where(positive, 1, -csp), np.where(positive, csp, -1))
+    return np.where(np.abs(percent) > jdz, moved, 0)
+
+
+def _parameter_sets(params):
+    batch = isinstance(params, (list, tuple))
+    sets = [dict(JOYSTICK_DEFAULTS, **(p or {})) for p in (params if batch else [params])]
+    return batch, np.array([p["JDZ"] for p in sets], dtype=np.int64)[:, None], np.array([p["CSP"] for p in sets], dtype=np.int64)[:, None]
+
+
+def _axis_table(values, jdz, csp):
+    """Steps for each distinct deflection in `values` and each parameter set: (table, index)
+    with table[set, index[i]] the (unflipped) step for values[i]."""
+    distinct, index = np.unique(np.asarray(values, dtype=np.int64), return_inverse=True)
+    return _c_int8(_axis_steps(_joy_percent(distinct)[None, :], jdz, csp)), index.ravel()
+
+
+def cursor_trajectory(joy, params=None):
+    """The cursor movement the firmware makes for a JOY trace ((n, 2) centred x, y) under
+    `params` ({"JDZ", "CSP"}), or under each of a list of them in one batch (one row per
+    set). Each axis steps on its own deflection alone, so the step is worked out once per
+    distinct value and parameter set and then looked up."""
+    batch, jdz, csp = _parameter_sets(params)
+    joy = np.asarray(joy, dtype=np.int64).reshape(-1, 2)
+    x_table, x_index = _axis_table(joy[:, 0], jdz, csp)
+    y_table, y_index = _axis_table(joy[:, 1], jdz, csp)
+    dx, dy = x_table[:, x_index].astype(np.int8), _c_int8(-y_table[:, y_index]).astype(np.int8)
+    speed = np.hypot(dx.astype(np.float32), dy.astype(np.float32)) * np.float32(1000.0 / INPUT_UPDATE_PERIOD_MS)
+    trajectory = CursorTrajectory(dx, dy, np.cumsum(dx, axis=1, dtype=np.int32), np.cumsum(dy, axis=1, dtype=np.int32), speed)
+    return trajectory if batch else CursorTrajectory(*(field[0] for field in trajectory))
+
+
+def cursor_summary(joy, params=None):
+    """CursorSummary of a JOY trace under `params` or a list of them: path length in counts,
+    peak and mean speed (counts/s) while moving, share of updates that move the cursor and
+    the net offset. Worked out over the distinct (x, y) deflections weighted by how often
+    each occurs, without building the paths, so it stays cheap for many settings at once."""
+    batch, jdz, csp = _parameter_sets(params)
+    joy = np.asarray(joy, dtype=np.int64).reshape(-1, 2)
+    low = joy.min(axis=0) if len(joy) else np.zeros(2, dtype=np.int64)
+    width = (joy[:, 1].max() - low[1] + 1) if len(joy) else 1
+    pairs, counts = np.unique((joy[:, 0] - low[0]) * width + (joy[:, 1] - low[1]), return_counts=True)
+    x_table, x_index = _axis_table(pairs // width + low[0], jdz, csp)
+    y_table, y_index = _axis_table(pairs % width + low[1], jdz, csp)
+    x_table, y_table = x_table.astype(np.int8), _c_int8(-y_table).astype(np.int8)
+    weights = counts.astype(np.float64)
+    distance, peak, moves, net_x, net_y = (np.zeros(len(jdz)) for _ in range(5))
+    for start in range(0, len(jdz), 16):  # A few sets at a time keeps the (sets, pairs) temporaries small
+        rows = slice(start, start + 16)
+        dx, dy = x_table[rows][:, x_index], y_table[rows][:, y_index]
+        step = np.hypot(dx, dy, dtype=np.float64)
+        distance[rows], peak[rows], moves[rows] = step @ weights, step.max(axis=1, initial=0.0), (step > 0) @ weights
+        net_x[rows], net_y[rows] = dx @ weights, dy @ weights
+    per_second = 1000.0 / INPUT_UPDATE_PERIOD_MS
+    summary = CursorSummary(distance, peak * per_second, np.where(moves > 0, distance / np.maximum(moves, 1), 0.0) * per_second,
+                            moves / max(1, len(joy)), net_x.astype(np.int64), net_y.astype(np.int64))
+    return summary if batch else CursorSummary(*(field[0] for field in summary))
+
+
+def update_mouse_joystick(joy_x, joy_y, jdz, csp):
+    """Line-by-line port of updateMouseJoystick() for one update: (moveX, moveY) as passed to
+    Mouse.move(), or None when it is not called."""
+    x_percent = np.float32(joy_x) / np.float32(512.0) * np.float32(100.0)
+    y_percent = np.float32(joy_y) / np.float32(512.0) * np.float32(100.0)
+    move_x = move_y = 0
+
+    def map_(x, in_min, in_max, out_min, out_max):
+        if in_max == in_min: return out_min
+        return _c_div_int((int(x) - in_min) * (out_max - out_min), in_max - in_min) + out_min
+
+    if abs(x_percent) > jdz:
+        move_x = map_(x_percent, jdz if x_percent > 0 else -100, 100 if x_percent > 0 else -jdz, 1 if x_percent > 0 else -csp, csp if x_percent > 0 else -1)
+    if abs(y_percent) > jdz:
+        move_y = -map_(y_percent, jdz if y_percent > 0 else -100, 100 if y_percent > 0 else -jdz, 1 if y_percent > 0 else -csp, csp if y_percent > 0 else -1)
+    if move_x != 0 or move_y != 0: return int(_c_int8(move_x)), int(_c_int8(move_y))
+    return None
+
+
+# --- Keyboard joystick sectors ---
+#
+# In keyboard mode updateKeyboardJoystick() holds the keys of the sector the stick points
+# into once it is deflected past JMT percent of 512. It used to work that out with sqrt()
+# and atan2() in single-precision float; joystick_logic.h does it in integers, comparing
+# x^2 + y^2 with a limit derived from JMT and the direction with a table of sector
+# boundaries. Boundary i sits at (i + 0.5) * 360 / N degrees counter-clockwise from stick
+# right (y flipped, as in atan2(-y, x)), and a stick exactly on a boundary belongs to the
+# sector that starts there. Directions are rounded to 2^SECTOR_SCALE_BITS, fine enough that
+# no deflection in the ADC range ends up on the wrong side of a boundary.
+
+JOYSTICK_SECTORS_MAX = 16   # Rows of joy_keybinds
+JOYSTICK_AXIS_MAX = 1023    # Largest |analogRead() - centre|
+SECTOR_SCALE_BITS = 36
+SECTOR_LOW_BITS = 16        # joystick_logic.h keeps each coordinate as (value >> 16, value & 0xFFFF)
+
+
+def _sector_count(num_sectors):
+    return max(1, min(JOYSTICK_SECTORS_MAX, int(num_sectors)))
+
+
+def sector_boundaries(num_sectors):
+    """Boundary directions for `num_sectors` sectors (1..16) as int64 x and y arrays, in angle order."""
+    n = _sector_count(num_sectors)
+    angles = np.pi * (2 * np.arange(n) + 1) / n
+    scale = float(1 << SECTOR_SCALE_BITS)
+    return np.rint(np.cos(angles) * scale).astype(np.int64), np.rint(np.sin(angles) * scale).astype(np.int64)
+
+
+def sector_limit(jmt):
+    """Largest x^2 + y^2 inside JMT percent: sqrt(m) / 512 * 100 > JMT is m * 625 > JMT^2 * 16384.
+    Past 289 percent no deflection in range gets out, so JMT is capped at 300."""
+    if jmt < 0: return -1
+    jmt = min(int(jmt), 300)
+    return jmt * jmt * 16384 // 625
+
+
+def _past_boundary(bx, by, u, v):
+    """Whether direction (u, v) is at or past boundary (bx, by), angles counted 0..360.
+    The upper half is [0, 180); within a half the cross product orders directions."""
+    upper = (v > 0) | ((v == 0) & (u > 0))
+    return np.where(upper == (by > 0), bx * v - by * u >= 0, ~upper)  # No boundary lies at 0 degrees
+
+
+def joystick_sectors(x, y, num_sectors=8, jmt=10):
+    """Sector per deflection as joystick_logic.h picks it, -1 at or inside JMT; x, y broadcast."""
+    u, v = np.asarray(x, dtype=np.int64), -np.asarray(y, dtype=np.int64)
+    bx, by = sector_boundaries(num_sectors)
+    passed = np.zeros(np.broadcast(u, v).shape, dtype=np.int64)
+    for a, b in zip(bx.tolist(), by.tolist()): passed += _past_boundary(a, b, u, v)
+    return np.where(u * u + v * v > sector_limit(jmt), passed % len(bx), -1)
+
+
+class JoystickSectors:
+    """joystickSector() for one deflection at a time, for the Stick Control highlight. The
+    boundary table is rebuilt only when the sector count changes, the limit when JMT does."""
+    def __init__(self):
+        self.sections = self.threshold = None
+
+    def sector(self, x, y, num_sectors, jmt):
+        if num_sectors != self.sections:
+            bx, by = sector_boundaries(num_sectors)
+            self.sections, self.boundaries = num_sectors, [(a, b, b > 0) for a, b in zip(bx.tolist(), by.tolist())]
+        if jmt != self.threshold: self.threshold, self.limit = jmt, sector_limit(jmt)
+        u, v = int(x), -int(y)
+        if u * u + v * v <= self.limit: return -1
+        upper = v > 0 or (v == 0 and u > 0)
+        low, high = 0, len(self.boundaries)
+        while low < high:  # Boundaries are in angle order: count those the stick has passed
+            mid = (low + high) // 2
+            bx, by, b_upper = self.boundaries[mid]
+            if (bx * v - by * u >= 0) if upper == b_upper else not upper: low = mid + 1
+            else: high = mid
+        return low % len(self.boundaries)
+
+
+def keyboard_joystick_sector_float(x, y, num_sectors=8, jmt=10, dtype=np.float32):
+    """The float decision updateKeyboardJoystick() made before joystick_logic.h, step by step
+    in the board's single precision (np.float64: the same steps in double, as the app's
+    highlight did them)."""
+    f = dtype
+    fx, fy = np.asarray(x).astype(f), (-np.asarray(y)).astype(f)  # (float)-joyY: never -0.0
+    moved = np.sqrt(fx * fx + fy * fy) / f(512.0) * f(100.0) > f(jmt)
+    slice_angle = f(360.0) / f(num_sectors)
+    angle = np.arctan2(fy, fx) * f(180.0) / f(np.pi) + slice_angle / f(2.0)
+    angle = np.where(angle < 0, angle + f(360.0), angle)
+    angle = np.where(angle >= f(360.0), angle - f(360.0), angle)
+    return np.where(moved, np.floor(angle / slice_angle).astype(np.int64), -1)
+
+
+JOYSTICK_LOGIC_HEADER = os.path.join(os.path.dirname(PRESSURE_LOGIC_HEADER), "joystick_logic.h")
+
+# Reads "sections JMT extent"; writes joystickSector() for x and y from -extent to extent
+# (x outer) as one signed byte each.
+JOYSTICK_DRIVER = r"""
+#include <stdio.h>
+#include "joystick_logic.h"
+
+int main() {
+  int sections, jmt, extent;
+  if (scanf("%d %d %d", &sections, &jmt, &extent) != 3) return 2;
+  JoystickSectors s; joystickSectorsInit(&s, (int16_t)sections); joystickSectorsSetThreshold(&s, (int16_t)jmt);
+  for (int x = -extent; x <= extent; x++)
+    for (int y = -extent; y <= extent; y++) putchar((char)joystickSector(&s, (int16_t)x, (int16_t)y));
+  return 0;
+}
+"""
+
+
+def native_sectors(binary, num_sectors, jmt, extent=JOYSTICK_AXIS_MAX):
+    """joystickSector() from the compiled joystick_logic.h over the square of deflections up to `extent`, x outer."""
+    out = subprocess.run([binary], input=f"{num_sectors} {jmt} {extent}\n".encode(), capture_output=True, check=True).stdout
+    return np.frombuffer(out, dtype=np.int8).astype(np.int64)
+
+
+def sector_table_source():
+    """The JOYSTICK_BOUNDARIES initializer of joystick_logic.h."""
+    mask = (1 << SECTOR_LOW_BITS) - 1
+    lines = []
+    for n in range(1, JOYSTICK_SECTORS_MAX + 1):
+        entries = [f"{{{x >> SECTOR_LOW_BITS}, {y >> SECTOR_LOW_BITS}, {x & mask}, {y & mask}}}" for x, y in zip(*(b.tolist() for b in sector_boundaries(n)))]
+        for start in range(0, n, 4):
+            lines.append("  " + ", ".join(entries[start:start + 4]) + "," + (f"  // N = {n}" if start == 0 else ""))
+    return "\n".join(lines)
+
+
+# --- Grid search ---
+#
+# Button and key counts are differences of "how many ticks (or pairs of consecutive ticks)
+# lie at or above a threshold", so one sort of the filtered pressure answers them for every
+# candidate value at once. Entries into a band [a, b) are the ticks inside it minus the
+# consecutive pairs that are both inside, i.e. min(prev, cur) >= a and max(prev, cur) < b:
+# a 2-D count over (a, b), taken from a histogram of the pairs over the two candidate grids.
+# Scroll steps depend on how long each stay in a band lasts, so they are counted per band
+# over just the ticks that fall inside the widest candidate band.
+
+class _Counter:
+    def __init__(self, pressure):
+        pressure = np.asarray(pressure, dtype=np.int64)
+        self.values = pressure
+        self.n = len(pressure)
+        self.cur = np.sort(pressure)
+        self.pair_lo, self.pair_hi = np.minimum(pressure[1:], pressure[:-1]), np.maximum(pressure[1:], pressure[:-1])
+        self.lo, self.hi = np.sort(self.pair_lo), np.sort(self.pair_hi)
+
+    @staticmethod
+    def _at_least(ordered, values):
+        return len(ordered) - np.searchsorted(ordered, values, side="left")
+
+    @staticmethod
+    def _at_most(ordered, values):
+        return np.searchsorted(ordered, values, side="right")
+
+    def rises_at_least(self, t):
+        """Ticks where `pressure >= t` becomes true, for each t."""
+        return self._at_least(self.cur, t) - self._at_least(self.lo, t)
+
+    def rises_at_most(self, t):
+        return self._at_most(self.cur, t) - self._at_most(self.hi, t)
+
+    def in_band(self, a, b):
+        """Ticks with a <= pressure < b, for every a (rows) and b (columns)."""
+        inside = self._at_least(self.cur, np.asarray(a))[:, None] - self._at_least(self.cur, np.asarray(b))[None, :]
+        return np.maximum(inside, 0)
+
+    def band_entries(self, a, b):
+        """Ticks where a <= pressure < b becomes true, for every a (rows) and b (columns)."""
+        a, b = np.asarray(a), np.asarray(b)
+        a_order, b_order = np.argsort(a), np.argsort(b)
+        a_sorted, b_sorted = a[a_order], b[b_order]
+        ia = np.searchsorted(a_sorted, self.pair_lo, side="right")  # lo >= a_sorted[j] for j < ia
+        ib = np.searchsorted(b_sorted, self.pair_hi, side="right")  # hi < b_sorted[j] for j >= ib
+        hist = np.bincount(ia * (len(b) + 1) + ib, minlength=(len(a) + 1) * (len(b) + 1)).reshape(len(a) + 1, len(b) + 1)
+        both = hist[::-1].cumsum(axis=0)[::-1].cumsum(axis=1)[1:, :-1]  # [ja, jb]: ia > ja and ib <= jb
+        stayed = np.empty_like(both); stayed[np.ix_(a_order, b_order)] = both
+        return self.in_band(a, b) - np.where(a[:, None] < b[None, :], stayed, 0)
+
+    def within(self, low, high):
+        """(values, joined) for the ticks with low <= pressure < high: joined[k] is True
+        where tick k directly follows the tick before it in the original sequence."""
+        ticks = np.flatnonzero((self.values >= low) & (self.values < high))
+        return self.values[ticks], np.concatenate(([False], np.diff(ticks) == 1))
+
+    def band_scrolls(self, a, b, chunk_elements=1 << 22):
+        """Scroll steps while a <= pressure < b, for every a (rows) and b (columns)."""
+        a, b = np.asarray(a), np.asarray(b)
+        out = np.zeros((len(a), len(b)), dtype=np.int64)
+        if not len(a) or not len(b): return out
+        values, joined = self.within(a.min(), b.max())
+        step = max(1, chunk_elements // max(1, len(values)))  # Rows of b at a time keep the (b, ticks) temporaries small
+        for i, low in enumerate(a.tolist()):
+            for start in range(0, len(b), step):
+                inside = (values[None, :] >= low) & (values[None, :] < b[start:start + step, None])
+                out[i, start:start + step] = _scroll_ticks(inside, joined).sum(axis=1)
+        return out
+
+
+def grid_counts(pressure, grid, mode="mouse"):
+    """Event counts (COUNT_FIELDS[mode]) for every combination of the candidate HST, NMIN,
+    SPT and HPT values in `grid` ({name: values}; missing names use PRESSURE_DEFAULTS), as
+    one structured array row per combination, from the filtered pressure of every tick.
+    Tens of thousands of combinations over an hour of data take around a second.
+    Sensitivities and PFW change the filtered pressure itself: see grid_search()."""
+    values = {name: np.unique(np.asarray(grid.get(name, [PRESSURE_DEFAULTS[name]]), dtype=np.int64)) for name in THRESHOLDS}
+    counter = _Counter(pressure)
+    hst, nmin, spt, hpt = (values[name] for name in THRESHOLDS)
+    shape = tuple(len(values[name]) for name in THRESHOLDS)
+    ix = np.ix_(*(np.arange(n) for n in shape))
+    if mode == "mouse":
+        scroll_down = np.broadcast_to(counter.band_scrolls(hst + 1, nmin + 1)[ix[0], ix[1]], shape).copy()
+        # Scrolling down is the firmware's else-branch: with NMIN at or above SPT the bands
+        # overlap, the shared ticks scroll up and the rest of the sip band splits in two
+        overlapping = np.argwhere(np.broadcast_to((np.maximum(spt[ix[2]], hst[ix[0]] + 1) < np.minimum(hpt[ix[3]], nmin[ix[1]] + 1)), shape))
+        if len(overlapping):
+            band, joined = counter.within(hst.min() + 1, nmin.max() + 1)
+            for h, n, s, u in overlapping.tolist():
+                inside = (band > hst[h]) & (band <= nmin[n]) & ~((band >= spt[s]) & (band < hpt[u]))
+                scroll_down[h, n, s, u] = _scroll_ticks(inside, joined).sum()
+        columns = (counter.rises_at_least(hpt)[ix[3]], counter.rises_at_most(hst)[ix[0]],
+                   counter.band_scrolls(spt, hpt)[ix[2], ix[3]], scroll_down)
+    else:
+        columns = (counter.rises_at_least(hpt)[ix[3]], counter.band_entries(spt, hpt)[ix[2], ix[3]],
+                   counter.rises_at_most(hst)[ix[0]], counter.band_entries(hst + 1, nmin + 1)[ix[0], ix[1]])
+    fields = COUNT_FIELDS[mode]
+    table = np.zeros(shape, dtype=[(name, "<i4") for name in THRESHOLDS] + [(name, "<i8") for name in fields])
+    for name, index in zip(THRESHOLDS, ix): table[name] = values[name][index]
+    for name, column in zip(fields, columns): table[name] = column
+    return table.ravel()
+
+
+def grid_search(raw, grid, mode="mouse"):
+    """grid_counts() over raw readings for every SIP_SENS / PUFF_SENS / PFW combination in
+    `grid` too; rows gain those columns."""
+    signal = [np.asarray(grid.get(name, [PRESSURE_DEFAULTS[name]]), dtype=np.int64) for name in SIGNAL_PARAMS]
+    tables = []
+    for combination in product(*signal):
+        params = dict(zip(SIGNAL_PARAMS, (int(v) for v in combination)))
+        counts = grid_counts(firmware_pressure(raw, params), grid, mode)
+        table = np.zeros(len(counts), dtype=[(name, "<i4") for name in SIGNAL_PARAMS] + counts.dtype.descr)
+        for name, value in params.items(): table[name] = value
+        for name in counts.dtype.names: table[name] = counts[name]
+        tables.append(table)
+    return np.concatenate(tables)
+
+
+# --- Inputs and command line ---
+
+def pressure_from_recording(path):
+    """Filtered pressure per tick from the P: stream of a recording (recorder.py), at the
+    sensitivities and PFW in force when it was recorded, so only the thresholds can be
+    searched over. The board acts on every tick but reports every PRESSURE_REPORT_TICKS-th,
+    so each reported value stands in for its ticks: events come out up to 45 ms early and
+    excursions shorter than a report period can be missed. Raw input (--script) is exact."""
+    from recorder import RECORD_KINDS, open_recording
+    _, records = open_recording(path)
+    pressure = records[records["kind"] == RECORD_KINDS["P"]]
+    reported = np.asarray(pressure[np.argsort(pressure["t"], kind="stable")]["a"], dtype=np.int64)
+    return np.repeat(reported, PRESSURE_REPORT_TICKS)
+
+
+def joystick_from_recording(path):
+    """The JOY stream of a recording as (n, 2) centred x, y, in time order."""
+    from recorder import open_recording
+    return joystick_from_records(open_recording(path)[1])
+
+
+def joystick_from_records(records):
+    """joystick_from_recording() for a slice of a recording's records. The recorder writes
+    each topic in the order received, so the JOY rows of consecutive slices join up in order."""
+    from recorder import RECORD_KINDS
+    joy = records[records["kind"] == RECORD_KINDS["JOY"]]
+    joy = joy[np.argsort(joy["t"], kind="stable")]
+    return np.stack([np.asarray(joy["a"], dtype=np.int64), np.asarray(joy["b"], dtype=np.int64)], axis=1)
+
+
+def raw_from_script(script=None, seconds=60.0, noise=3.0, seed=0):
+    """Raw readings every SAMPLE_PERIOD_MS from a virtual_controller.py waveform script
+    (its DEMO_SCRIPT by default), with the same clipping and Gaussian noise."""
+    from virtual_controller import DEMO_SCRIPT, _pressure_at
+    script = script or DEMO_SCRIPT
+    ends = np.cumsum([seg["seconds"] for seg in script]); length = ends[-1]
+    t = np.arange(int(seconds * 1000 / SAMPLE_PERIOD_MS)) * (SAMPLE_PERIOD_MS / 1000.0)
+    looped = t % length
+    segment = np.minimum(np.searchsorted(ends, looped, side="right"), len(script) - 1)
+    starts = np.concatenate(([0.0], ends[:-1]))
+    clean = np.array([_pressure_at(script[i].get("pressure", "neutral"), looped_t - starts[i]) for i, looped_t in zip(segment.tolist(), looped.tolist())])
+    raw = clean + np.random.default_rng(seed).normal(0, noise, len(t))
+    return np.clip(raw, -512, 511).astype(np.int64)  # int() of the clipped float truncates toward zero, like astype
+
+
+def _range(name, values):
+    """--hpt 250 -> [250]; --hpt 150 350 25 -> range(150, 351, 25)."""
+    if len(values) == 1: return values
+    if len(values) != 3 or values[2] == 0: raise SystemExit(f"--{name.lower().replace('_', '-')}: give one value or START STOP STEP")
+    start, stop, step = values
+    return list(range(start, stop + (1 if step > 0 else -1), step))
+
+
+def _block_press_latencies_ms(level, threshold, length=10):
+    """The filter this firmware replaced: a press needed a whole block of `length` samples
+    averaged, so the delay depends on where in a block the step lands."""
+    delays = []
+    for phase in range(length):
+        first = _c_div_int(level * (length - phase), length)  # The block the step starts in, rest before it
+        delays.append(((length - 1 - phase) if first >= threshold else (2 * length - 1 - phase)) * SAMPLE_PERIOD_MS)
+    return min(delays), max(delays)
+
+
+def run_check(args):
+    """Parity: vectorized model against FirmwarePressureModel on cases with known firmware
+    behaviour and random streams, both against pressure_logic.h compiled for this machine
+    (when a C++ compiler is found), grid_counts() against per-combination simulation, and
+    the joystick_logic.h sector lookup against the float code it replaced at every deflection."""
+    failures = []
+
+    def expect(name, got, want):
+        ok = got == want
+        if not ok: failures.append(name)
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + ("" if ok else f": got {got}, want {want}"))
+
+    def names(events): return [(int(e["tick"]), EVENTS[e["event"]], int(e["arg"])) for e in events]
+
+    compiler = native_compiler()
+    directory = tempfile.TemporaryDirectory() if compiler else None
+    binary = joystick_binary = None
+    if compiler:
+        try: binary = build_native_driver(directory.name, compiler)
+        except subprocess.CalledProcessError as error:
+            expect("pressure_logic.h compiles natively", error.stderr.strip(), "")
+        try: joystick_binary = build_native_driver(directory.name, compiler, JOYSTICK_DRIVER, "joystick_driver")
+        except subprocess.CalledProcessError as error:
+            expect("joystick_logic.h compiles natively", error.stderr.strip(), "")
+    else: print("skip native pressure_logic.h and joystick_logic.h checks: no C++ compiler found")
+
+    def both(raw, params, mode):
+        reference = names(FirmwarePressureModel(params, mode).run(raw))
+        expect(f"vectorized == line-by-line ({mode}, {len(raw)} samples)", names(simulate(raw, params, mode)), reference)
+        if binary:
+            p = dict(PRESSURE_DEFAULTS, **(params or {}))
+            scaled = scale_pressure(raw, p["SIP_SENS"], p["PUFF_SENS"])
+            expect(f"pressure_logic.h == line-by-line ({mode}, {len(raw)} samples)", names(native_events(binary, scaled, params, mode)), reference)
+        return reference
+
+    # C division truncates toward zero: nine -1 readings and a 0 average to 0, not -1
+    expect("average truncates toward zero", sliding_average([-1] * 9 + [0], 10).tolist()[-1], 0)
+    expect("average over the samples so far until the window fills", sliding_average([10, 20, 30], 10).tolist(), [10, 15, 20])
+    expect("window drops its oldest sample", sliding_average([100] * 3 + [0] * 3, 3).tolist(), [100, 100, 100, 66, 33, 0])
+    expect("sensitivity truncates toward zero", scale_pressure([-3, 3], 50, 50).tolist(), [-1, 1])
+    expect("sip and puff scaled separately", scale_pressure([-100, 100], 150, 50).tolist(), [-150, 50])
+    unfiltered = {"PFW": 1}
+    # Exactly on a threshold counts: HPT and SPT with >=, HST and NMIN with <=
+    expect("thresholds are inclusive (mouse)", both([200, 100, -100, -200, 0], unfiltered, "mouse"),
+           [(0, "press_left", 0), (1, "release_left", 0), (1, "scroll", 1), (2, "scroll", -1), (3, "press_right", 0), (4, "release_right", 0)])
+    expect("held puff clicks once, soft puff scrolls on entry and every 10 ticks", both([150] * 25 + [300] * 3 + [0], unfiltered, "mouse"),
+           [(0, "scroll", 1), (10, "scroll", 1), (20, "scroll", 1), (25, "press_left", 0), (28, "release_left", 0)])
+    expect("leaving the scroll band restarts the repeat", both([150] * 3 + [0] + [150] + [-150] * 2, unfiltered, "mouse"),
+           [(0, "scroll", 1), (4, "scroll", 1), (5, "scroll", -1)])
+    f, r, e, q = (ord(c) for c in "freq")
+    expect("keyboard press comes before the release in one tick", both([150, 300, -300, 0], unfiltered, "keyboard"),
+           [(0, "key_press", r), (1, "key_press", f), (1, "key_release", r), (2, "key_release", f), (2, "key_press", e), (3, "key_release", e)])
+    expect("a hard puff is acted on in the tick its average crosses HPT", [e for e in both([0] * 10 + [300] * 10, None, "mouse") if e[1] == "press_left"], [(16, "press_left", 0)])
+
+    # Latency of a step from rest to a hard puff: the sliding window against the old blocks
+    sliding, unfiltered_ms = step_latency_ms(300), step_latency_ms(300, unfiltered)
+    blocks = _block_press_latencies_ms(300, PRESSURE_DEFAULTS["HPT"])
+    print(f"     step to 300 with HPT 200: pressed after {sliding} ms (PFW 10), {unfiltered_ms} ms (PFW 1); "
+          f"{blocks[0]}-{blocks[1]} ms with 10-sample blocks")
+    expect("sliding window presses no later than the best case of blocks", sliding <= blocks[0], True)
+    expect("PFW 1 presses on the first sample", unfiltered_ms, 0)
+
+    rng = np.random.default_rng(args.seed)
+    for i in range(args.rounds):
+        stride = int(rng.integers(2, 41))  # Slow walks stay in a band long enough to scroll repeatedly
+        raw = np.clip(np.cumsum(rng.integers(-stride, stride + 1, rng.integers(100, 3000))) + rng.integers(-300, 300), -512, 511)
+        params = {"HST": int(rng.integers(-400, 0)), "NMIN": int(rng.integers(-300, 50)), "SPT": int(rng.integers(-50, 300)),
+                  "HPT": int(rng.integers(0, 400)), "SIP_SENS": int(rng.integers(10, 300)), "PUFF_SENS": int(rng.integers(10, 300)),
+                  "PFW": int(rng.integers(1, PRESSURE_WINDOW_MAX + 1))}
+        for mode in ("mouse", "keyboard"): both(raw, params, mode)
+        grid = {name: rng.integers(-400, 400, 4).tolist() for name in THRESHOLDS}
+        pressure = firmware_pressure(raw, params)
+        for mode in ("mouse", "keyboard"):
+            table = grid_counts(pressure, grid, mode)
+            mismatched = sum(1 for row in table if event_counts(simulate_events(pressure, dict(zip(THRESHOLDS, (int(row[n]) for n in THRESHOLDS))), mode), None, mode)
+                                                 != {name: int(row[name]) for name in COUNT_FIELDS[mode]})
+            expect(f"grid counts == simulated counts ({mode}, {len(table)} combinations)", mismatched, 0)
+    # updateMouseJoystick(): every deflection in the ADC range, for a spread of JDZ/CSP
+    joy_x = np.arange(-1023, 1024)
+    pairs = [(jdz, csp) for jdz in (0, 1, 5, 10, 19, 20, 33, 50, 99, 100, 150) for csp in (0, 1, 2, 7, 10, 50, 127, 200)]
+    trajectory = cursor_trajectory(np.stack([joy_x, -joy_x], axis=1), [{"JDZ": jdz, "CSP": csp} for jdz, csp in pairs])
+    mismatched = 0
+    for row, (jdz, csp) in enumerate(pairs):
+        for i, x in enumerate(joy_x.tolist()):
+            move = update_mouse_joystick(x, -x, jdz, csp) or (0, 0)
+            mismatched += move != (int(trajectory.dx[row, i]), int(trajectory.dy[row, i]))
+    expect(f"cursor steps == line-by-line ({len(pairs)} JDZ/CSP pairs x {len(joy_x)} deflections)", mismatched, 0)
+    expect("deadzone edge and full deflection (JDZ 20, CSP 10)",
+           [update_mouse_joystick(x, 0, 20, 10) for x in (102, 103, 511, -512)], [None, (1, 0), (9, 0), (-10, 0)])
+    expect("stick up moves the cursor up", update_mouse_joystick(0, 511, 20, 10), (0, -9))
+    single = cursor_trajectory(rng.integers(-512, 512, (500, 2)), {"JDZ": 15, "CSP": 12})
+    expect("x, y are the running sum of dx, dy", (np.cumsum(single.dx).tolist(), np.cumsum(single.dy).tolist()), (single.x.tolist(), single.y.tolist()))
+    trace = rng.integers(-512, 512, (3000, 2)); trace[::3] = 0
+    sets = [{"JDZ": jdz, "CSP": csp} for jdz in (5, 20, 60) for csp in (3, 10, 40)]
+    batch, summaries = cursor_trajectory(trace, sets), cursor_summary(trace, sets)
+    expected = [(round(float(np.hypot(batch.dx[i].astype(float), batch.dy[i].astype(float)).sum()), 6), int(batch.x[i, -1]), int(batch.y[i, -1]),
+                 round(float(np.count_nonzero(batch.speed[i]) / len(trace)), 6)) for i in range(len(sets))]
+    got = [(round(float(summaries.distance[i]), 6), int(summaries.net_x[i]), int(summaries.net_y[i]), round(float(summaries.moving_fraction[i]), 6)) for i in range(len(sets))]
+    expect(f"cursor summary == summed trajectory ({len(sets)} sets)", got, expected)
+
+    # updateKeyboardJoystick(): every deflection in the ADC range, for every sector count.
+    # The float code's rounding decides sticks on or within a hair of a boundary (the
+    # board's single and the app's double precision disagree there); everywhere else the
+    # table must give the same sector.
+    grid_x, grid_y = (a.ravel() for a in np.meshgrid(joy_x, joy_x, indexing="ij"))
+    angle = np.degrees(np.arctan2(-grid_y.astype(np.float64), grid_x.astype(np.float64))) % 360.0
+    rounding = {np.float32: [0, 0.0, 1e-3], np.float64: [0, 0.0, 1e-9]}  # [points, furthest from a boundary, allowed]
+    scalar, picks = JoystickSectors(), rng.integers(0, len(grid_x), 2000)
+    for n in range(1, JOYSTICK_SECTORS_MAX + 1):
+        table = joystick_sectors(grid_x, grid_y, n, -1)
+        width = 360.0 / n
+        offset = (angle - width / 2) % width
+        edge = np.minimum(offset, width - offset)
+        for dtype, stats in rounding.items():
+            differs = table != keyboard_joystick_sector_float(grid_x, grid_y, n, -1, dtype)
+            stats[0] += int(differs.sum()); stats[1] = max(stats[1], float(edge[differs].max(initial=0.0)))
+        expect(f"one-at-a-time lookup == vectorized ({n} sectors)", [scalar.sector(grid_x[i], grid_y[i], n, -1) for i in picks.tolist()], table[picks].tolist())
+        if joystick_binary:
+            expect(f"joystick_logic.h == vectorized ({n} sectors, {len(grid_x)} deflections)", int(np.count_nonzero(native_sectors(joystick_binary, n, -1) != table)), 0)
+    for dtype, (points, furthest, allowed) in rounding.items():
+        print(f"     float{np.dtype(dtype).itemsize * 8} sector differs at {points} deflection(s), all on or within {furthest:.1e} degrees of a boundary")
+        expect(f"table == float{np.dtype(dtype).itemsize * 8} sector away from boundaries", furthest <= allowed, True)
+    with open(JOYSTICK_LOGIC_HEADER) as f: expect("JOYSTICK_BOUNDARIES in joystick_logic.h == sector_table_source()", sector_table_source() in f.read(), True)
+    expect("stick on a boundary belongs to the sector starting there", [int(joystick_sectors(x, y, n, -1)) for x, y, n in ((100, -100, 4), (-100, -100, 4), (0, -100, 2), (-100, 0, 3))], [1, 2, 1, 2])
+    # JMT: x^2 + y^2 against the limit is exact; float rounding only matters right at the circle
+    squares = np.unique(grid_x * grid_x + grid_y * grid_y)
+    rounding = {np.float32: [0, 0.0, 1e-6], np.float64: [0, 0.0, 1e-12]}  # [deflections, furthest from the circle (relative), allowed]
+    for jmt in range(-3, 302):
+        near = squares[np.searchsorted(squares, (jmt * 5.12) ** 2 * 0.99):np.searchsorted(squares, (jmt * 5.12) ** 2 * 1.01 + 2)]
+        exact = near > sector_limit(jmt)
+        for dtype, stats in rounding.items():
+            differs = exact != (np.sqrt(near.astype(dtype)) / dtype(512.0) * dtype(100.0) > dtype(jmt))
+            stats[0] += int(differs.sum())
+            if differs.any(): stats[1] = max(stats[1], float(np.abs(np.sqrt(near[differs]) / (jmt * 5.12) - 1).max()))
+        if joystick_binary and jmt in (-1, 0, 10, 25, 57, 100, 289, 290, 301):
+            expect(f"joystick_logic.h == vectorized (8 sectors, JMT {jmt})", int(np.count_nonzero(native_sectors(joystick_binary, 8, jmt) != joystick_sectors(grid_x, grid_y, 8, jmt))), 0)
+    for dtype, (points, furthest, allowed) in rounding.items():
+        print(f"     float{np.dtype(dtype).itemsize * 8} JMT test differs at {points} (deflection, JMT) pair(s), all within {furthest:.1e} of the circle")
+        expect(f"limit == float{np.dtype(dtype).itemsize * 8} JMT test away from the circle", furthest <= allowed, True)
+    expect("JMT 25 keeps (128, 0) in and lets (129, 0) out", joystick_sectors([128, 129], [0, 0], 8, 25).tolist(), [-1, 0])
+    expect("out-of-range sector counts are clamped to 1..16", [joystick_sectors(-300, 5, n, 10).tolist() for n in (0, 1, 16, 17)], [0, 0, 8, 8])
+    if directory: directory.cleanup()
+
+    print(f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+def _load(args):
+    if args.path: return None, pressure_from_recording(args.path)
+    import json
+    script = None
+    if args.script:
+        with open(args.script) as f: script = json.load(f)
+    raw = raw_from_script(script, args.minutes * 60.0, seed=args.seed)
+    return raw, None
+
+
+def run_events(args):
+    raw, pressure = _load(args)
+    params = {name: getattr(args, name.lower()) for name in THRESHOLDS + SIGNAL_PARAMS if getattr(args, name.lower()) is not None}
+    if pressure is None: pressure = firmware_pressure(raw, params)
+    elif any(name in params for name in SIGNAL_PARAMS): raise SystemExit("A recording holds filtered pressure; sensitivities and PFW need --script input.")
+    events = simulate_events(pressure, params, args.mode)
+    for event in events:
+        print(f"{event['t_ms'] / 1000:10.3f} s  {EVENTS[event['event']]:13s} {event['arg']}")
+    print(f"{len(events)} events over {len(pressure) * SAMPLE_PERIOD_MS / 1000:.1f} s: {event_counts(events, params, args.mode)}", file=sys.stderr)
+
+
+def run_grid(args):
+    raw, pressure = _load(args)
+    grid = {name: _range(name, getattr(args, name.lower())) for name in THRESHOLDS + SIGNAL_PARAMS if getattr(args, name.lower())}
+    start = time.perf_counter()
+    if pressure is None: table = grid_search(raw, grid, args.mode)
+    elif any(name in grid for name in SIGNAL_PARAMS): raise SystemExit("A recording holds filtered pressure; sensitivities and PFW need --script input.")
+    else: table = grid_counts(pressure, grid, args.mode)
+    elapsed = time.perf_counter() - start
+    print(",".join(table.dtype.names))
+    for row in table.tolist(): print(",".join(str(v) for v in row))
+    ticks = len(pressure) if pressure is not None else len(raw)
+    print(f"{len(table)} combinations over {ticks * SAMPLE_PERIOD_MS / 60000:.1f} min of pressure in {elapsed * 1000:.0f} ms", file=sys.stderr)
+
+
+def run_cursor(args):
+    joy = joystick_from_recording(args.path)
+    sets = [{"JDZ": jdz, "CSP": csp} for jdz in args.jdz for csp in args.csp]
+    start = time.perf_counter()
+    summary = cursor_summary(joy, sets)
+    elapsed = time.perf_counter() - start
+    print("JDZ,CSP,distance,peak_speed,mean_speed,moving_fraction,net_x,net_y")
+    for i, p in enumerate(sets):
+        print(f"{p['JDZ']},{p['CSP']},{summary.distance[i]:.0f},{summary.peak_speed[i]:.0f},{summary.mean_speed[i]:.0f},"
+              f"{summary.moving_fraction[i]:.3f},{summary.net_x[i]},{summary.net_y[i]}")
+    print(f"{len(sets)} settings over {len(joy) * INPUT_UPDATE_PERIOD_MS / 60000:.1f} min of stick data in {elapsed * 1000:.0f} ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline model of the firmware's pressure path.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("check", help="Parity of the vectorized model with a line-by-line port of V3.ino and with pressure_logic.h.")
+    p.add_argument("--rounds", type=int, default=20); p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(run=run_check)
+    for name, run, text in (("events", run_events, "Events the firmware would send for one parameter set."),
+                            ("grid", run_grid, "Event counts for every combination of parameters, as CSV.")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("path", nargs="?", help="A recording (its P: stream); without it, raw readings from --script")
+        p.add_argument("--script", help="virtual_controller.py waveform script (default: its demo waveform)")
+        p.add_argument("--minutes", type=float, default=60.0, help="Length of the scripted input")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--mode", choices=["mouse", "keyboard"], default="mouse")
+        for option in THRESHOLDS + SIGNAL_PARAMS:
+            if name == "events": p.add_argument("--" + option.lower().replace("_", "-"), dest=option.lower(), type=int)
+            else: p.add_argument("--" + option.lower().replace("_", "-"), dest=option.lower(), type=int, nargs="+", help="VALUE, or START STOP STEP")
+        p.set_defaults(run=run)
+    p = sub.add_parser("sectors", help="Print the JOYSTICK_BOUNDARIES table of joystick_logic.h.")
+    p.set_defaults(run=lambda args: print(sector_table_source()))
+    p = sub.add_parser("cursor", help="Cursor travel and speed of a recording's stick movement under JDZ/CSP settings, as CSV.")
+    p.add_argument("path", help="A recording (its JOY: stream)")
+    p.add_argument("--jdz", type=int, nargs="+", default=[JOYSTICK_DEFAULTS["JDZ"]])
+    p.add_argument("--csp", type=int, nargs="+", default=[JOYSTICK_DEFAULTS["CSP"]])
+    p.set_defaults(run=run_cursor)
+    args = parser.parse_args()
+    sys.exit(args.run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+// =================================================================
+// Joystick sector lookup for V3.ino keyboard mode
+// =================================================================
+// Integer only, with no Arduino dependencies, so the same code builds on a desktop
+// compiler for checks without a board (firmware_sim.py check compares it with the float
+// code it replaced at every deflection in the ADC range).
+
+#ifndef JOYSTICK_LOGIC_H
+#define JOYSTICK_LOGIC_H
+
+#include <stdint.h>
+#include <string.h>
+#ifdef __AVR__
+#include <avr/pgmspace.h>
+#else
+#define PROGMEM
+#define memcpy_P memcpy
+#endif
+
+#define JOYSTICK_SECTORS_MAX 16  // Rows of joy_keybinds
+#define JOYSTICK_AXIS_MAX 1023   // Largest |analogRead() - centre|; the arithmetic below relies on it
+
+// Sector i covers (i - 0.5) to (i + 0.5) * 360 / N degrees counter-clockwise from stick
+// right, with y flipped as atan2(-y, x) had it; a stick exactly on a boundary belongs to
+// the sector that starts there. Each boundary direction is stored scaled to 2^36, as its
+// signed high part (value >> 16) and low 16 bits: the high parts settle which side of the
+// boundary a deflection is on except within a hair of it, and the exact test there still
+// fits in 32 bits. The board's float sin() and cos() are not precise enough to build the
+// table, so it is worked out beforehand for every N.
+struct JoystickBoundary { int32_t hiX, hiY; uint16_t loX, loY; };
+
+// N = 1..16 in turn, boundary i of N at N * (N - 1) / 2 + i. From: python firmware_sim.py sectors
+const JoystickBoundary JOYSTICK_BOUNDARIES[] PROGMEM = {
+  {-1048576, 0, 0, 0},  // N = 1
+  {0, 1048576, 0, 0}, {0, -1048576, 0, 0},  // N = 2
+  {524288, 908093, 0, 29740}, {-1048576, 0, 0, 0}, {524288, -908094, 0, 35796},  // N = 3
+  {741455, 741455, 13120, 13120}, {-741456, 741455, 52416, 13120}, {-741456, -741456, 52416, 52416}, {741455, -741456, 13120, 52416},  // N = 4
+  {848315, 616337, 52684, 33339}, {-324028, 997255, 12852, 2466}, {-1048576, 0, 0, 0}, {-324028, -997256, 12852, 63070},  // N = 5
+  {848315, -616338, 52684, 32197},
+  {908093, 524288, 29740, 0}, {0, 1048576, 0, 0}, {-908094, 524288, 35796, 0}, {-908094, -524288, 35796, 0},  // N = 6
+  {0, -1048576, 0, 0}, {908093, -524288, 29740, 0},
+  {944734, 454960, 21734, 4956}, {233330, 1022286, 7264, 684}, {-653777, 819809, 36538, 47747}, {-1048576, 0, 0, 0},  // N = 7
+  {-653777, -819810, 36538, 17789}, {233330, -1022287, 7264, 64852}, {944734, -454961, 21734, 60580},
+  {968757, 401272, 59289, 43436}, {401272, 968757, 43436, 59289}, {-401273, 968757, 22100, 59289}, {-968758, 401272, 6247, 43436},  // N = 8
+  {-968758, -401273, 6247, 22100}, {-401273, -968758, 22100, 6247}, {401272, -968758, 43436, 6247}, {968757, -401273, 59289, 22100},
+  {985339, 358634, 8489, 7459}, {524288, 908093, 0, 29740}, {-182084, 1032645, 45119, 50753}, {-803256, 674011, 11928, 43294},  // N = 9
+  {-1048576, 0, 0, 0}, {-803256, -674012, 11928, 22242}, {-182084, -1032646, 45119, 14783}, {524288, -908094, 0, 35796},
+  {985339, -358635, 8489, 58077},
+  {997255, 324027, 2466, 52684}, {616337, 848315, 33339, 52684}, {0, 1048576, 0, 0}, {-616338, 848315, 32197, 52684},  // N = 10
+  {-997256, 324027, 63070, 52684}, {-997256, -324028, 63070, 12852}, {-616338, -848316, 32197, 12852}, {0, -1048576, 0, 0},
+  {616337, -848316, 33339, 12852}, {997255, -324028, 2466, 12852},
+  {1006101, 295417, 19943, 65374}, {686671, 792460, 16316, 56733}, {149227, 1037903, 60546, 540}, {-435595, 953818, 51598, 18295},  // N = 11
+  {-882119, 566902, 48206, 64606}, {-1048576, 0, 0, 0}, {-882119, -566903, 48206, 930}, {-435595, -953819, 51598, 47241},
+  {149227, -1037904, 60546, 64996}, {686671, -792461, 16316, 8803}, {1006101, -295418, 19943, 162},
+  {1012846, 271391, 41892, 28773}, {741455, 741455, 13120, 13120}, {271391, 1012846, 28773, 41892}, {-271392, 1012846, 36763, 41892},  // N = 12
+  {-741456, 741455, 52416, 13120}, {-1012847, 271391, 23644, 28773}, {-1012847, -271392, 23644, 36763}, {-741456, -741456, 52416, 52416},
+  {-271392, -1012847, 36763, 23644}, {271391, -1012847, 28773, 23644}, {741455, -741456, 13120, 52416}, {1012846, -271392, 41892, 36763},
+  {1018106, 250940, 18819, 43385}, {784870, 695334, 26626, 33062}, {371830, 980435, 11406, 38777}, {-126392, 1040930, 8517, 45899},  // N = 13
+  {-595660, 862961, 61612, 8530}, {-928468, 487297, 4092, 37018}, {-1048576, 0, 0, 0}, {-928468, -487298, 4092, 28518},
+  {-595660, -862962, 61612, 57006}, {-126392, -1040931, 8517, 19637}, {371830, -980436, 11406, 26759}, {784870, -695335, 26626, 32474},
+  {1018106, -250941, 18819, 22151},
+  {1022286, 233330, 684, 7264}, {819809, 653776, 47747, 28998}, {454960, 944734, 4956, 21734}, {0, 1048576, 0, 0},  // N = 14
+  {-454961, 944734, 60580, 21734}, {-819810, 653776, 17789, 28998}, {-1022287, 233330, 64852, 7264}, {-1022287, -233331, 64852, 58272},
+  {-819810, -653777, 17789, 36538}, {-454961, -944735, 60580, 43802}, {0, -1048576, 0, 0}, {454960, -944735, 4956, 43802},
+  {819809, -653777, 47747, 36538}, {1022286, -233331, 684, 58272},
+  {1025662, 218011, 6461, 13704}, {848315, 616337, 52684, 33339}, {524288, 908093, 0, 29740}, {109606, 1042831, 2484, 51836},  // N = 15
+  {-324028, 997255, 12852, 2466}, {-701635, 779243, 46223, 54298}, {-957922, 426494, 10368, 18498}, {-1048576, 0, 0, 0},
+  {-957922, -426495, 10368, 47038}, {-701635, -779244, 46223, 11238}, {-324028, -997256, 12852, 63070}, {109606, -1042832, 2484, 13700},
+  {524288, -908094, 0, 35796}, {848315, -616338, 52684, 32197}, {1025662, -218012, 6461, 51832},
+  {1028427, 204567, 59388, 1933}, {871859, 582557, 5255, 40151}, {582557, 871859, 40151, 5255}, {204567, 1028427, 1933, 59388},  // N = 16
+  {-204568, 1028427, 63603, 59388}, {-582558, 871859, 25385, 5255}, {-871860, 582557, 60281, 40151}, {-1028428, 204567, 6148, 1933},
+  {-1028428, -204568, 6148, 63603}, {-871860, -582558, 60281, 25385}, {-582558, -871860, 25385, 60281}, {-204568, -1028428, 63603, 6148},
+  {204567, -1028428, 1933, 6148}, {582557, -871860, 40151, 60281}, {871859, -582558, 5255, 25385}, {1028427, -204568, 59388, 63603},
+};
+
+struct JoystickSectors {
+  int16_t sections;                      // Sector count the table was built for, as requested
+  int16_t threshold;                     // JMT the limit was worked out for
+  int32_t limit;                         // Largest x^2 + y^2 inside JMT percent of 512
+  uint8_t count;                         // Sectors in use, 1..JOYSTICK_SECTORS_MAX
+  uint16_t upper;                        // Bit i: boundary i lies between 0 and 180 degrees
+  JoystickBoundary boundaries[JOYSTICK_SECTORS_MAX];
+};
+
+// Copies the boundaries for `sections` sectors (clamped to 1..16) out of flash
+inline void joystickSectorsInit(JoystickSectors* s, int16_t sections) {
+  uint8_t count = sections < 1 ? 1 : sections > JOYSTICK_SECTORS_MAX ? JOYSTICK_SECTORS_MAX : sections;
+  s->sections = sections; s->count = count; s->upper = 0;
+  memcpy_P(s->boundaries, &JOYSTICK_BOUNDARIES[count * (count - 1) / 2], count * sizeof(JoystickBoundary));
+  for (uint8_t i = 0; i < count; i++) {
+    const JoystickBoundary* b = &s->boundaries[i];
+    if (b->hiY > 0 || (b->hiY == 0 && b->loY > 0)) s->upper |= 1u << i;  // No boundary lies at 0 degrees
+  }
+}
+
+// sqrt(x^2 + y^2) / 512 * 100 > JMT is (x^2 + y^2) * 625 > JMT^2 * 16384. Past 289 percent
+// no deflection in range gets out, so JMT is capped at 300 to keep the product in 32 bits.
+inline void joystickSectorsSetThreshold(JoystickSectors* s, int16_t jmt) {
+  s->threshold = jmt;
+  int32_t capped = jmt > 300 ? 300 : jmt;
+  s->limit = jmt < 0 ? -1 : capped * capped * 16384 / 625;
+}
+
+// Whether direction (u, v) is at or past boundary i, angles counted from 0 to 360
+inline bool joystickPastBoundary(const JoystickSectors* s, uint8_t i, int16_t u, int16_t v) {
+  bool upper = v > 0 || (v == 0 && u > 0);
+  if (upper != ((s->upper >> i) & 1)) return !upper;
+  // Same half: the cross product of boundary and stick orders them
+  const JoystickBoundary* b = &s->boundaries[i];
+  int32_t high = b->hiX * v - b->hiY * u;
+  // The low parts add less than 65536 * (|u| + |v|) <= 65536 * 2 * JOYSTICK_AXIS_MAX to high * 65536
+  if (high > 2 * JOYSTICK_AXIS_MAX) return true;
+  if (high < -2 * JOYSTICK_AXIS_MAX) return false;
+  return high * 65536 + ((int32_t)b->loX * v - (int32_t)b->loY * u) >= 0;
+}
+
+// The sector the stick points into, or -1 while it is at or inside JMT
+inline int8_t joystickSector(const JoystickSectors* s, int16_t x, int16_t y) {
+  int16_t u = x, v = -y;
+  if ((int32_t)u * u + (int32_t)v * v <= s->limit) return -1;
+  uint8_t low = 0, high = s->count;  // Boundaries are in angle order: count those the stick has passed
+  while (low < high) {
+    uint8_t mid = (low + high) / 2;
+    if (joystickPastBoundary(s, mid, u, v)) low = mid + 1;
+    else high = mid;
+  }
+  return low == s->count ? 0 : low;
+}
+
+#endif
@@ -0,0 +1,115 @@
+// =================================================================
+// Pressure filter and sip/puff state machines for V3.ino
+// =================================================================
+// No Arduino dependencies, so the same code builds on a desktop compiler for checks
+// without a board (firmware_sim.py check compiles it with the system C++ compiler).
+// Fixed-width types give a desktop build the same arithmetic as the AVR's 16-bit int
+// and 32-bit long.
+
+#ifndef PRESSURE_LOGIC_H
+#define PRESSURE_LOGIC_H
+
+#include <stdint.h>
+
+#define PRESSURE_WINDOW_MAX 32
+#define PRESSURE_WINDOW_DEFAULT 10  // Same noise rejection as the 10-sample block average it replaces
+#define SCROLL_REPEAT_TICKS 10      // Soft sip/puff scroll once per 10 samples (50 ms) while held
+
+// --- Sliding-window average ---
+// A ring of the last `window` samples and their running sum, so every new sample gives a
+// new average in constant time instead of one average per block of samples.
+struct PressureFilter {
+  int16_t samples[PRESSURE_WINDOW_MAX];
+  int32_t sum;
+  uint8_t window;
+  uint8_t next;
+  uint8_t count;
+};
+
+inline void pressureFilterInit(PressureFilter* f, uint8_t window) {
+  if (window < 1) window = 1;
+  if (window > PRESSURE_WINDOW_MAX) window = PRESSURE_WINDOW_MAX;
+  f->window = window; f->next = 0; f->count = 0; f->sum = 0;
+}
+
+// Adds a sample and returns the average of the last `window` samples (of all of them
+// while fewer have come in since the last init), truncated toward zero.
+inline int16_t pressureFilterAdd(PressureFilter* f, int16_t sample) {
+  if (f->count == f->window) f->sum -= f->samples[f->next];
+  else f->count++;
+  f->samples[f->next] = sample;
+  f->sum += sample;
+  if (++f->next == f->window) f->next = 0;
+  return (int16_t)(f->sum / f->count);
+}
+
+// --- State machines ---
+// Run on every filtered sample. They only decide; the sketch makes the Mouse/Keyboard calls.
+struct PressureThresholds {
+  int16_t hardSip, neutralMin, softPuff, hardPuff;
+};
+
+// Mouse actions, to be carried out in this order
+#define PRESSURE_PRESS_LEFT 0x01
+#define PRESSURE_RELEASE_LEFT 0x02
+#define PRESSURE_PRESS_RIGHT 0x04
+#define PRESSURE_RELEASE_RIGHT 0x08
+#define PRESSURE_SCROLL_UP 0x10
+#define PRESSURE_SCROLL_DOWN 0x20
+
+struct PressureMouse {
+  bool left, right;
+  int8_t scrollDirection;  // 1 soft puff, -1 soft sip, 0 neither
+  uint8_t scrollTicks;     // Samples since the last scroll step
+};
+
+inline void pressureMouseReset(PressureMouse* m) {
+  m->left = false; m->right = false; m->scrollDirection = 0; m->scrollTicks = 0;
+}
+
+// Hard puff holds the left button and hard sip the right one. Soft puff/sip scroll one
+// step as soon as the pressure enters their band, then every SCROLL_REPEAT_TICKS samples.
+inline uint8_t pressureMouseStep(PressureMouse* m, const PressureThresholds* t, int16_t pressure) {
+  uint8_t actions = 0;
+  bool hardPuff = pressure >= t->hardPuff;
+  bool hardSip = pressure <= t->hardSip;
+  if (hardPuff != m->left) { actions |= hardPuff ? PRESSURE_PRESS_LEFT : PRESSURE_RELEASE_LEFT; m->left = hardPuff; }
+  if (hardSip != m->right) { actions |= hardSip ? PRESSURE_PRESS_RIGHT : PRESSURE_RELEASE_RIGHT; m->right = hardSip; }
+
+  int8_t direction = 0;
+  if (pressure >= t->softPuff && pressure < t->hardPuff) direction = 1;
+  else if (pressure <= t->neutralMin && pressure > t->hardSip) direction = -1;
+  if (direction != m->scrollDirection) { m->scrollDirection = direction; m->scrollTicks = 0; }
+  if (direction != 0) {
+    if (m->scrollTicks == 0) actions |= direction > 0 ? PRESSURE_SCROLL_UP : PRESSURE_SCROLL_DOWN;
+    if (++m->scrollTicks == SCROLL_REPEAT_TICKS) m->scrollTicks = 0;
+  }
+  return actions;
+}
+
+// Keyboard: one bit per pressure key, in the order the keys are handled
+#define PRESSURE_KEY_HPT 0x01
+#define PRESSURE_KEY_SPT 0x02
+#define PRESSURE_KEY_HST 0x04
+#define PRESSURE_KEY_SST 0x08
+
+struct PressureKeyboard {
+  uint8_t held;  // PRESSURE_KEY_* bits of the keys currently pressed
+};
+
+inline void pressureKeyboardReset(PressureKeyboard* k) { k->held = 0; }
+
+// Each key is held while the pressure is in its band. Returns the keys whose state
+// changed; k->held then says whether each of them is to be pressed or released.
+inline uint8_t pressureKeyboardStep(PressureKeyboard* k, const PressureThresholds* t, int16_t pressure) {
+  uint8_t held = 0;
+  if (pressure >= t->hardPuff) held |= PRESSURE_KEY_HPT;
+  if (pressure >= t->softPuff && pressure < t->hardPuff) held |= PRESSURE_KEY_SPT;
+  if (pressure <= t->hardSip) held |= PRESSURE_KEY_HST;
+  if (pressure <= t->neutralMin && pressure > t->hardSip) held |= PRESSURE_KEY_SST;
+  uint8_t changed = held ^ k->held;
+  k->held = held;
+  return changed;
+}
+
+#endif
@@ -0,0 +1,176 @@
+# --- START OF FILE recorder.py ---
+#
+# Append-only session recordings of the controller's telemetry. A recording is a
+# 32-byte header followed by fixed-size RECORD_DTYPE records, so a file of any
+# length (even one cut short by a crash) opens instantly with np.memmap.
+#
+#   python recorder.py recordings/session-20240101-120000-000.mrec   summarise a file
+
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+RECORDINGS_DIR = "recordings"
+RECORDING_SUFFIX = ".mrec"
+
+# Header: magic, wall-clock time and time.monotonic() when the file was opened (to turn
+# record timestamps into dates), and the record size as a format check.
+HEADER_MAGIC = b"MOMREC01"
+HEADER_FORMAT = "<8sddI4x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# t: time.monotonic() when the sample was received. a: pressure, or joystick x. b: joystick y.
+# Each topic is written in the order received, but topics are interleaved in per-pump batches:
+# sort on t for one time line across topics.
+RECORD_DTYPE = np.dtype([("t", "<f8"), ("kind", "u1"), ("a", "<i2"), ("b", "<i2")])
+RECORD_KINDS = {"P": 0, "JOY": 1, "CALIB_P": 2}
+KIND_NAMES = {code: kind for kind, code in RECORD_KINDS.items()}
+TOPIC_KINDS = {"pressure": "P", "joystick": "JOY", "calib_pressure": "CALIB_P"}
+
+
+class SessionRecorder:
+    """Writes every P/JOY/CALIB_P sample to rotating recording files in `directory`.
+
+    Samples are collected into a preallocated record array and written out when it holds
+    `flush_records` samples or `flush_interval_s` has passed, so the cost per sample is
+    one array store. A new file is started once the current one reaches `max_file_bytes`,
+    and each time one is, the oldest recordings in `directory` are deleted to keep the
+    total within `max_total_bytes` (None keeps everything).
+    Not thread-safe: call record() from one thread (the app feeds it from the Tk pump).
+    """
+
+    def __init__(self, directory=RECORDINGS_DIR, max_file_bytes=64 * 1024 * 1024, max_total_bytes=512 * 1024 * 1024,
+                 flush_records=4096, flush_interval_s=1.0):
+        self.directory = directory
+        self.max_records_per_file = max(1, (max_file_bytes - HEADER_SIZE) // RECORD_DTYPE.itemsize)
+        self.max_total_bytes = max_total_bytes
+        self.flush_interval_s = flush_interval_s
+        self._buffer = np.zeros(flush_records, dtype=RECORD_DTYPE)
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._file_records = 0
+        self.path = None
+        self.paths = []
+        self.records_written = 0
+
+    @property
+    def recording(self):
+        return self._file is not None
+
+    def start(self):
+        if self._file is None: self._open_file()
+        return self.path
+
+    def _open_file(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        for n in range(1000):
+            path = os.path.join(self.directory, f"session-{stamp}-{n:03d}{RECORDING_SUFFIX}")
+            if not os.path.exists(path): break
+        self._file = open(path, "xb")
+        self._file.write(struct.pack(HEADER_FORMAT, HEADER_MAGIC, time.time(), time.monotonic(), RECORD_DTYPE.itemsize))
+        self._file_records = 0
+        self.path = path; self.paths.append(path)
+        if self.max_total_bytes is not None:
+            # Room for the file just started to fill up too; it is never deleted itself
+            prune_recordings(self.directory, self.max_total_bytes - self.max_records_per_file * RECORD_DTYPE.itemsize, keep=(path,))
+
+    def record(self, kind, value, t=None):
+        code = RECORD_KINDS.get(kind)
+        if code is None or self._file is None: return
+        if t is None: t = time.monotonic()
+        a, b = value if kind == "JOY" else (value, 0)
+        self._buffer[self._buffered] = (t, code, a, b)
+        self._buffered += 1
+        if self._buffered == len(self._buffer) or t - self._last_flush >= self.flush_interval_s: self.flush()
+
+    def on_sample(self, sample):
+        """TelemetryBus subscriber callback."""
+        self.record(TOPIC_KINDS[sample.topic], sample.value, sample.t)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if self._file is None or not self._buffered: return
+        pending = self._buffer[:self._buffered]
+        while len(pending):
+            room = self.max_records_per_file - self._file_records
+            if room <= 0:
+                self._file.close(); self._open_file(); continue
+            chunk = pending[:room]
+            self._file.write(chunk.tobytes())
+            self._file_records += len(chunk); self.records_written += len(chunk)
+            pending = pending[len(chunk):]
+        self._file.flush()
+        self._buffered = 0
+
+    def stop(self):
+        if self._file is None: return
+        try: self.flush()
+        finally:
+            self._file.close(); self._file = None; self._buffered = 0
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE: raise ValueError(f"{path} is too short to be a recording")
+    magic, wall_time, monotonic_time, record_size = struct.unpack(HEADER_FORMAT, raw)
+    if magic != HEADER_MAGIC or record_size != RECORD_DTYPE.itemsize: raise ValueError(f"{path} is not a recording in this format")
+    return {"wall_time": wall_time, "monotonic_time": monotonic_time}
+
+
+def open_recording(path):
+    """Returns (header, records): records is a read-only np.memmap of RECORD_DTYPE over the
+    whole file, without reading it. A partly written last record is left out."""
+    header = read_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0: return header, np.zeros(0, dtype=RECORD_DTYPE)
+    return header, np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def recording_files(directory=RECORDINGS_DIR):
+    if not os.path.isdir(directory): return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(RECORDING_SUFFIX))
+
+
+def prune_recordings(directory, max_bytes, keep=()):
+    """Deletes the oldest recordings in `directory` until the rest take at most `max_bytes`.
+    Files in `keep` are left alone but count towards the total. Returns the deleted paths."""
+    sizes = [(path, os.path.getsize(path)) for path in recording_files(directory)]  # Named by start time, oldest first
+    total = sum(size for _, size in sizes)
+    deleted = []
+    for path, size in sizes:
+        if total <= max_bytes: break
+        if path in keep: continue
+        try: os.remove(path)
+        except OSError: continue
+        total -= size; deleted.append(path)
+    return deleted
+
+
+def summarize(path):
+    header, records = open_recording(path)
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(header["wall_time"]))
+    duration = float(records["t"][-1] - records["t"][0]) if len(records) > 1 else 0.0
+    print(f"{path}: {len(records)} records, started {started}, {duration:.1f} s")
+    codes, counts = np.unique(records["kind"], return_counts=True)
+    for code, count in zip(codes, counts):
+        values = records["a"][records["kind"] == code]
+        rate = count / duration if duration else 0.0
+        print(f"  {KIND_NAMES.get(int(code), code):8s} {count:9d} samples  {rate:7.1f} Hz  a: min {values.min()} max {values.max()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise telemetry recordings written by the app.")
+    parser.add_argument("paths", nargs="*", help=f"Recording files (default: everything in {RECORDINGS_DIR}/)")
+    args = parser.parse_args()
+    for path in args.paths or recording_files():
+        summarize(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# --- START OF FILE replay.py ---
+#
+# Replays telemetry recorded by recorder.py through the app's live input path, to
+# reproduce what a user saw and to profile the GUI under a real workload:
+#   python replay.py recordings/session-....mrec                 real time
+#   python replay.py recordings/session-....mrec --speed 4       4x
+#   python replay.py recordings/session-....mrec --fast --tab calibrate
+
+import argparse
+import asyncio
+
+import numpy as np
+
+from recorder import KIND_NAMES, RECORD_KINDS, open_recording
+from serial_link import TELEMETRY_DECODERS, encode_frame
+
+
+class SessionReplay:
+    """Feeds recorded records back through the decoder the live SerialTransport uses.
+
+    Records are turned back into wire bytes (text lines or binary frames), handed to a
+    TELEMETRY_DECODERS decoder in chunks, and every decoded record goes to
+    on_record(kind, value) exactly as the transport delivers it. speed is 1.0 for real
+    time, N for N times real time, or None for as fast as possible.
+    """
+
+    TICK_S = 0.005  # Paced replay hands over at most one firmware loop tick of samples at a time
+
+    def __init__(self, records, on_record, protocol="text", speed=1.0, chunk_records=256):
+        if len(records) > 1 and (np.diff(records["t"]) < 0).any():
+            records = records[np.argsort(records["t"], kind="stable")]  # Topics are recorded in per-pump batches
+        self.records = records
+        self.on_record = on_record
+        self.protocol = protocol
+        self.speed = speed
+        self.chunk_records = chunk_records
+        self.decoder = TELEMETRY_DECODERS[protocol]()
+        self.replayed = 0
+        self._seq = 0
+        self._stopped = False
+
+    def chunks(self):
+        """Yields (due_s, data): the wire bytes of consecutive records and when, from the
+        start of the replay, the last of them is due (always 0 when replaying flat out)."""
+        n = len(self.records)
+        if not n: return
+        offsets = None
+        if self.speed:
+            t = np.asarray(self.records["t"], dtype=np.float64)
+            offsets = (t - t[0]) / self.speed
+        i = 0
+        while i < n:
+            j = min(n, i + self.chunk_records)
+            if offsets is not None: j = min(j, max(i + 1, int(np.searchsorted(offsets, offsets[i] + self.TICK_S))))
+            yield (float(offsets[j - 1]) if offsets is not None else 0.0), self.encode(self.records[i:j])
+            i = j
+
+    def encode(self, rows):
+        joy = RECORD_KINDS["JOY"]
+        rows = zip(rows["kind"].tolist(), rows["a"].tolist(), rows["b"].tolist())
+        if self.protocol == "binary":
+            out = bytearray()
+            for code, a, b in rows:
+                out += encode_frame(KIND_NAMES[code], (a, b) if code == joy else a, self._seq); self._seq = (self._seq + 1) & 0xFF
+            return bytes(out)
+        return "".join(f"JOY:{a},{b}\n" if code == joy else f"{KIND_NAMES[code]}:{a}\n" for code, a, b in rows).encode()
+
+    def feed(self, data):
+        for kind, value in self.decoder.feed(data):
+            self.on_record(kind, value); self.replayed += 1
+
+    async def run(self, backlog=None):
+        """Replays everything on the running loop and returns the number of records delivered.
+        Flat out, `backlog()` returning True holds the replay back until the consumer catches up."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for due, data in self.chunks():
+            if self._stopped: break
+            if self.speed:
+                delay = start + due - loop.time()
+                if delay > 0: await asyncio.sleep(delay)
+            else:
+                while backlog and backlog() and not self._stopped: await asyncio.sleep(0.001)
+                await asyncio.sleep(0)
+            self.feed(data)
+        return self.replayed
+
+    def stop(self):
+        self._stopped = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a telemetry recording into the app.")
+    parser.add_argument("path", help="A recording written by the app (recordings/session-*.mrec)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1.0 = real time.")
+    parser.add_argument("--fast", action="store_true", help="As fast as the app keeps up.")
+    parser.add_argument("--protocol", choices=["text", "binary"], default="text", help="Wire format to replay as.")
+    parser.add_argument("--tab", choices=["stick", "calibrate"], default="stick", help="Tab to show (calibrate starts the pressure graph).")
+    args = parser.parse_args()
+    open_recording(args.path)  # Fail here, before opening a window, if it is not a recording
+
+    import customtkinter as ctk
+    from app import IntegratedHybridApp
+    root = ctk.CTk()
+    app = IntegratedHybridApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
+
+    def start():
+        tab = "Calibrate Sensor" if args.tab == "calibrate" else "Stick Control"
+        app.tab_view.set(tab); app.on_tab_change(tab)
+        app.start_replay(args.path, None if args.fast else args.speed, args.protocol)
+        if args.tab == "calibrate": app.start_arduino_calibration_mode()
+
+    root.after(200, start)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
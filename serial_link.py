@@ -0,0 +1,548 @@
+# --- START OF FILE serial_link.py ---
+#
+# Serial plumbing shared by app.py and the command-line tools. Nothing in here
+# touches Tk, so it can be imported without a display.
+
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+
+import serial
+import serial.tools.list_ports
+
+# Last line of setup() in V3.ino
+READY_BANNER = "INFO:Controller Ready"
+
+# Where virtual_controller.py links its pseudo-terminal, so the app can list it as a port.
+VIRTUAL_PORT_LINK = os.path.join(tempfile.gettempdir(), "ttyVirtualMouse")
+
+# Binary telemetry frames (see "Telemetry Protocol" in V3.ino):
+#   [0xA5][type][seq][int16 little-endian values...][checksum = sum(type..last value byte) & 0xFF]
+BINARY_PROTOCOL_CAP = "BIN1"
+FRAME_SYNC = 0xA5
+FRAME_FORMATS = {
+    0x01: ("P", struct.Struct('<BBBhB')),
+    0x02: ("JOY", struct.Struct('<BBBhhB')),
+    0x03: ("CALIB_P", struct.Struct('<BBBhB')),
+}
+
+# Bulk profile command (see "Bulk Profile" in V3.ino):
+#   SET_PROFILE:<PROFILE_FIELDS values>,<key1>,<key2> per sector*<Fletcher-16 of the payload, 4 hex digits>
+PROFILE_CAP = "PROFILE1"
+READBACK_CAP = "ALL1"  # GET_ALL answers "ALL:<SET_PROFILE payload>*<checksum>"
+PRESSURE_FILTER_CAP = "PFW1"  # SET_PFW:<1..32> sets the pressure filter window in samples; not part of SET_PROFILE
+STREAM_CAP = "STREAM1"  # STREAM:<P|JOY|ALL>,<ON|OFF|EVERY,n|CHANGE,delta> (see "Telemetry Streams" in V3.ino)
+PROFILE_FIELDS = ("HST", "NMIN", "NMAX", "SPT", "HPT", "JDZ", "JMT", "CSP", "SAD", "SIP_SENS", "PUFF_SENS",
+                  "KEY_HPT", "KEY_SPT", "KEY_HST", "KEY_SST", "NUM_SECTORS")
+MAX_SECTORS = 16
+COMMAND_MAX_LENGTH = 255  # V3.ino's command buffer; longer lines are answered with "ERR:Line too long"
+
+
+def parse_telemetry_line(line):
+    """Turns one text line from V3.ino into a (kind, value) record, or None if it is malformed."""
+    try:
+        if line.startswith("CALIB_P:"):
+            return ("CALIB_P", int(line[8:]))
+        if line.startswith("P:"):
+            return ("P", int(line[2:]))
+        if line.startswith("JOY:"):
+            x_str, y_str = line[4:].split(',')
+            return ("JOY", (int(x_str), int(y_str)))
+        if line.startswith("ACK:") or line.startswith("ERR:") or line.startswith("INFO:"):
+            return ("MSG", line)
+        if line.startswith("CAPS:"):
+            return ("CAPS", line[5:].split(','))
+        if line.startswith("ALL:"):
+            return ("ALL", line[4:])
+    except ValueError:
+        pass
+    return None
+
+
+class LineSplitter:
+    """Splits newline-terminated lines out of arbitrarily chunked serial bytes."""
+
+    def __init__(self, max_line_len=256):
+        self.max_line_len = max_line_len
+        self._pending = bytearray()
+
+    def feed(self, data):
+        self._pending += data
+        if b'\n' not in data:
+            if len(self._pending) > self.max_line_len: self._pending.clear()  # No newline in sight, drop the garbage
+            return []
+        *complete, rest = self._pending.split(b'\n')
+        self._pending = bytearray(rest)
+        lines = []
+        for raw in complete:
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line: lines.append(line)
+        return lines
+
+    def reset(self):
+        self._pending.clear()
+
+
+class TextDecoder:
+    """Decodes the default line-based protocol into telemetry records."""
+
+    def __init__(self):
+        self.splitter = LineSplitter()
+
+    def feed(self, data):
+        records = []
+        for line in self.splitter.feed(data):
+            record = parse_telemetry_line(line)
+            if record: records.append(record)
+        return records
+
+
+class BinaryDecoder:
+    """Decodes binary telemetry frames with struct over a memoryview of the receive buffer.
+
+    Text lines (ACK/ERR/INFO, and telemetry still in flight from before the switch) can
+    be interleaved with frames; anything between frames goes through the text parser.
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._text = LineSplitter()
+        self._last_seq = None
+        self.frames = 0
+        self.bad_frames = 0
+        self.lost_frames = 0
+
+    def feed(self, data):
+        buf = self._pending
+        buf += data
+        records = []
+        append, formats = records.append, FRAME_FORMATS
+        pos, end = 0, len(buf)
+        with memoryview(buf) as view:
+            while pos < end:
+                if buf[pos] != FRAME_SYNC:
+                    sync = buf.find(FRAME_SYNC, pos)
+                    stop = end if sync == -1 else sync
+                    for line in self._text.feed(buf[pos:stop]):
+                        record = parse_telemetry_line(line)
+                        if record: append(record)
+                    pos = stop
+                    continue
+                if end - pos < 2: break
+                frame = formats.get(buf[pos + 1])
+                if frame is None:
+                    self.bad_frames += 1; pos += 1; continue
+                kind, fmt = frame
+                if end - pos < fmt.size: break
+                fields = fmt.unpack_from(view, pos)
+                if sum(view[pos + 1:pos + fmt.size - 1]) & 0xFF != fields[-1]:
+                    self.bad_frames += 1; pos += 1; continue
+                seq = fields[2]
+                if self._last_seq is not None: self.lost_frames += (seq - self._last_seq - 1) & 0xFF
+                self._last_seq = seq
+                self.frames += 1
+                append((kind, (fields[3], fields[4]) if kind == "JOY" else fields[3]))
+                pos += fmt.size
+        del buf[:pos]
+        return records
+
+
+TELEMETRY_DECODERS = {"text": TextDecoder, "binary": BinaryDecoder}
+
+
+def fletcher16(data):
+    sum1 = sum2 = 0
+    for byte in data:
+        sum1 = (sum1 + byte) % 255; sum2 = (sum2 + sum1) % 255
+    return (sum2 << 8) | sum1
+
+
+def encode_profile_command(values, joy_keys):
+    """Builds one SET_PROFILE line. `values` is keyed like PROFILE_FIELDS (NUM_SECTORS is taken
+    from joy_keys), `joy_keys` is a (key1, key2) code pair per sector."""
+    fields = [int(values[key]) for key in PROFILE_FIELDS[:-1]] + [len(joy_keys)]
+    fields += [code for pair in joy_keys for code in pair]
+    payload = ",".join(str(v) for v in fields)
+    return f"SET_PROFILE:{payload}*{fletcher16(payload.encode('ascii')):04X}"
+
+
+def decode_profile_payload(payload):
+    """Inverse of encode_profile_command for everything after "SET_PROFILE:". Validates like
+    the firmware does and raises ValueError("checksum" or "value") on a bad profile."""
+    body, star, checksum = payload.rpartition('*')
+    try: valid_checksum = star and int(checksum, 16) == fletcher16(body.encode('ascii'))
+    except (ValueError, UnicodeEncodeError): valid_checksum = False
+    if not valid_checksum: raise ValueError("checksum")
+    try: fields = [int(v) for v in body.split(',')]
+    except ValueError: raise ValueError("value")
+    scalar_count = len(PROFILE_FIELDS)
+    num_sectors = fields[scalar_count - 1] if len(fields) >= scalar_count else -1
+    if not 1 <= num_sectors <= MAX_SECTORS or len(fields) != scalar_count + 2 * num_sectors: raise ValueError("value")
+    if not all(0 <= v <= 255 for v in fields[scalar_count - 5:scalar_count - 1] + fields[scalar_count:]): raise ValueError("value")
+    values = dict(zip(PROFILE_FIELDS, fields))
+    keys = fields[scalar_count:]
+    return values, [(keys[i], keys[i + 1]) for i in range(0, len(keys), 2)]
+
+
+def state_from_profile(values, joy_keys):
+    """Flattens a profile into DeviceMirror keys: JOY_KEY_<i> holds sector i's (key1, key2)."""
+    state = {key: values[key] for key in PROFILE_FIELDS[:-1]}
+    state["NUM_SECTORS"] = len(joy_keys)
+    state.update((f"JOY_KEY_{i}", tuple(pair)) for i, pair in enumerate(joy_keys))
+    return state
+
+
+def profile_from_state(state):
+    """Inverse of state_from_profile; None if `state` does not hold a complete profile."""
+    num_sectors = state.get("NUM_SECTORS")
+    joy_keys = [state.get(f"JOY_KEY_{i}") for i in range(num_sectors or 0)]
+    if not num_sectors or None in joy_keys or any(key not in state for key in PROFILE_FIELDS): return None
+    return {key: state[key] for key in PROFILE_FIELDS}, joy_keys
+
+
+def state_commands(changes):
+    """SET_* lines for a dict of changed DeviceMirror entries."""
+    commands = []
+    for key, value in changes.items():
+        if key.startswith("JOY_KEY_"): commands.append(f"SET_JOY_KEY:{key[8:]},{value[0]},{value[1]}")
+        else: commands.append(f"SET_{key}:{value}")
+    return commands
+
+
+def command_state_key(command):
+    """The DeviceMirror key a SET_* line changes, or None for commands that change many."""
+    key, _, value = command.partition(':')
+    if key == "SET_JOY_KEY": return f"JOY_KEY_{value.split(',')[0]}"
+    return key[4:] if key.startswith("SET_") and key != "SET_PROFILE" else None
+
+
+class DeviceMirror:
+    """The host's copy of what the firmware currently holds, keyed like DEFAULT_SETTINGS plus
+    KEY_<action> pressure keys, NUM_SECTORS and JOY_KEY_<i> sector pairs. Entries that are
+    missing are unknown and always count as changed."""
+
+    def __init__(self):
+        self.values = {}
+
+    def changes(self, desired):
+        return {key: value for key, value in desired.items() if self.values.get(key) != value}
+
+    def update(self, changes):
+        self.values.update(changes)
+
+    def forget(self, key=None):
+        if key is None: self.values.clear()
+        else: self.values.pop(key, None)
+
+    def load_readback(self, values, joy_keys):
+        """Replaces the mirror with a GET_ALL readback; returns the keys the mirror had wrong."""
+        readback = state_from_profile(values, joy_keys)
+        mismatched = sorted(key for key, value in readback.items() if key in self.values and self.values[key] != value)
+        self.values = readback
+        return mismatched
+
+
+def encode_frame(kind, value, seq):
+    """Builds one binary telemetry frame exactly as V3.ino's sendFrame() does."""
+    frame_type = next(t for t, (k, _) in FRAME_FORMATS.items() if k == kind)
+    fmt = FRAME_FORMATS[frame_type][1]
+    values = value if kind == "JOY" else (value,)
+    frame = bytearray(fmt.pack(FRAME_SYNC, frame_type, seq & 0xFF, *values, 0))
+    frame[-1] = sum(frame[1:-1]) & 0xFF
+    return bytes(frame)
+
+
+ConnectResult = namedtuple("ConnectResult", "ser protocol caps records banner_seen elapsed_s identity")
+
+# How a port is recognised again after it vanishes. vid/pid/serial_number are None for ports
+# without USB descriptors (ptys, the virtual controller link), which are matched by path.
+PortIdentity = namedtuple("PortIdentity", "device vid pid serial_number")
+
+
+def port_identity(device):
+    for info in serial.tools.list_ports.comports():
+        if info.device == device and info.vid is not None:
+            return PortIdentity(device, info.vid, info.pid, info.serial_number)
+    return PortIdentity(device, None, None, None)
+
+
+def find_port(identity):
+    """Current device path of a known controller (it may re-enumerate under another name),
+    or None while it is unplugged."""
+    if identity.vid is None:
+        return identity.device if os.path.exists(identity.device) else None
+    for info in serial.tools.list_ports.comports():
+        if (info.vid, info.pid, info.serial_number) == identity[1:]: return info.device
+    return None
+
+
+class PortWatcher:
+    """Polls until a lost controller is back, then reports its device path through
+    on_found(watcher, device). `delay` holds off the first look, for reconnect backoff."""
+
+    def __init__(self, identity, on_found, delay=0.0, poll_interval=0.25):
+        self.identity = identity
+        self.on_found = on_found
+        self.delay = delay
+        self.poll_interval = poll_interval
+        self._cancelled = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="PortWatcher", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self):
+        if self._cancelled.wait(self.delay): return
+        while not self._cancelled.is_set():
+            device = find_port(self.identity)
+            if device:
+                self.on_found(self, device); return
+            self._cancelled.wait(self.poll_interval)
+
+
+class DeviceConnector:
+    """Opens a port and waits for the sketch to be ready on a worker thread, so the GUI never
+    blocks. Every step is reported through on_state(connector, state, detail):
+        "opening"  port name
+        "waiting"  port name: waiting for the ready banner, probing with GET_CAPS
+        "syncing"  ConnectResult: the port is open, negotiated and now belongs to the caller
+        "failed"   error message
+    Boards with native USB keep running when the port is opened, so the banner may have
+    gone out long before; a CAPS reply, or any telemetry from firmware too old to answer
+    GET_CAPS, proves the sketch is running just as well.
+    """
+
+    def __init__(self, port, on_state, allow_binary=True, ready_timeout=4.0, probe_delay=0.2,
+                 probe_interval=0.5, caps_timeout=0.5, open_port=None):
+        self.port = port
+        self.on_state = on_state
+        self.allow_binary = allow_binary
+        self.ready_timeout = ready_timeout
+        self.probe_delay = probe_delay
+        self.probe_interval = probe_interval
+        self.caps_timeout = caps_timeout
+        self.open_port = open_port or (lambda name: serial.Serial(name, 115200, timeout=0.05))
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="DeviceConnector", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _await_ready(self, ser):
+        decoder = TextDecoder()
+        records, caps, banner_seen, alive_since = [], None, False, None
+        now = time.monotonic()
+        deadline, next_probe = now + self.ready_timeout, now + self.probe_delay
+        while not self._cancelled.is_set() and now < deadline:
+            if now >= next_probe:
+                ser.write(b"GET_CAPS\n"); next_probe = now + self.probe_interval
+            for kind, value in decoder.feed(ser.read(ser.in_waiting or 1)):
+                if kind == "CAPS":
+                    caps = value; continue
+                if kind == "MSG" and value.startswith(READY_BANNER): banner_seen = True
+                if alive_since is None:
+                    alive_since = time.monotonic(); next_probe = alive_since  # Running: ask for caps right away
+                records.append((kind, value))
+            if caps is not None: break
+            now = time.monotonic()
+            if alive_since is not None and now - alive_since > self.caps_timeout: break  # Firmware without GET_CAPS
+        return caps, banner_seen, alive_since is not None, records
+
+    def _run(self):
+        start = time.monotonic()
+        self.on_state(self, "opening", self.port)
+        try: ser = self.open_port(self.port)
+        except (serial.SerialException, OSError) as e:
+            self.on_state(self, "failed", str(e)); return
+        handed_over = False
+        try:
+            self.on_state(self, "waiting", self.port)
+            caps, banner_seen, alive, records = self._await_ready(ser)
+            if self._cancelled.is_set(): return
+            if caps is None and not alive:
+                self.on_state(self, "failed", f"No response from {self.port} within {self.ready_timeout:.1f} s"); return
+            protocol = "binary" if self.allow_binary and caps and BINARY_PROTOCOL_CAP in caps else "text"
+            if protocol == "binary": ser.write(b"SET_PROTOCOL:BIN\n")
+            identity = port_identity(self.port)
+            handed_over = True
+            self.on_state(self, "syncing", ConnectResult(ser, protocol, caps or [], records, banner_seen, time.monotonic() - start, identity))
+        except (serial.SerialException, OSError) as e:
+            self.on_state(self, "failed", str(e))
+        finally:
+            if not handed_over: ser.close()
+
+
+class TelemetryBuffer:
+    """Bounded, thread-safe hand-off from the serial reader thread to the Tk main thread.
+
+    Records are queued in order up to `maxlen`; when full the oldest record is dropped.
+    Telemetry goes through a TelemetryBus instead, where each subscriber picks how a
+    backlog is coalesced; this carries what is left (connection events, other records).
+    """
+
+    def __init__(self, maxlen=512):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self.pushed = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def push(self, kind, value):
+        with self._lock:
+            self.pushed += 1
+            if len(self._queue) >= self.maxlen:
+                self._queue.popleft(); self.dropped += 1
+            self._queue.append((kind, value))
+            if len(self._queue) > self.high_water: self.high_water = len(self._queue)
+
+    def drain(self):
+        with self._lock:
+            if not self._queue: return []
+            batch = list(self._queue); self._queue.clear()
+        return batch
+
+    def clear(self):
+        with self._lock:
+            self._queue.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"pushed": self.pushed, "dropped": self.dropped, "queued": len(self._queue), "high_water": self.high_water}
+
+
+# Telemetry record kinds published on a TelemetryBus, and the topic each becomes.
+TELEMETRY_TOPICS = {"P": "pressure", "JOY": "joystick", "CALIB_P": "calib_pressure", "MSG": "message"}
+
+# What a subscriber receives: t is time.monotonic() when the record was published.
+Sample = namedtuple("Sample", "topic value t")
+
+
+class Subscription:
+    """One consumer of a TelemetryBus topic, with its own queue and delivery policy:
+        "every"     every sample in order; if the consumer falls `maxlen` behind, its oldest are dropped
+        "latest"    only the newest sample since the last dispatch
+        "decimate"  the newest sample, at most `hz` times a second
+    """
+
+    POLICIES = ("every", "latest", "decimate")
+
+    def __init__(self, topic, callback, policy="every", hz=None, maxlen=1024):
+        if policy not in self.POLICIES: raise ValueError(f"Unknown delivery policy {policy!r}")
+        if policy == "decimate" and not hz: raise ValueError("The decimate policy needs hz")
+        self.topic = topic
+        self.callback = callback
+        self.policy = policy
+        self.interval = 1.0 / hz if hz else 0.0
+        self._queue = deque(maxlen=maxlen) if policy == "every" else None
+        self._latest = None
+        self._next_due = 0.0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def offer(self, sample):
+        if self._queue is not None:
+            if len(self._queue) == self._queue.maxlen: self.dropped += 1
+            self._queue.append(sample)
+            return
+        if self._latest is not None: self.coalesced += 1
+        self._latest = sample
+
+    def take(self, now):
+        if self._queue is not None:
+            samples = list(self._queue); self._queue.clear()
+            return samples
+        if self._latest is None or now < self._next_due: return []
+        sample, self._latest = self._latest, None
+        if self.interval: self._next_due = now + self.interval
+        return [sample]
+
+    def pending(self):
+        return len(self._queue) if self._queue is not None else int(self._latest is not None)
+
+    def clear(self):
+        if self._queue is not None: self._queue.clear()
+        self._latest = None
+
+
+class TelemetryBus:
+    """Typed fan-out of telemetry records to any number of subscribers.
+
+    publish() is called from the reading thread (the transport's loop) and only queues the
+    sample for each subscriber of its topic; dispatch() runs on the consuming thread (the Tk
+    pump) and calls each subscriber with whatever its policy lets through. Subscribers
+    only ever wait on their own queue, so a slow or fast-rate consumer costs the others
+    nothing beyond one append per published sample.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {topic: [] for topic in TELEMETRY_TOPICS.values()}
+        self.published = 0
+
+    def subscribe(self, topic, callback, policy="every", hz=None, maxlen=1024):
+        """callback(sample) is called from dispatch(). Returns the Subscription, for unsubscribe()."""
+        if topic not in self._subscribers: raise ValueError(f"Unknown telemetry topic {topic!r}")
+        subscription = Subscription(topic, callback, policy, hz, maxlen)
+        with self._lock:
+            self._subscribers[topic] = self._subscribers[topic] + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers[subscription.topic] = [s for s in self._subscribers[subscription.topic] if s is not subscription]
+
+    def publish(self, kind, value):
+        """Queues a record for the subscribers of its topic. False if `kind` is not telemetry."""
+        topic = TELEMETRY_TOPICS.get(kind)
+        if topic is None: return False
+        sample = Sample(topic, value, time.monotonic())
+        with self._lock:
+            self.published += 1
+            for subscription in self._subscribers[topic]: subscription.offer(sample)
+        return True
+
+    def dispatch(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [(s, s.take(now)) for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription, samples in due:
+            for sample in samples:
+                subscription.delivered += 1
+                try: subscription.callback(sample)
+                except Exception as e: print(f"Telemetry subscriber error ({subscription.topic}): {e}")
+
+    def backlog(self):
+        """Samples waiting for the furthest-behind every-sample subscriber, for producers that can wait (replay)."""
+        with self._lock:
+            return max((s.pending() for subscribers in self._subscribers.values() for s in subscribers if s.policy == "every"), default=0)
+
+    def clear(self):
+        with self._lock:
+            for subscribers in self._subscribers.values():
+                for subscription in subscribers: subscription.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"published": self.published,
+                    "subscribers": [{"topic": s.topic, "policy": s.policy, "delivered": s.delivered, "dropped": s.dropped,
+                                     "coalesced": s.coalesced} for subscribers in self._subscribers.values() for s in subscribers]}
+
+
+def reply_matches(command, line):
+    """True if an ACK:/ERR: line answers `command`. V3.ino echoes SET_* commands back in
+    both ("ACK:SET_HPT:300", "ERR:Bad value SET_JOY_KEY:9,1"); checksummed bulk commands are
+    answered with their key and checksum instead ("ACK:SET_PROFILE:1A2B")."""
+    if '*' in command:
+        return line.endswith(f"{command.split(':', 1)[0]}:{command.rpartition('*')[2]}")
+    return line[4:] == command or line.endswith(" " + command)
@@ -0,0 +1,35 @@
+# Shared setup for the parity tests: the tools live at the top of the repository, and the
+# firmware headers are built for this machine once per run when a C++ compiler is found.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firmware_sim  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def native_build(tmp_path_factory):
+    """build(driver, name) -> executable of a driver compiled against the firmware headers.
+    Skips the test without a C++ compiler."""
+    compiler = firmware_sim.native_compiler()
+    if not compiler: pytest.skip("no C++ compiler found")
+    directory, built = tmp_path_factory.mktemp("native"), {}
+
+    def build(driver, name):
+        if name not in built: built[name] = firmware_sim.build_native_driver(str(directory), compiler, driver, name)
+        return built[name]
+    return build
+
+
+@pytest.fixture(scope="session")
+def pressure_driver(native_build):
+    return native_build(firmware_sim.NATIVE_DRIVER, "pressure_driver")
+
+
+@pytest.fixture(scope="session")
+def joystick_driver(native_build):
+    return native_build(firmware_sim.JOYSTICK_DRIVER, "joystick_driver")
@@ -0,0 +1,29 @@
+# calibration_analysis.py on captures the Calibrate Sensor tab can produce.
+
+import numpy as np
+
+from calibration_analysis import analyze_captures, optimize_thresholds
+
+
+def test_empty_action_next_to_recorded_ones():
+    # finish_collecting_samples() stores an empty capture when no sample came in
+    captures = {"Neutral": [np.array([], dtype=int)], "Soft Sip": [[1, 2, 3]], "Hard Sip": [[-40, -38, -35, -41]]}
+    analysis = analyze_captures(captures)
+    assert analysis.actions["Neutral"] is None
+    soft = analysis.actions["Soft Sip"]
+    assert (soft.count, soft.median, soft.mad, soft.min, soft.max, soft.outliers) == (3, 2, 1, 1, 3, 0)
+    hard = analysis.actions["Hard Sip"]
+    assert (hard.count, hard.median, hard.min, hard.max) == (4, -40, -41, -35)
+    assert [(o.lower, o.upper) for o in analysis.overlaps] == [("Hard Sip", "Soft Sip")]
+    optimize_thresholds(analysis)
+
+
+def test_empty_capture_among_an_actions_captures():
+    analysis = analyze_captures({"Neutral": [[0, 1, -1, 0], []], "Soft Puff": [[50, 52, 51]]})
+    neutral = analysis.actions["Neutral"]
+    assert (neutral.count, neutral.captures, neutral.median, neutral.outlier_captures) == (4, 2, 0, [])
+
+
+def test_only_empty_captures():
+    analysis = analyze_captures({"Neutral": [[]], "Soft Sip": [np.array([], dtype=int)]})
+    assert analysis.actions == {"Soft Sip": None, "Neutral": None}
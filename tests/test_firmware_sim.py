@@ -0,0 +1,126 @@
+# Parity of firmware_sim.py's vectorized model with its line-by-line port of V3.ino and
+# with pressure_logic.h built for this machine: the checks `python firmware_sim.py check`
+# prints, as test cases.
+
+import numpy as np
+import pytest
+
+from firmware_sim import (COUNT_FIELDS, EVENTS, PRESSURE_DEFAULTS, PRESSURE_WINDOW_MAX, THRESHOLDS, FirmwarePressureModel,
+                          _block_press_latencies_ms, cursor_summary, cursor_trajectory, event_counts, firmware_pressure,
+                          grid_counts, native_events, scale_pressure, simulate, simulate_events, sliding_average,
+                          step_latency_ms, update_mouse_joystick)
+
+UNFILTERED = {"PFW": 1}
+SEEDS = range(8)
+
+
+def names(events):
+    return [(int(e["tick"]), EVENTS[e["event"]], int(e["arg"])) for e in events]
+
+
+def random_case(seed):
+    """A random walk of raw readings and random settings, as run_check() draws them."""
+    rng = np.random.default_rng(seed)
+    stride = int(rng.integers(2, 41))  # Slow walks stay in a band long enough to scroll repeatedly
+    raw = np.clip(np.cumsum(rng.integers(-stride, stride + 1, rng.integers(100, 3000))) + rng.integers(-300, 300), -512, 511)
+    params = {"HST": int(rng.integers(-400, 0)), "NMIN": int(rng.integers(-300, 50)), "SPT": int(rng.integers(-50, 300)),
+              "HPT": int(rng.integers(0, 400)), "SIP_SENS": int(rng.integers(10, 300)), "PUFF_SENS": int(rng.integers(10, 300)),
+              "PFW": int(rng.integers(1, PRESSURE_WINDOW_MAX + 1))}
+    return raw, params, rng
+
+
+@pytest.mark.parametrize("samples, window, expected", [
+    ([-1] * 9 + [0], 10, [-1] * 9 + [0]),  # C division truncates toward zero: nine -1 and a 0 average to 0
+    ([10, 20, 30], 10, [10, 15, 20]),      # Over the samples so far until the window fills
+    ([100] * 3 + [0] * 3, 3, [100, 100, 100, 66, 33, 0]),
+])
+def test_sliding_average(samples, window, expected):
+    assert sliding_average(samples, window).tolist() == expected
+
+
+def test_scale_pressure_truncates_and_scales_each_side():
+    assert scale_pressure([-3, 3], 50, 50).tolist() == [-1, 1]
+    assert scale_pressure([-100, 100], 150, 50).tolist() == [-150, 50]
+
+
+@pytest.mark.parametrize("raw, params, mode, expected", [
+    # Exactly on a threshold counts: HPT and SPT with >=, HST and NMIN with <=
+    ([200, 100, -100, -200, 0], UNFILTERED, "mouse",
+     [(0, "press_left", 0), (1, "release_left", 0), (1, "scroll", 1), (2, "scroll", -1), (3, "press_right", 0), (4, "release_right", 0)]),
+    # A held puff clicks once; a soft puff scrolls on entry and every 10 ticks
+    ([150] * 25 + [300] * 3 + [0], UNFILTERED, "mouse",
+     [(0, "scroll", 1), (10, "scroll", 1), (20, "scroll", 1), (25, "press_left", 0), (28, "release_left", 0)]),
+    # Leaving the scroll band restarts the repeat
+    ([150] * 3 + [0] + [150] + [-150] * 2, UNFILTERED, "mouse", [(0, "scroll", 1), (4, "scroll", 1), (5, "scroll", -1)]),
+    # Keyboard: a press comes before the release in one tick
+    ([150, 300, -300, 0], UNFILTERED, "keyboard",
+     [(0, "key_press", ord("r")), (1, "key_press", ord("f")), (1, "key_release", ord("r")), (2, "key_release", ord("f")),
+      (2, "key_press", ord("e")), (3, "key_release", ord("e"))]),
+])
+def test_known_sequences(raw, params, mode, expected):
+    assert names(FirmwarePressureModel(params, mode).run(raw)) == expected
+    assert names(simulate(raw, params, mode)) == expected
+
+
+def test_hard_puff_acts_in_the_tick_its_average_crosses_hpt():
+    events = names(simulate([0] * 10 + [300] * 10, None, "mouse"))
+    assert [e for e in events if e[1] == "press_left"] == [(16, "press_left", 0)]
+
+
+def test_sliding_window_is_no_slower_than_blocks():
+    best_block, _ = _block_press_latencies_ms(300, PRESSURE_DEFAULTS["HPT"])
+    assert step_latency_ms(300) <= best_block
+    assert step_latency_ms(300, UNFILTERED) == 0
+
+
+@pytest.mark.parametrize("mode", ["mouse", "keyboard"])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_vectorized_matches_line_by_line(seed, mode):
+    raw, params, _ = random_case(seed)
+    assert names(simulate(raw, params, mode)) == names(FirmwarePressureModel(params, mode).run(raw))
+
+
+@pytest.mark.parametrize("mode", ["mouse", "keyboard"])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_pressure_logic_matches_line_by_line(pressure_driver, seed, mode):
+    raw, params, _ = random_case(seed)
+    scaled = scale_pressure(raw, params["SIP_SENS"], params["PUFF_SENS"])
+    assert names(native_events(pressure_driver, scaled, params, mode)) == names(FirmwarePressureModel(params, mode).run(raw))
+
+
+@pytest.mark.parametrize("mode", ["mouse", "keyboard"])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_grid_counts_match_simulated_counts(seed, mode):
+    raw, params, rng = random_case(seed)
+    grid = {name: rng.integers(-400, 400, 4).tolist() for name in THRESHOLDS}
+    pressure = firmware_pressure(raw, params)
+    for row in grid_counts(pressure, grid, mode):
+        thresholds = {name: int(row[name]) for name in THRESHOLDS}
+        assert event_counts(simulate_events(pressure, thresholds, mode), None, mode) == {name: int(row[name]) for name in COUNT_FIELDS[mode]}, thresholds
+
+
+def test_cursor_steps_match_line_by_line():
+    joy_x = np.arange(-1023, 1024)
+    pairs = [(jdz, csp) for jdz in (0, 1, 5, 10, 19, 20, 33, 50, 99, 100, 150) for csp in (0, 1, 2, 7, 10, 50, 127, 200)]
+    trajectory = cursor_trajectory(np.stack([joy_x, -joy_x], axis=1), [{"JDZ": jdz, "CSP": csp} for jdz, csp in pairs])
+    for row, (jdz, csp) in enumerate(pairs):
+        got = list(zip(trajectory.dx[row].tolist(), trajectory.dy[row].tolist()))
+        assert got == [update_mouse_joystick(x, -x, jdz, csp) or (0, 0) for x in joy_x.tolist()], (jdz, csp)
+
+
+def test_cursor_edges():
+    assert [update_mouse_joystick(x, 0, 20, 10) for x in (102, 103, 511, -512)] == [None, (1, 0), (9, 0), (-10, 0)]
+    assert update_mouse_joystick(0, 511, 20, 10) == (0, -9)  # Stick up moves the cursor up
+
+
+def test_cursor_summary_matches_trajectory():
+    rng = np.random.default_rng(0)
+    single = cursor_trajectory(rng.integers(-512, 512, (500, 2)), {"JDZ": 15, "CSP": 12})
+    assert np.cumsum(single.dx).tolist() == single.x.tolist() and np.cumsum(single.dy).tolist() == single.y.tolist()
+    trace = rng.integers(-512, 512, (3000, 2)); trace[::3] = 0
+    sets = [{"JDZ": jdz, "CSP": csp} for jdz in (5, 20, 60) for csp in (3, 10, 40)]
+    batch, summaries = cursor_trajectory(trace, sets), cursor_summary(trace, sets)
+    for i in range(len(sets)):
+        assert summaries.distance[i] == pytest.approx(np.hypot(batch.dx[i].astype(float), batch.dy[i].astype(float)).sum())
+        assert (int(summaries.net_x[i]), int(summaries.net_y[i])) == (int(batch.x[i, -1]), int(batch.y[i, -1]))
+        assert summaries.moving_fraction[i] == pytest.approx(np.count_nonzero(batch.speed[i]) / len(trace))
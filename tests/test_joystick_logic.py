@@ -0,0 +1,99 @@
+# joystick_logic.h's integer sector lookup, built for this machine, against firmware_sim.py
+# and against the float code it replaced, at every deflection in the ADC range.
+
+import numpy as np
+import pytest
+
+from firmware_sim import (JOYSTICK_AXIS_MAX, JOYSTICK_LOGIC_HEADER, JOYSTICK_SECTORS_MAX, JoystickSectors, joystick_sectors,
+                          keyboard_joystick_sector_float, native_sectors, sector_table_source)
+
+SECTOR_COUNTS = range(1, JOYSTICK_SECTORS_MAX + 1)
+RAYS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]  # Every 45 degrees from stick right, y up
+
+
+@pytest.fixture(scope="module")
+def deflections():
+    """Every (x, y) in the ADC range, x outer like JOYSTICK_DRIVER writes them."""
+    axis = np.arange(-JOYSTICK_AXIS_MAX, JOYSTICK_AXIS_MAX + 1)
+    return tuple(a.ravel() for a in np.meshgrid(axis, axis, indexing="ij"))
+
+
+@pytest.fixture(scope="module")
+def table(deflections):
+    """table(N): joystick_sectors() with no JMT over every deflection, computed once per N."""
+    cache = {}
+
+    def lookup(num_sectors):
+        if num_sectors not in cache: cache[num_sectors] = joystick_sectors(*deflections, num_sectors, -1).astype(np.int8)
+        return cache[num_sectors]
+    return lookup
+
+
+def on_boundary(x, y, num_sectors):
+    """(mask, sector) for deflections exactly on a sector boundary, and the sector that
+    starts there. Only rays at multiples of 45 degrees pass through other integer points,
+    so those are the only boundaries any deflection can lie on: boundary i, at
+    (2i + 1) * 180 / N degrees, is the ray at 45k degrees when k * N / 4 = 2i + 1."""
+    u, v = x, -y
+    mask, sector = np.zeros(len(x), dtype=bool), np.full(len(x), -1)
+    for k, (dx, dy) in enumerate(RAYS):
+        if k * num_sectors % 4 or (k * num_sectors // 4) % 2 == 0: continue
+        ray = (u * dy == v * dx) & (u * dx + v * dy > 0)
+        mask |= ray; sector[ray] = ((k * num_sectors // 4 - 1) // 2 + 1) % num_sectors
+    return mask, sector
+
+
+@pytest.mark.parametrize("num_sectors", SECTOR_COUNTS)
+def test_ties_go_to_the_sector_starting_at_the_boundary(deflections, table, num_sectors):
+    mask, sector = on_boundary(*deflections, num_sectors)
+    assert (table(num_sectors)[mask] == sector[mask]).all()
+
+
+@pytest.mark.parametrize("num_sectors", SECTOR_COUNTS)
+def test_differs_from_double_float_code_only_on_boundaries(deflections, table, num_sectors):
+    # The app's old highlight, in double: rounding picks a side for deflections exactly on a boundary
+    x, y = deflections
+    differs = table(num_sectors) != keyboard_joystick_sector_float(x, y, num_sectors, -1, np.float64)
+    mask, _ = on_boundary(x, y, num_sectors)
+    assert not (differs & ~mask).any(), list(zip(x[differs & ~mask][:5].tolist(), y[differs & ~mask][:5].tolist()))
+
+
+@pytest.mark.parametrize("num_sectors", SECTOR_COUNTS)
+def test_differs_from_board_float_code_only_at_boundaries(deflections, table, num_sectors):
+    # The board's old single-precision code also rounds deflections a hair off a boundary
+    # (the furthest is 2.5e-5 degrees away); any other difference means the table moved
+    x, y = deflections
+    differs = table(num_sectors) != keyboard_joystick_sector_float(x, y, num_sectors, -1, np.float32)
+    width = 360.0 / num_sectors
+    offset = (np.degrees(np.arctan2(-y[differs].astype(np.float64), x[differs].astype(np.float64))) - width / 2) % width
+    assert np.minimum(offset, width - offset).max(initial=0.0) <= 1e-4
+
+
+@pytest.mark.parametrize("num_sectors", SECTOR_COUNTS)
+def test_joystick_logic_matches_the_model(joystick_driver, table, num_sectors):
+    assert np.array_equal(native_sectors(joystick_driver, num_sectors, -1), table(num_sectors))
+
+
+@pytest.mark.parametrize("jmt", [-1, 0, 10, 25, 57, 100, 289, 290, 301])
+def test_joystick_logic_matches_the_model_jmt(joystick_driver, deflections, jmt):
+    x, y = deflections
+    assert np.array_equal(native_sectors(joystick_driver, 8, jmt), joystick_sectors(x, y, 8, jmt))
+
+
+def test_one_at_a_time_lookup_matches_vectorized(deflections):
+    x, y = deflections
+    picks, scalar = np.random.default_rng(0).integers(0, len(x), 500).tolist(), JoystickSectors()
+    for num_sectors in SECTOR_COUNTS:
+        for jmt in (-1, 10):
+            expected = joystick_sectors(x[picks], y[picks], num_sectors, jmt).tolist()
+            assert [scalar.sector(x[i], y[i], num_sectors, jmt) for i in picks] == expected, (num_sectors, jmt)
+
+
+def test_header_table_is_generated():
+    with open(JOYSTICK_LOGIC_HEADER) as f:
+        assert sector_table_source() in f.read(), "regenerate JOYSTICK_BOUNDARIES with python firmware_sim.py sectors"
+
+
+def test_jmt_and_clamping():
+    assert joystick_sectors([128, 129], [0, 0], 8, 25).tolist() == [-1, 0]  # JMT 25: 128 is inside, 129 out
+    assert [joystick_sectors(-300, 5, n, 10).tolist() for n in (0, 1, 16, 17)] == [0, 0, 8, 8]
@@ -0,0 +1,99 @@
+# pressure_logic.h built for this machine, on the cases the sliding-window filter and the
+# threshold edges are most likely to get wrong, against firmware_sim.py and by hand.
+
+import subprocess
+
+import numpy as np
+import pytest
+
+from firmware_sim import EVENTS, FirmwarePressureModel, PRESSURE_DEFAULTS, PRESSURE_WINDOW_MAX, native_events, sliding_average
+
+# Reads a window size and then samples; prints pressureFilterAdd() for each sample.
+FILTER_DRIVER = r"""
+#include <stdio.h>
+#include "pressure_logic.h"
+
+int main() {
+  int window, sample;
+  if (scanf("%d", &window) != 1) return 2;
+  PressureFilter filter; pressureFilterInit(&filter, (uint8_t)window);
+  while (scanf("%d", &sample) == 1) printf("%d\n", pressureFilterAdd(&filter, (int16_t)sample));
+  return 0;
+}
+"""
+
+UNFILTERED = {"PFW": 1}
+HST, NMIN, SPT, HPT = (PRESSURE_DEFAULTS[name] for name in ("HST", "NMIN", "SPT", "HPT"))
+F, R, E, Q = (ord(c) for c in "freq")
+
+
+@pytest.fixture(scope="module")
+def filter_driver(native_build):
+    return native_build(FILTER_DRIVER, "filter_driver")
+
+
+def native_filter(binary, samples, window):
+    text = f"{window}\n" + "\n".join(str(int(s)) for s in samples) + "\n"
+    return [int(v) for v in subprocess.run([binary], input=text, capture_output=True, text=True, check=True).stdout.split()]
+
+
+def names(events):
+    return [(int(e["tick"]), EVENTS[e["event"]], int(e["arg"])) for e in events]
+
+
+@pytest.mark.parametrize("window", [1, 2, 10, PRESSURE_WINDOW_MAX])
+def test_filter_averages_the_samples_so_far_until_the_window_fills(filter_driver, window):
+    samples = list(range(10, 10 * (PRESSURE_WINDOW_MAX + 6), 10))
+    expected = [sum(samples[max(0, i + 1 - window):i + 1]) // min(i + 1, window) for i in range(len(samples))]
+    assert native_filter(filter_driver, samples, window) == expected
+    assert sliding_average(samples, window).tolist() == expected
+
+
+def test_filter_truncates_toward_zero(filter_driver):
+    assert native_filter(filter_driver, [-1] * 9 + [0, 4], 10) == [-1] * 9 + [0, 0]
+
+
+@pytest.mark.parametrize("window, effective", [(0, 1), (PRESSURE_WINDOW_MAX + 8, PRESSURE_WINDOW_MAX)])
+def test_filter_clamps_the_window(filter_driver, window, effective):
+    samples = np.random.default_rng(window).integers(-512, 512, 100)
+    assert native_filter(filter_driver, samples, window) == sliding_average(samples, effective).tolist()
+
+
+def test_filter_follows_a_rising_and_falling_step(filter_driver):
+    samples = [0] * 15 + [300] * 15 + [0] * 15
+    ramp = [30 * k for k in range(1, 11)]
+    expected = [0] * 15 + ramp + [300] * 5 + ramp[::-1][1:] + [0] * 6
+    assert native_filter(filter_driver, samples, 10) == expected
+    assert sliding_average(samples, 10).tolist() == expected
+
+
+def test_step_presses_and_releases_where_the_average_crosses_hpt(pressure_driver):
+    raw = [0] * 15 + [300] * 15 + [0] * 15
+    events = names(native_events(pressure_driver, raw, None, "mouse"))
+    assert events == names(FirmwarePressureModel(None, "mouse").run(raw))
+    # Average 210 on the 7th sample of the rise; 180 on the 4th of the fall
+    assert [e for e in events if e[1] in ("press_left", "release_left")] == [(21, "press_left", 0), (33, "release_left", 0)]
+
+
+# The thresholds have no hysteresis: a pressure dithering by one count across an edge
+# toggles the action on every crossing, and exactly on the edge is inside.
+EDGES = [
+    ([HPT - 1, HPT, HPT - 1, HPT], "mouse",
+     [(0, "scroll", 1), (1, "press_left", 0), (2, "release_left", 0), (2, "scroll", 1), (3, "press_left", 0)]),
+    ([SPT - 1, SPT, SPT - 1, SPT], "mouse", [(1, "scroll", 1), (3, "scroll", 1)]),
+    ([HST + 1, HST, HST + 1, HST], "mouse",
+     [(0, "scroll", -1), (1, "press_right", 0), (2, "release_right", 0), (2, "scroll", -1), (3, "press_right", 0)]),
+    ([HPT - 1, HPT, HPT - 1, HPT], "keyboard",
+     [(0, "key_press", R), (1, "key_press", F), (1, "key_release", R), (2, "key_release", F), (2, "key_press", R),
+      (3, "key_press", F), (3, "key_release", R)]),
+    ([SPT - 1, SPT, SPT - 1, SPT], "keyboard", [(1, "key_press", R), (2, "key_release", R), (3, "key_press", R)]),
+    ([HST + 1, HST, HST + 1, HST], "keyboard",
+     [(0, "key_press", Q), (1, "key_press", E), (1, "key_release", Q), (2, "key_release", E), (2, "key_press", Q),
+      (3, "key_press", E), (3, "key_release", Q)]),
+]
+
+
+@pytest.mark.parametrize("raw, mode, expected", EDGES)
+def test_edges_toggle_on_every_crossing(pressure_driver, raw, mode, expected):
+    assert names(native_events(pressure_driver, raw, UNFILTERED, mode)) == expected
+    assert names(FirmwarePressureModel(UNFILTERED, mode).run(raw)) == expected
@@ -0,0 +1,262 @@
+# --- START OF FILE transport.py ---
+#
+# asyncio transport for a connected controller, and the bridge that runs it next to
+# the Tk mainloop. Like serial_link.py, nothing in here imports Tk: the bridge only
+# needs an object with an after() method.
+
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from serial_link import TELEMETRY_DECODERS, reply_matches
+
+
+class SerialTransport:
+    """Owns an open, negotiated port on an asyncio loop. run() reads and decodes until
+    the port goes away; everything else is a coroutine that can be awaited from any
+    number of tasks at once:
+        read(kind)               the next record (of that kind)
+        write(command)           one command line, never interleaved with another
+        request(command)         write and await the matching ACK:/ERR: line
+        query(command, kind)     write and await the next record of `kind` (GET_ALL -> "ALL")
+        send_batch(commands)     request() each in turn, paced on the replies
+    Records nobody is awaiting go to on_record(kind, value), from the loop thread.
+
+    On POSIX the port's file descriptor is watched by the loop and read and written
+    without blocking; elsewhere blocking reads and writes run on one executor thread each.
+    """
+
+    def __init__(self, ser, protocol="text", on_record=None, reply_timeout=0.3, fallback_interval=0.02, fallback_after=3):
+        self.ser = ser
+        self.protocol = protocol
+        self.decoder = TELEMETRY_DECODERS[protocol]()
+        self.on_record = on_record or (lambda kind, value: None)
+        self.reply_timeout = reply_timeout
+        self.fallback_interval = fallback_interval
+        self.fallback_after = fallback_after
+        self.acks_supported = None  # Unknown until the first reply, or `fallback_after` timeouts in a row
+        self._missed_replies = 0
+        self._fd = ser.fileno() if os.name == "posix" and hasattr(ser, "fileno") else None
+        self._waiters = []  # [(predicate, future, record)], oldest first
+        self._closing = False
+        self._run_task = None
+        self._write_lock = self._batch_lock = None  # Created on the loop
+        self._executor = None
+
+    # --- Reading ---
+
+    async def run(self):
+        """Reads until close() or until the port fails, which raises serial.SerialException."""
+        loop = asyncio.get_running_loop()
+        self._run_task = asyncio.current_task()
+        self._write_lock, self._batch_lock = asyncio.Lock(), asyncio.Lock()
+        if self._fd is None: self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="SerialTransport")
+        try:
+            if self._fd is not None: await self._read_fd(loop)
+            else: await self._read_blocking(loop)
+        except (serial.SerialException, OSError) as e:
+            if self._closing: return
+            raise serial.SerialException(str(e)) from e
+        finally:
+            self._fail_waiters(serial.SerialException("Port closed"))
+
+    async def _read_fd(self, loop):
+        lost = loop.create_future()
+
+        def on_readable():
+            # Read right here, while the readiness is fresh: pyserial sets VMIN=0, so an empty
+            # read means the device went away (as in pyserial's own read()), not "try again".
+            try: data = os.read(self._fd, 4096)
+            except BlockingIOError: return
+            except OSError as e: data = e
+            if isinstance(data, OSError) or not data:
+                loop.remove_reader(self._fd)
+                if not lost.done(): lost.set_exception(serial.SerialException(str(data) if data else "Device disconnected"))
+                return
+            self._dispatch(self.decoder.feed(data))
+
+        loop.add_reader(self._fd, on_readable)
+        try: await lost
+        finally: loop.remove_reader(self._fd)
+
+    async def _read_blocking(self, loop):
+        while not self._closing:
+            data = await loop.run_in_executor(self._executor, self._blocking_read)
+            if data: self._dispatch(self.decoder.feed(data))
+
+    def _blocking_read(self):
+        data = self.ser.read(self.ser.in_waiting or 1)  # Returns at the port timeout if nothing comes
+        if data and self.ser.in_waiting: data += self.ser.read(self.ser.in_waiting)
+        return data
+
+    def _dispatch(self, records):
+        for kind, value in records:
+            for waiter in self._waiters:
+                predicate, future, record = waiter
+                if not future.done() and predicate(kind, value):
+                    future.set_result((kind, value) if record else value); self._waiters.remove(waiter); break
+            else:
+                self.on_record(kind, value)
+
+    def _expect(self, predicate, record=False):
+        """A future for the next record matching `predicate`: its value, or (kind, value) with `record`."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future, record))
+        return future
+
+    def _forget(self, future):
+        self._waiters = [w for w in self._waiters if w[1] is not future]
+
+    def _fail_waiters(self, error):
+        for _, future, _ in self._waiters:
+            if not future.done(): future.set_exception(error)
+        self._waiters = []
+
+    async def _await(self, future, timeout):
+        try: return await asyncio.wait_for(future, timeout)
+        finally: self._forget(future)
+
+    async def read(self, kind=None, timeout=None):
+        """The next record as (kind, value), or just the value when `kind` is given."""
+        if kind is not None: return await self._await(self._expect(lambda k, v: k == kind), timeout)
+        return await self._await(self._expect(lambda k, v: True, record=True), timeout)
+
+    # --- Writing ---
+
+    async def write(self, command):
+        data = (command.strip() + "\n").encode("utf-8")
+        async with self._write_lock:
+            if self._closing: raise serial.SerialException("Port closed")
+            try: await self._write_bytes(data)
+            except OSError as e: raise serial.SerialException(str(e)) from e
+
+    async def _write_bytes(self, data):
+        loop = asyncio.get_running_loop()
+        if self._fd is None:
+            await loop.run_in_executor(self._executor, self.ser.write, data); return
+        view = memoryview(data)
+        while view:
+            try: view = view[os.write(self._fd, view):]
+            except BlockingIOError:  # Output buffer full: wait until the port drains
+                writable = loop.create_future()
+                loop.add_writer(self._fd, lambda: writable.done() or writable.set_result(None))
+                try: await writable
+                finally: loop.remove_writer(self._fd)
+
+    async def request(self, command, timeout=None):
+        """Writes `command` and returns the ACK:/ERR: line that answers it.
+        Raises asyncio.TimeoutError if none comes within `timeout` (default reply_timeout)."""
+        command = command.strip()
+        future = self._expect(lambda k, v: k == "MSG" and v[:4] in ("ACK:", "ERR:") and reply_matches(command, v))
+        try: await self.write(command)
+        except BaseException: self._forget(future); raise
+        return await self._await(future, timeout or self.reply_timeout)
+
+    async def query(self, command, kind, timeout=None):
+        """Writes `command` and returns the value of the next `kind` record."""
+        future = self._expect(lambda k, v: k == kind)
+        try: await self.write(command)
+        except BaseException: self._forget(future); raise
+        return await self._await(future, timeout or self.reply_timeout)
+
+    async def send_batch(self, commands, on_progress=None):
+        """Sends `commands` one at a time, each paced on its reply; batches from concurrent
+        callers go out whole and in order. Returns (rejected, unanswered) with rejected as
+        [(command, reply)]. Firmware that never answers (older than the ACK echo) is
+        assumed after `fallback_after` timeouts in a row with no reply ever seen, so one
+        slow reply while the board is busy doesn't count, and is paced at
+        `fallback_interval` from then on."""
+        commands = [c.strip() for c in commands if c.strip()]
+        rejected, unanswered = [], 0
+        async with self._batch_lock:
+            for done, command in enumerate(commands, 1):
+                if self.acks_supported is False:
+                    await self.write(command); await asyncio.sleep(self.fallback_interval)
+                else:
+                    try:
+                        reply = await self.request(command)
+                        self.acks_supported, self._missed_replies = True, 0
+                        if reply.startswith("ERR:"): rejected.append((command, reply))
+                    except asyncio.TimeoutError:
+                        unanswered += 1
+                        if self.acks_supported is None:
+                            self._missed_replies += 1
+                            if self._missed_replies >= self.fallback_after:
+                                self.acks_supported = False
+                                print(f"No reply to {self._missed_replies} commands in a row: assuming firmware without ACK replies, "
+                                      f"pacing commands every {self.fallback_interval * 1000:.0f} ms from now on")
+                if on_progress: on_progress(done, len(commands))
+        return rejected, 0 if self.acks_supported is False else unanswered
+
+    async def close(self, farewell=()):
+        """Lets queued writes finish, sends the `farewell` commands, then stops run() and closes the port."""
+        if self._write_lock is None: self._write_lock = asyncio.Lock()  # run() never started
+        async with self._write_lock:
+            if farewell:
+                try: await self._write_bytes("".join(command + "\n" for command in farewell).encode("utf-8"))
+                except (serial.SerialException, OSError): pass
+            # Set under the lock and after the farewell: writes already waiting for the lock still go out
+            # ahead of it, and any that take the lock from here on raise "Port closed" instead
+            self._closing = True
+        if self._run_task and not self._run_task.done():
+            self._run_task.cancel()
+            try: await self._run_task
+            except (asyncio.CancelledError, serial.SerialException): pass
+        try: self.ser.close()
+        except (serial.SerialException, OSError): pass
+        if self._executor: self._executor.shutdown(wait=False)
+
+
+class TkAsyncBridge:
+    """Runs an asyncio event loop on a daemon thread alongside the Tk mainloop.
+
+    submit() schedules a coroutine from the Tk thread and returns its
+    concurrent.futures.Future; on_done(result) / on_error(exception) are called back on
+    the Tk thread, as is anything handed to post() from any thread. Callbacks are
+    delivered by an after() loop every `poll_ms`.
+    """
+
+    def __init__(self, root, poll_ms=10):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.loop = asyncio.new_event_loop()
+        self._calls = deque()  # (fn, args); deque append/popleft are thread-safe
+        self._thread = threading.Thread(target=self._run_loop, name="TkAsyncBridge", daemon=True)
+        self._thread.start()
+        self._job = self.root.after(self.poll_ms, self._poll)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, on_done=None, on_error=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(lambda f: self._calls.append((self._deliver, (f, on_done, on_error))))
+        return future
+
+    def post(self, fn, *args):
+        self._calls.append((fn, args))
+
+    def _deliver(self, future, on_done, on_error):
+        if future.cancelled(): return
+        error = future.exception()
+        if error is None:
+            if on_done: on_done(future.result())
+        elif on_error: on_error(error)
+        else: print(f"Background task failed: {error!r}")
+
+    def _poll(self):
+        while self._calls:
+            fn, args = self._calls.popleft()
+            try: fn(*args)
+            except Exception as e: print(f"Error in bridge callback: {e}")
+        self._job = self.root.after(self.poll_ms, self._poll)
+
+    def close(self, timeout=1.0):
+        if self._job: self.root.after_cancel(self._job); self._job = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=timeout)
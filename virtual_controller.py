@@ -0,0 +1,407 @@
+# --- START OF FILE virtual_controller.py ---
+#
+# A software stand-in for the Leonardo running V3.ino. It opens a pseudo-terminal,
+# speaks the same serial protocol and can be driven by sip/puff/joystick waveforms,
+# so the app can be load-tested without hardware (POSIX only):
+#   python virtual_controller.py                      # firmware rates, built-in demo waveform
+#   python virtual_controller.py --script demo.json   # scripted waveform, see load_script()
+#   python virtual_controller.py --firehose 100       # 100x the firmware rates
+# Then pick the printed port (or the link path) in the app and press Connect.
+
+import argparse
+import json
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from serial_link import (BINARY_PROTOCOL_CAP, COMMAND_MAX_LENGTH, PRESSURE_FILTER_CAP, PROFILE_CAP, READBACK_CAP, STREAM_CAP, VIRTUAL_PORT_LINK, LineSplitter,
+                         decode_profile_payload, encode_frame, encode_profile_command)
+
+# Firmware timing (V3.ino): JOY every INPUT_UPDATE_PERIOD_MS, P every PRESSURE_REPORT_TICKS x
+# SAMPLE_PERIOD_MS, CALIB_P every 50 ms while calibrating.
+FIRMWARE_JOY_HZ = 1000.0 / 15
+FIRMWARE_P_HZ = 1000.0 / (5 * 10)
+FIRMWARE_CALIB_HZ = 1000.0 / 50
+
+FIRMWARE_DEFAULTS = {
+    "HST": -200, "NMIN": -100, "NMAX": 25, "SPT": 100, "HPT": 200,
+    "JDZ": 20, "JMT": 10, "CSP": 10, "SAD": 150,
+    "SIP_SENS": 100, "PUFF_SENS": 100,
+    "KEY_HPT": ord('f'), "KEY_SPT": ord('r'), "KEY_HST": ord('e'), "KEY_SST": ord('q'),
+    "NUM_SECTORS": 8, "PFW": 10,
+}
+STREAM_KEEPALIVE_S = 1.0  # STREAM_KEEPALIVE_MS
+STREAM_TARGETS = {"P": ("P",), "JOY": ("JOY",), "ALL": ("P", "JOY")}
+FIRMWARE_DEFAULT_JOY_KEYS = [('d', ' '), ('d', 's'), ('s', ' '), ('a', 's'), ('a', ' '), ('a', 'w'), ('w', ' '), ('w', 'd')]
+
+PRESSURE_PRESETS = {"neutral": 0, "soft_sip": -150, "hard_sip": -320, "soft_puff": 150, "hard_puff": 320}
+
+DEMO_SCRIPT = [
+    {"seconds": 2.0, "pressure": "neutral", "joy": "center"},
+    {"seconds": 1.0, "pressure": "soft_puff", "joy": {"wave": "circle", "radius": 300, "period": 2.0}},
+    {"seconds": 0.5, "pressure": "hard_puff", "joy": "center"},
+    {"seconds": 1.5, "pressure": "neutral", "joy": {"wave": "circle", "radius": 450, "period": 1.5}},
+    {"seconds": 1.0, "pressure": "soft_sip", "joy": "center"},
+    {"seconds": 0.5, "pressure": "hard_sip", "joy": [0, 400]},
+    {"seconds": 2.0, "pressure": {"wave": "sine", "amplitude": 350, "period": 2.0}, "joy": [-400, 0]},
+]
+
+
+def arduino_to_int(text):
+    """String::toInt(): leading optional sign and digits, anything else gives 0."""
+    text = text.strip()
+    end = 1 if text[:1] in "+-" else 0
+    while end < len(text) and text[end].isdigit(): end += 1
+    try: return int(text[:end])
+    except ValueError: return 0
+
+
+def _pressure_at(spec, t):
+    if isinstance(spec, (int, float)): return float(spec)
+    if isinstance(spec, str): return float(PRESSURE_PRESETS[spec])
+    wave, amplitude, period = spec.get("wave", "sine"), spec.get("amplitude", 300), spec.get("period", 1.0)
+    offset = spec.get("offset", 0)
+    phase = (t % period) / period
+    if wave == "sine": return offset + amplitude * math.sin(2 * math.pi * phase)
+    if wave == "square": return offset + (amplitude if phase < 0.5 else -amplitude)
+    if wave == "ramp": return offset + amplitude * (2 * phase - 1)
+    raise ValueError(f"Unknown pressure wave '{wave}'")
+
+
+def _joy_at(spec, t):
+    if spec == "center" or spec is None: return 0.0, 0.0
+    if isinstance(spec, (list, tuple)): return float(spec[0]), float(spec[1])
+    wave, radius, period = spec.get("wave", "circle"), spec.get("radius", 400), spec.get("period", 2.0)
+    angle = 2 * math.pi * (t % period) / period
+    if wave == "circle": return radius * math.cos(angle), radius * math.sin(angle)
+    if wave == "sweep_x": return radius * math.sin(angle), 0.0
+    if wave == "sweep_y": return 0.0, radius * math.sin(angle)
+    raise ValueError(f"Unknown joystick wave '{wave}'")
+
+
+class TelemetryStream:
+    """One STREAM setting and its state, as TelemetryStream and streamDue() in V3.ino."""
+    def __init__(self, every=1, on_change=False, delta=0):
+        self.every, self.on_change, self.delta = every, on_change, delta
+        self.count, self.last, self.last_sent = 0, None, 0.0
+
+    def due(self, a, b=0, now=None):
+        if self.every == 0: return False
+        self.count += 1
+        if self.count < self.every: return False
+        self.count = 0
+        now = time.monotonic() if now is None else now
+        if (self.on_change and self.last is not None and abs(a - self.last[0]) <= self.delta and abs(b - self.last[1]) <= self.delta
+                and now - self.last_sent < STREAM_KEEPALIVE_S): return False
+        self.last, self.last_sent = (a, b), now
+        return True
+
+
+def parse_stream_command(value):
+    """The kinds a STREAM:<value> applies to and their new (every, on_change, delta), or
+    None when the firmware would answer ERR:Bad value."""
+    target, comma, rest = value.partition(',')
+    if not comma: return None
+    mode, has_arg, arg = rest.partition(',')
+    n = arduino_to_int(arg) if has_arg else 0
+    mode = mode.upper()
+    if not has_arg and mode == "ON": setting = (1, False, 0)
+    elif not has_arg and mode == "OFF": setting = (0, False, 0)
+    elif has_arg and mode == "EVERY" and 1 <= n <= 255: setting = (n, False, 0)
+    elif has_arg and mode == "CHANGE" and 0 <= n <= 1023: setting = (1, True, n)
+    else: return None
+    kinds = STREAM_TARGETS.get(target.upper())
+    return (kinds, setting) if kinds else None
+
+
+def load_script(path):
+    """A script is a JSON list of segments, played in order and looped:
+        {"seconds": 1.5, "pressure": <spec>, "joy": <spec>}
+    pressure: a number, a preset name (neutral, soft_sip, hard_sip, soft_puff, hard_puff)
+              or {"wave": "sine"|"square"|"ramp", "amplitude": 300, "period": 1.0, "offset": 0}
+    joy:      "center", [x, y], or {"wave": "circle"|"sweep_x"|"sweep_y", "radius": 400, "period": 2.0}
+    Values are centred raw ADC counts, before the sip/puff sensitivity scaling.
+    """
+    with open(path, 'r') as f: return json.load(f)
+
+
+class VirtualController:
+    def __init__(self, script=None, joy_hz=FIRMWARE_JOY_HZ, p_hz=FIRMWARE_P_HZ, calib_hz=FIRMWARE_CALIB_HZ,
+                 noise=3.0, seed=None, link_path=None, max_backlog_bytes=4096, log=None, stamp_samples=False):
+        self.script = script or DEMO_SCRIPT
+        self.script_length = sum(seg["seconds"] for seg in self.script)
+        self.joy_period, self.p_period, self.calib_period = 1.0 / joy_hz, 1.0 / p_hz, 1.0 / calib_hz
+        self.noise = noise
+        self.rng = random.Random(seed)
+        self.link_path = link_path
+        self.max_backlog_bytes = max_backlog_bytes
+        self.log = log or (lambda msg: None)
+        # With stamp_samples the value of every P/CALIB_P sample (and the x of every JOY sample) is a rolling
+        # code instead of the waveform, and sent_at maps (kind, code) to the perf_counter() time it was written.
+        self.stamp_samples = stamp_samples
+        self.sent_at = {}
+        self._stamp_counter = 0
+
+        self.power_on()
+
+        self.master_fd = self.slave_fd = None
+        self.port = None
+        self._out = bytearray()
+        self._splitter = LineSplitter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples_sent = 0
+        self.sent_counts = {}
+        self.samples_dropped = 0
+        self.commands_received = 0
+
+    def power_on(self):
+        """Firmware state as after reset: everything the host set is gone."""
+        self.params = dict(FIRMWARE_DEFAULTS)
+        self.joy_keybinds = [(ord(a), ord(b)) for a, b in FIRMWARE_DEFAULT_JOY_KEYS] + [(0, 0)] * 8
+        self.mode = "MOUSE"
+        self.calibrating = False
+        self.streams = {"P": TelemetryStream(), "JOY": TelemetryStream()}
+        self.binary = False
+        self._seq = 0
+
+    # --- pty lifecycle ---
+    def open(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.port = os.ttyname(self.slave_fd)
+        if self.link_path:
+            if os.path.islink(self.link_path): os.remove(self.link_path)
+            os.symlink(self.port, self.link_path)
+        return self.port
+
+    def close(self):
+        self.stop()
+        if self.link_path and os.path.islink(self.link_path) and os.readlink(self.link_path) == self.port:
+            os.remove(self.link_path)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None: os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+    def start(self):
+        if self.master_fd is None: self.open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def unplug(self):
+        """Pulls the cable: the pty and its link disappear and the host's reads fail."""
+        self.close()
+        self._out.clear(); self._splitter.reset()
+
+    def replug(self, power_cycle=True):
+        """Plugs back in on a fresh pty (usually a new /dev/pts name) behind the same link."""
+        if power_cycle: self.power_on()
+        return self.start()
+
+    # --- Output ---
+    def _emit(self, data):
+        if len(self._out) + len(data) > self.max_backlog_bytes:
+            self.samples_dropped += 1  # Nobody is draining the port; drop whole records, never half a line
+            return
+        self._out += data
+
+    def println(self, text):
+        self._emit(text.encode('ascii') + b"\r\n")
+
+    def _emit_sample(self, kind, value):
+        stream = self.streams.get(kind)
+        if stream and not stream.due(*(value if kind == "JOY" else (value,))): return
+        self.samples_sent += 1
+        self.sent_counts[kind] = self.sent_counts.get(kind, 0) + 1
+        if self.stamp_samples:
+            code = self._stamp_counter % 1024 - 512; self._stamp_counter += 1
+            value = (code, value[1]) if kind == "JOY" else code
+            self.sent_at[(kind, code)] = time.perf_counter()
+        if self.binary:
+            self._emit(encode_frame(kind, value, self._seq)); self._seq = (self._seq + 1) & 0xFF
+        elif kind == "JOY": self.println(f"JOY:{value[0]},{value[1]}")
+        else: self.println(f"{kind}:{value}")
+
+    def _flush(self):
+        if not self._out: return
+        try:
+            written = os.write(self.master_fd, self._out)
+            del self._out[:written]
+        except BlockingIOError:
+            pass
+
+    # --- Signal model ---
+    def _segment_at(self, t):
+        t %= self.script_length
+        for seg in self.script:
+            if t < seg["seconds"]: return seg, t
+            t -= seg["seconds"]
+        return self.script[-1], t
+
+    def scaled_pressure(self, t):
+        seg, seg_t = self._segment_at(t)
+        raw = _pressure_at(seg.get("pressure", "neutral"), seg_t) + self.rng.gauss(0, self.noise)
+        raw = int(max(-512, min(511, raw)))
+        sens = self.params["SIP_SENS"] if raw < 0 else self.params["PUFF_SENS"]
+        return int(raw * sens / 100)  # C integer division truncates toward zero
+
+    def joystick(self, t):
+        seg, seg_t = self._segment_at(t)
+        x, y = _joy_at(seg.get("joy"), seg_t)
+        x += self.rng.gauss(0, self.noise); y += self.rng.gauss(0, self.noise)
+        return int(max(-512, min(511, x))), int(max(-512, min(511, y)))
+
+    # --- Commands (mirrors handleSerialCommands in V3.ino) ---
+    def handle_command(self, command):
+        self.commands_received += 1
+        self.log(f"<- {command}")
+        if len(command) > COMMAND_MAX_LENGTH: self.println("ERR:Line too long"); return
+        command = command.strip()
+        upper = command.upper()
+        if upper == "SET_MODE_MOUSE": self.mode = "MOUSE"; self.println("ACK:Mode set to MOUSE"); return
+        if upper == "SET_MODE_KEYBOARD": self.mode = "KEYBOARD"; self.println("ACK:Mode set to KEYBOARD"); return
+        if upper == "START_CALIBRATION": self.calibrating = True; self.println("ACK:Calibration started"); return
+        if upper == "STOP_CALIBRATION": self.calibrating = False; self.println("ACK:Calibration stopped"); return
+        if upper == "GET_CAPS": self.println(f"CAPS:{BINARY_PROTOCOL_CAP},{PROFILE_CAP},{READBACK_CAP},{PRESSURE_FILTER_CAP},{STREAM_CAP}"); return
+        if upper == "GET_ALL":
+            sectors = max(1, min(16, self.params["NUM_SECTORS"]))
+            self.println("ALL:" + encode_profile_command(self.params, self.joy_keybinds[:sectors]).split(':', 1)[1]); return
+
+        if ':' not in command:
+            if command: self.println(f"ERR:Unknown command {command}")
+            return
+        key, val_str = command.split(':', 1)
+        key = key.upper()
+        if key == "SET_JOY_KEY":
+            parts = val_str.split(',')
+            if len(parts) >= 3:
+                index = arduino_to_int(parts[0])
+                if 0 <= index < 16:
+                    self.joy_keybinds[index] = (arduino_to_int(parts[1]) & 0xFF, arduino_to_int(','.join(parts[2:])) & 0xFF)
+                    self.println(f"ACK:{command}"); return
+            self.println(f"ERR:Bad value {command}"); return
+        if key == "SET_PROFILE":
+            checksum = val_str.rpartition('*')[2][:4].upper()
+            try: values, joy_keys = decode_profile_payload(val_str)
+            except ValueError as e:
+                self.println(f"ERR:Bad {e} SET_PROFILE:{checksum}"); return
+            self.params.update(values)
+            for i, pair in enumerate(joy_keys): self.joy_keybinds[i] = pair
+            self.println(f"ACK:SET_PROFILE:{checksum}"); return
+        if key == "SET_PROTOCOL":
+            if val_str.upper() == "BIN": self.println("ACK:Protocol BIN"); self.binary = True
+            elif val_str.upper() == "TEXT": self.binary = False; self.println("ACK:Protocol TEXT")
+            else: self.println(f"ERR:Bad value {command}")
+            return
+        if key == "STREAM":
+            parsed = parse_stream_command(val_str)
+            if parsed is None: self.println(f"ERR:Bad value {command}"); return
+            kinds, setting = parsed
+            for kind in kinds: self.streams[kind] = TelemetryStream(*setting)
+            self.println(f"ACK:{command}"); return
+        if key == "SET_PFW" and not 1 <= arduino_to_int(val_str) <= 32:
+            self.println(f"ERR:Bad value {command}"); return
+        param = key[4:] if key.startswith("SET_") else None
+        if param not in self.params:
+            self.println(f"ERR:Unknown command {command}"); return
+        value = arduino_to_int(val_str)
+        self.params[param] = value & 0xFF if param.startswith("KEY_") else value
+        self.println(f"ACK:{command}")
+
+    def _read_commands(self):
+        try: data = os.read(self.master_fd, 4096)
+        except (BlockingIOError, OSError): return
+        for line in self._splitter.feed(data): self.handle_command(line)
+
+    # --- Main loop ---
+    def run(self, duration=None):
+        start = time.monotonic()
+        next_joy = next_p = next_calib = start
+        # Boot banner, as printed at the end of setup()
+        self.println("INFO:Calibrated Pressure Center: 512")
+        self.println("INFO:Controller Ready. Default Mode: Mouse")
+        max_catch_up = 1000  # Samples per stream per wake-up, so a stall cannot turn into an unbounded burst
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if duration is not None and now - start >= duration: break
+            t = now - start
+            if self.calibrating:
+                n = 0
+                while next_calib <= now and n < max_catch_up:
+                    self._emit_sample("CALIB_P", self.scaled_pressure(t)); next_calib += self.calib_period; n += 1
+                next_joy = next_p = now
+                next_due = next_calib
+            else:
+                n = 0
+                while next_joy <= now and n < max_catch_up:
+                    self._emit_sample("JOY", self.joystick(t)); next_joy += self.joy_period; n += 1
+                n = 0
+                while next_p <= now and n < max_catch_up:
+                    self._emit_sample("P", self.scaled_pressure(t)); next_p += self.p_period; n += 1
+                next_calib = now
+                next_due = min(next_joy, next_p)
+            if next_due < now: next_due = now  # Fell behind the catch-up cap; skip ahead
+            self._flush()
+            wait = max(0.0, next_due - time.monotonic())
+            readable, writable, _ = select.select([self.master_fd], [self.master_fd] if self._out else [], [], wait)
+            if readable: self._read_commands()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual Mouth-Operated Mouse controller on a pseudo-terminal.")
+    parser.add_argument("--script", help="JSON waveform script (see load_script()). Default: built-in demo.")
+    parser.add_argument("--joy-hz", type=float, default=FIRMWARE_JOY_HZ)
+    parser.add_argument("--p-hz", type=float, default=FIRMWARE_P_HZ)
+    parser.add_argument("--calib-hz", type=float, default=FIRMWARE_CALIB_HZ)
+    parser.add_argument("--firehose", type=float, nargs="?", const=100.0, default=None, metavar="FACTOR",
+                        help="Multiply all telemetry rates (default factor 100).")
+    parser.add_argument("--noise", type=float, default=3.0, help="Gaussian noise (ADC counts) on every sample.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--link", default=VIRTUAL_PORT_LINK, help="Symlink to the pty that the app lists as a port.")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds.")
+    parser.add_argument("--quiet", action="store_true", help="Do not log received commands.")
+    parser.add_argument("--hiccup", type=float, nargs=2, default=None, metavar=("EVERY", "OUTAGE"),
+                        help="Unplug the port every EVERY seconds for OUTAGE seconds (power-cycling the board), "
+                             "to exercise the app's automatic reconnect.")
+    args = parser.parse_args()
+
+    factor = args.firehose or 1.0
+    script = load_script(args.script) if args.script else None
+    device = VirtualController(script=script, joy_hz=args.joy_hz * factor, p_hz=args.p_hz * factor,
+                               calib_hz=args.calib_hz * factor, noise=args.noise, seed=args.seed, link_path=args.link,
+                               log=None if args.quiet else print)
+    port = device.open()
+    print(f"Virtual controller on {port}" + (f" (linked as {args.link})" if args.link else ""))
+    try:
+        if args.hiccup:
+            every, outage = args.hiccup
+            end = None if args.duration is None else time.monotonic() + args.duration
+            device.start()
+            while end is None or time.monotonic() < end:
+                time.sleep(every)
+                device.unplug(); print(f"Unplugged for {outage:.1f} s")
+                time.sleep(outage)
+                print(f"Plugged back in on {device.replug()}")
+        else:
+            device.run(duration=args.duration)
+    except KeyboardInterrupt: pass
+    finally:
+        device.close()
+        print(f"Generated {device.samples_sent} samples ({device.samples_dropped} dropped while nobody was reading), "
+              f"received {device.commands_received} commands.")
+
+
+if __name__ == "__main__":
+    main()